@@ -1,24 +1,80 @@
 from __future__ import annotations
 
+import asyncio
+import multiprocessing
+import os
 from pathlib import Path
 
 from . import converter
 
+DEFAULT_PANDOC_HEAP_MB = converter.DEFAULT_PANDOC_HEAP_MB
+DEFAULT_PANDOC_STACK_MB = converter.DEFAULT_PANDOC_STACK_MB
+
 
 def _append_reference_doc_arg(extra_args, reference_doc: Path | None):
-    args = list(extra_args or [])
     if reference_doc is None:
-        return args
-    args.extend(["--reference-doc", str(reference_doc)])
-    return args
+        return extra_args or ()
+    return (*(extra_args or ()), "--reference-doc", converter.resolve_reference_doc(reference_doc))
+
+
+def _pandoc_args(pandoc_extra_args, heap_mb: int | None, stack_mb: int | None, reference_doc: Path | None = None):
+    # Every entry point builds its pandoc arguments here, so the RTS caps apply uniformly.
+    return tuple(
+        converter.with_pandoc_rts_limits(
+            tuple(_append_reference_doc_arg(pandoc_extra_args, reference_doc)), heap_mb, stack_mb
+        )
+    )
 
 
-def run_auto(input_path: Path, output_path: Path | None = None, pandoc_extra_args=None):
-    return converter.run_conversion("auto", input_path, output_path, list(pandoc_extra_args or []))
+def _convert(
+    mode: str,
+    input_path: Path,
+    output_path: Path | None,
+    args,
+    timeout: float | None,
+    use_server: bool,
+    use_cache: bool,
+):
+    # Only non-default options are forwarded. With use_server, the conversion's text-only
+    # passes go to a shared `pandoc server`, falling back to one pandoc process per pass.
+    options = {}
+    if timeout is not None:
+        options["timeout"] = timeout
+    if use_server:
+        options["use_server"] = True
+    if use_cache:
+        options["use_cache"] = True
+    return converter.run_conversion(mode, input_path, output_path, args, **options)
+
+
+def run_auto(
+    input_path: Path,
+    output_path: Path | None = None,
+    pandoc_extra_args=None,
+    use_server: bool = False,
+    use_cache: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    # The converter resolves the mode from the suffix (raising its usual error for unknown
+    # ones); only auto mode copies same-format output such as `dmc notes.md -o copy.md`.
+    args = _pandoc_args(pandoc_extra_args, heap_mb, stack_mb)
+    return _convert("auto", input_path, output_path, args, timeout, use_server, use_cache)
 
 
-def run_docx2md(input_path: Path, output_path: Path | None = None, pandoc_extra_args=None):
-    return converter.run_conversion("docx2md", input_path, output_path, list(pandoc_extra_args or []))
+def run_docx2md(
+    input_path: Path,
+    output_path: Path | None = None,
+    pandoc_extra_args=None,
+    use_server: bool = False,
+    use_cache: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    args = _pandoc_args(pandoc_extra_args, heap_mb, stack_mb)
+    return _convert("docx2md", input_path, output_path, args, timeout, use_server, use_cache)
 
 
 def run_md2docx(
@@ -26,6 +82,213 @@ def run_md2docx(
     output_path: Path | None = None,
     reference_doc: Path | None = None,
     pandoc_extra_args=None,
+    use_server: bool = False,
+    use_cache: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    args = _pandoc_args(pandoc_extra_args, heap_mb, stack_mb, reference_doc)
+    return _convert("md2docx", input_path, output_path, args, timeout, use_server, use_cache)
+
+
+def _batch_tasks(
+    mode: str,
+    input_paths,
+    output_dir: Path | None,
+    reference_doc: Path | None,
+    pandoc_extra_args,
+    use_server: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    base_args = _pandoc_args(pandoc_extra_args, heap_mb, stack_mb)
+    md2docx_args = _pandoc_args(pandoc_extra_args, heap_mb, stack_mb, reference_doc)
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    tasks = []
+    input_by_output = {}
+    for raw_path in input_paths:
+        input_path = Path(raw_path)
+        resolved_mode = converter.detect_mode_from_path(input_path) if mode == "auto" else mode
+        suffix = ".docx" if resolved_mode == "md2docx" else ".md"
+        output_path = None if output_dir is None else output_dir / f"{input_path.stem}{suffix}"
+        # Parallel workers writing one path would silently overwrite each other.
+        target = os.path.abspath(output_path or converter.default_out_path(input_path, suffix))
+        if target in input_by_output:
+            raise ValueError(
+                f"batch inputs {input_by_output[target]} and {input_path} both write {target}"
+            )
+        input_by_output[target] = input_path
+        args = md2docx_args if resolved_mode == "md2docx" else base_args
+        # Positional to match converter.run_conversion(mode, input, output, args, timeout, use_server).
+        tasks.append((resolved_mode, input_path, output_path, args, timeout, use_server))
+    return tasks
+
+
+def _run_batch_task(task):
+    return converter.run_conversion(*task)
+
+
+def _batch_pool_size(processes: int | None, task_count: int) -> int:
+    return max(1, min(processes or os.cpu_count() or 1, task_count))
+
+
+def _batch_pool(processes: int | None, tasks, use_server: bool):
+    # Workers share one server owned by this process instead of spawning pandoc per pass.
+    # Every task carries the same RTS block, so one server (started with it) serves them all.
+    rts_args = tuple(converter.pandoc_rts_args(tasks[0][3]))
+    url = converter.pandoc_server_url(rts_args) if use_server and converter.enable_pandoc_server(rts_args) else None
+    if url is None:
+        return multiprocessing.Pool(_batch_pool_size(processes, len(tasks)))
+    return multiprocessing.Pool(
+        _batch_pool_size(processes, len(tasks)),
+        initializer=converter.attach_pandoc_server,
+        initargs=(url, rts_args),
+    )
+
+
+def run_batch(
+    mode: str,
+    input_paths,
+    output_dir: Path | None = None,
+    reference_doc: Path | None = None,
+    pandoc_extra_args=None,
+    processes: int | None = None,
+    use_server: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    """Convert many files in parallel worker processes; results follow input order.
+
+    Raises ValueError before any work starts when two inputs map to the same output path.
+    The first failing conversion propagates and the results of the others are discarded.
+    """
+    tasks = _batch_tasks(
+        mode, input_paths, output_dir, reference_doc, pandoc_extra_args, use_server, heap_mb, stack_mb, timeout
+    )
+    if not tasks:
+        return []
+    with _batch_pool(processes, tasks, use_server) as pool:
+        return pool.starmap(converter.run_conversion, tasks)
+
+
+def iter_batch(
+    mode: str,
+    input_paths,
+    output_dir: Path | None = None,
+    reference_doc: Path | None = None,
+    pandoc_extra_args=None,
+    processes: int | None = None,
+    use_server: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    """Like run_batch, but yield (input_path, result) pairs as conversions finish in order.
+
+    A failing conversion raises when its turn comes; pairs yielded before it stand.
+    """
+    tasks = _batch_tasks(
+        mode, input_paths, output_dir, reference_doc, pandoc_extra_args, use_server, heap_mb, stack_mb, timeout
+    )
+    if not tasks:
+        return
+    with _batch_pool(processes, tasks, use_server) as pool:
+        for task, result in zip(tasks, pool.imap(_run_batch_task, tasks)):
+            yield task[1], result
+
+
+async def run_conversion_async(
+    mode: str,
+    input_path: Path,
+    output_path: Path | None = None,
+    pandoc_extra_args=None,
+    use_server: bool = False,
+    use_cache: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    # Conversions chain several pandoc subprocesses plus XML post-processing, so the
+    # whole pipeline runs on a worker thread; pandoc waits release the GIL.
+    args = _pandoc_args(pandoc_extra_args, heap_mb, stack_mb)
+    return await asyncio.to_thread(_convert, mode, input_path, output_path, args, timeout, use_server, use_cache)
+
+
+async def run_auto_async(
+    input_path: Path,
+    output_path: Path | None = None,
+    pandoc_extra_args=None,
+    use_server: bool = False,
+    use_cache: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    return await run_conversion_async(
+        "auto", input_path, output_path, pandoc_extra_args, use_server, use_cache, heap_mb, stack_mb, timeout
+    )
+
+
+async def run_docx2md_async(
+    input_path: Path,
+    output_path: Path | None = None,
+    pandoc_extra_args=None,
+    use_server: bool = False,
+    use_cache: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    return await run_conversion_async(
+        "docx2md", input_path, output_path, pandoc_extra_args, use_server, use_cache, heap_mb, stack_mb, timeout
+    )
+
+
+async def run_md2docx_async(
+    input_path: Path,
+    output_path: Path | None = None,
+    reference_doc: Path | None = None,
+    pandoc_extra_args=None,
+    use_server: bool = False,
+    use_cache: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
 ):
     args = _append_reference_doc_arg(pandoc_extra_args, reference_doc)
-    return converter.run_conversion("md2docx", input_path, output_path, args)
+    return await run_conversion_async(
+        "md2docx", input_path, output_path, args, use_server, use_cache, heap_mb, stack_mb, timeout
+    )
+
+
+async def run_many(
+    mode: str,
+    input_paths,
+    output_dir: Path | None = None,
+    reference_doc: Path | None = None,
+    pandoc_extra_args=None,
+    concurrency: int | None = None,
+    use_server: bool = False,
+    heap_mb: int | None = DEFAULT_PANDOC_HEAP_MB,
+    stack_mb: int | None = DEFAULT_PANDOC_STACK_MB,
+    timeout: float | None = None,
+):
+    """Await many conversions on one event loop, at most `concurrency` at a time.
+
+    Like run_batch, colliding output paths raise up front and the first failure propagates.
+    """
+    tasks = _batch_tasks(
+        mode, input_paths, output_dir, reference_doc, pandoc_extra_args, use_server, heap_mb, stack_mb, timeout
+    )
+    limit = asyncio.Semaphore(_batch_pool_size(concurrency, len(tasks)))
+
+    async def run_limited(task):
+        async with limit:
+            return await asyncio.to_thread(converter.run_conversion, *task)
+
+    return list(await asyncio.gather(*(run_limited(task) for task in tasks)))
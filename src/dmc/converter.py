@@ -1,17 +1,36 @@
 import sys
 
 import argparse
+import atexit
+import bisect
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
 import json
 import os
 import re
 import shutil
+import socket
 import subprocess
 import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
 import zipfile
 import zlib
 import xml.etree.ElementTree as ET
 from pathlib import Path
 
+from .version import __version__
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
 W14_NS = "http://schemas.microsoft.com/office/word/2010/wordml"
 W15_NS = "http://schemas.microsoft.com/office/word/2012/wordml"
@@ -35,6 +54,70 @@ COMMENTS_EXT_PART_NAME = "/word/commentsExtended.xml"
 COMMENTS_IDS_PART_NAME = "/word/commentsIds.xml"
 COMMENTS_EXTENSIBLE_PART_NAME = "/word/commentsExtensible.xml"
 PEOPLE_PART_NAME = "/word/people.xml"
+# Parts written next to comments.xml, in the order their relationships and overrides are added.
+COMMENT_SIDE_PART_RELATIONSHIPS = (
+    (COMMENTS_EXT_REL_TYPE, "commentsExtended.xml"),
+    (COMMENTS_IDS_REL_TYPE, "commentsIds.xml"),
+    (COMMENTS_EXTENSIBLE_REL_TYPE, "commentsExtensible.xml"),
+    (PEOPLE_REL_TYPE, "people.xml"),
+)
+COMMENT_SIDE_PART_CONTENT_TYPES = (
+    (COMMENTS_EXT_PART_NAME, COMMENTS_EXT_CONTENT_TYPE),
+    (COMMENTS_IDS_PART_NAME, COMMENTS_IDS_CONTENT_TYPE),
+    (COMMENTS_EXTENSIBLE_PART_NAME, COMMENTS_EXTENSIBLE_CONTENT_TYPE),
+    (PEOPLE_PART_NAME, PEOPLE_CONTENT_TYPE),
+)
+# Clark-notation names for the attributes read on every comment and marker.
+W_ID_ATTR = f"{{{W_NS}}}id"
+W_AUTHOR_ATTR = f"{{{W_NS}}}author"
+W_DATE_ATTR = f"{{{W_NS}}}date"
+W_INITIALS_ATTR = f"{{{W_NS}}}initials"
+W14_PARA_ID_ATTR = f"{{{W14_NS}}}paraId"
+W15_PARA_ID_ATTR = f"{{{W15_NS}}}paraId"
+W15_PARA_ID_PARENT_ATTR = f"{{{W15_NS}}}paraIdParent"
+W15_DONE_ATTR = f"{{{W15_NS}}}done"
+W16CID_PARA_ID_ATTR = f"{{{W16CID_NS}}}paraId"
+W16CID_DURABLE_ID_ATTR = f"{{{W16CID_NS}}}durableId"
+# Clark-notation tags for the comments and paragraphs rebuilt on every write.
+W_COMMENT_TAG = f"{{{W_NS}}}comment"
+W_P_TAG = f"{{{W_NS}}}p"
+W_PPR_TAG = f"{{{W_NS}}}pPr"
+W_PSTYLE_TAG = f"{{{W_NS}}}pStyle"
+W_R_TAG = f"{{{W_NS}}}r"
+W_RPR_TAG = f"{{{W_NS}}}rPr"
+W_RSTYLE_TAG = f"{{{W_NS}}}rStyle"
+W_T_TAG = f"{{{W_NS}}}t"
+W_TAB_TAG = f"{{{W_NS}}}tab"
+W_BR_TAG = f"{{{W_NS}}}br"
+W_CR_TAG = f"{{{W_NS}}}cr"
+W_ANNOTATION_REF_TAG = f"{{{W_NS}}}annotationRef"
+W_VAL_ATTR = f"{{{W_NS}}}val"
+XML_SPACE_ATTR = f"{{{XML_NS}}}space"
+# Text each comment-body element contributes ("" = its own text, None = nothing). Tags outside
+# the preset are resolved by local name on first sight and remembered.
+COMMENT_TEXT_PIECE_BY_NAME = {"t": "", "tab": "\t", "br": "\n", "cr": "\n"}
+COMMENT_TEXT_PIECE_BY_TAG = {W_T_TAG: "", W_TAB_TAG: "\t", W_BR_TAG: "\n", W_CR_TAG: "\n"}
+# Clark-notation names for the comment side parts, people.xml and settings.xml.
+W_COMMENTS_TAG = f"{{{W_NS}}}comments"
+W_COMPAT_TAG = f"{{{W_NS}}}compat"
+W_COMPAT_SETTING_TAG = f"{{{W_NS}}}compatSetting"
+W_NAME_ATTR = f"{{{W_NS}}}name"
+W_URI_ATTR = f"{{{W_NS}}}uri"
+W15_PEOPLE_TAG = f"{{{W15_NS}}}people"
+W15_PERSON_TAG = f"{{{W15_NS}}}person"
+W15_PRESENCE_INFO_TAG = f"{{{W15_NS}}}presenceInfo"
+W15_AUTHOR_ATTR = f"{{{W15_NS}}}author"
+W15_PROVIDER_ID_ATTR = f"{{{W15_NS}}}providerId"
+W15_USER_ID_ATTR = f"{{{W15_NS}}}userId"
+W15_COMMENTS_EX_TAG = f"{{{W15_NS}}}commentsEx"
+W15_COMMENT_EX_TAG = f"{{{W15_NS}}}commentEx"
+W16CID_COMMENTS_IDS_TAG = f"{{{W16CID_NS}}}commentsIds"
+W16CID_COMMENT_ID_TAG = f"{{{W16CID_NS}}}commentId"
+W16CEX_COMMENTS_EXTENSIBLE_TAG = f"{{{W16CEX_NS}}}commentsExtensible"
+W16CEX_COMMENT_EXTENSIBLE_TAG = f"{{{W16CEX_NS}}}commentExtensible"
+W16CEX_DURABLE_ID_ATTR = f"{{{W16CEX_NS}}}durableId"
+W16CEX_DATE_UTC_ATTR = f"{{{W16CEX_NS}}}dateUtc"
+MC_IGNORABLE_ATTR = f"{{{MC_NS}}}Ignorable"
 
 ET.register_namespace("w", W_NS)
 ET.register_namespace("w14", W14_NS)
@@ -42,12 +125,12 @@ ET.register_namespace("w15", W15_NS)
 ET.register_namespace("w16cex", W16CEX_NS)
 ET.register_namespace("w16cid", W16CID_NS)
 ET.register_namespace("mc", MC_NS)
-COMMENT_START_ATTR_BLOCK_RE = re.compile(r"\{\.comment-start(?P<attrs>[^}]*)\}", re.DOTALL)
-COMMENT_END_ATTR_BLOCK_RE = re.compile(r"\{\.comment-end(?P<attrs>[^}]*)\}", re.DOTALL)
+COMMENT_START_ATTR_BLOCK_RE = re.compile(r"\{\.comment-start(?P<attrs>[^}]*)\}")
+COMMENT_END_ATTR_BLOCK_RE = re.compile(r"\{\.comment-end(?P<attrs>[^}]*)\}")
 NESTED_COMMENT_END_WRAPPER_RE = re.compile(
-    r"\[(?P<inner>(?:\s*\[\]\{\.comment-end[^}]*\}\s*)+)\]\{\.comment-end(?P<attrs>[^}]*)\}",
-    re.DOTALL,
+    r"\[(?P<inner>(?:\s*\[\]\{\.comment-end[^}]*\}\s*)+)\]\{\.comment-end(?P<attrs>[^}]*)\}"
 )
+COMMENT_TRANSPORT_ATTR_RE = re.compile(r'\s+(?:paraId|durableId|presenceProvider|presenceUserId)="[^"]*"')
 KV_ATTR_RE = re.compile(r'([A-Za-z_:][-A-Za-z0-9_:.]*)="([^"]*)"')
 CARD_META_INLINE_RE = re.compile(
     r"<!--\s*CARD_META\s*\{\s*#(?P<id>[A-Za-z0-9][A-Za-z0-9_-]*)\s*(?P<attrs>.*?)\}\s*-->",
@@ -58,30 +141,125 @@ CARD_HEADER_RE = re.compile(
     re.IGNORECASE,
 )
 MILESTONE_TOKEN_RE = re.compile(
-    r"(?:(?P<markeq>==)\s*)?"
-    r"(?:/{3}\s*C(?P<id3c>[0-9][A-Za-z0-9_-]*)\s*\.\s*(?P<edge3c>[sSeE]|[Ss][Tt][Aa][Rr][Tt]|[Ee][Nn][Dd])\s*/{3}"
-    r"|/{3}\s*(?P<id3>[A-Za-z0-9][A-Za-z0-9_-]*)\s*\.\s*(?P<edge3>[sSeE]|[Ss][Tt][Aa][Rr][Tt]|[Ee][Nn][Dd])\s*/{3})"
-    r"(?(markeq)\s*==)"
-)
-MILESTONE_CORE_TOKEN_RE = re.compile(
-    r"(?:/{3}\s*C(?P<id3c>[0-9][A-Za-z0-9_-]*)\s*\.\s*(?P<edge3c>[sSeE]|[Ss][Tt][Aa][Rr][Tt]|[Ee][Nn][Dd])\s*/{3})"
-    r"|(?:/{3}\s*(?P<id3>[A-Za-z0-9][A-Za-z0-9_-]*)\s*\.\s*(?P<edge3>[sSeE]|[Ss][Tt][Aa][Rr][Tt]|[Ee][Nn][Dd])\s*/{3})"
+    r"/{3}\s*(?P<id>[A-Za-z0-9][A-Za-z0-9_-]*)\s*\.\s*(?P<edge>[sSeE]|[Ss][Tt][Aa][Rr][Tt]|[Ee][Nn][Dd])\s*/{3}"
 )
+MILESTONE_RIGHT_WRAPPER_RE = re.compile(r"[ \t]*==")
+# Substrings at least one of which appears in any markdown carrying comment spans, milestones
+# or cards (pandoc unescapes `\/` and `\!`); text without them can skip the AST passes.
+COMMENT_TRANSPORT_HINTS = ("///", "\\/", "[!", "[\\!", "CARD_META", "comment-")
 INLINE_IMAGE_RE = re.compile(
-    r'!\[(?P<alt>[^\]]*)\]\((?P<src>[^)\s]+)(?:\s+"(?P<title>[^"]*)")?\)\{(?P<attrs>[^}]*)\}',
-    re.DOTALL,
+    r'!\[(?P<alt>[^\]]*)\]\((?P<src>[^)\s]+)(?:\s+"(?P<title>[^"]*)")?\)\{(?P<attrs>[^}]*)\}'
+)
+IMAGE_LINK_RE = re.compile(r'!\[[^\]]*\]\((?P<src>[^)\s]+)(?:\s+"[^"]*")?\)')
+# Other places markdown names a file pandoc embeds: reference definitions and raw <img>.
+LINK_REFERENCE_DEF_RE = re.compile(r'^[ ]{0,3}\[[^\]]+\]:[ \t]*<?(?P<src>[^\s>]+)', re.MULTILINE)
+HTML_IMG_SRC_RE = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']?(?P<src>[^"\'\s>]+)', re.IGNORECASE)
+# Blank quote line after a callout header (before CARD_META) or after CARD_META (before the body).
+CARD_LAYOUT_GAP_RE = re.compile(
+    r"(?:(^>+\s*\[!(?:COMMENT|REPLY)[^\n]*\])\n>+[ \t]*\n(?=>+[ \t]*<!--CARD_META)"
+    r"|(^>+[ \t]*<!--CARD_META\{#[^\n]*\}-->)\n>+[ \t]*\n(?=>+[ \t]*\S))",
+    re.MULTILINE,
+)
+COMMENT_HARD_BREAK_RE = re.compile(r"\\+[ \t]*\n")
+COMMENT_WRAPPED_BREAK_RE = re.compile(r"\\\\[ \t]+")
+COMMENT_DASH_LINE_RE = re.compile(r"(?m)^[\u2014\u2015]\s*$")
+SMART_QUOTE_TABLE = str.maketrans({"\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"'})
+TRAILING_LINE_SPACE_RE = re.compile(r"[ \t]+\n")
+BLANK_LINE_RUN_RE = re.compile(r"\n{3,}")
+LENGTH_VALUE_RE = re.compile(r"^\s*([0-9]*\.?[0-9]+(?:e[-+]?[0-9]+)?)\s*([a-zA-Z]*)\s*$")
+PLACEHOLDER_IMAGE_NAME_RE = re.compile(r"^image[0-9]+\.(png|jpg|jpeg|gif|bmp|emf|wmf|svg)$")
+RELATIONSHIP_ID_RE = re.compile(r"^rId([0-9]+)$")
+# Anchors that span lines or contain a rule cannot be restored as inline span text.
+CARD_ANCHOR_REJECT_RE = re.compile(r"[\n\r]|---")
+CARD_META_KEYS = (
+    "author",
+    "date",
+    "parent",
+    "state",
+    "paraId",
+    "durableId",
+    "presenceProvider",
+    "presenceUserId",
 )
-IMAGE_LINK_RE = re.compile(r'!\[[^\]]*\]\((?P<src>[^)\s]+)(?:\s+"[^"]*")?\)', re.DOTALL)
+CARD_FIELD_KEYS = CARD_META_KEYS + ("anchor",)
+# One reusable encoder: json.dumps builds a new one per call whenever options are passed.
+# Compact separators also shrink the AST that is piped to pandoc, and Pandoc ASTs are
+# trees, so the per-container cycle bookkeeping is skipped.
+JSON_TEXT_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False)
+# Pandoc ASTs are parsed with orjson when it happens to be installed; it is not a dependency.
+PANDOC_JSON_LOADS = json.loads if orjson is None else orjson.loads
+# Inline formatting wrappers whose content is a plain inline list.
+INLINE_CONTAINER_TYPES = frozenset({"Emph", "Strong", "Strikeout", "Superscript", "Subscript", "SmallCaps", "Underline"})
+PARA_BLOCK_TYPES = frozenset({"Para", "Plain"})
+LIST_BLOCK_TYPES = frozenset({"BulletList", "OrderedList"})
+# Inline nodes that carry plain running text.
+PANDOC_TEXT_NODE_TYPES = frozenset({"Str", "Space", "SoftBreak", "LineBreak"})
+# Node types that can never contain a comment span.
+PANDOC_LEAF_TYPES = frozenset(
+    {"Str", "Space", "SoftBreak", "LineBreak", "Code", "Math", "RawInline", "CodeBlock", "RawBlock", "HorizontalRule"}
+)
+# Exact-match fast paths for the spellings that dominate real documents.
+STATE_TOKENS = {
+    None: "active",
+    "": "active",
+    "active": "active",
+    "Active": "active",
+    "ACTIVE": "active",
+    "resolved": "resolved",
+    "Resolved": "resolved",
+    "RESOLVED": "resolved",
+}
+MILESTONE_EDGE_TOKENS = {
+    None: "",
+    "": "",
+    "s": "s",
+    "S": "s",
+    "start": "s",
+    "Start": "s",
+    "START": "s",
+    "e": "e",
+    "E": "e",
+    "end": "e",
+    "End": "e",
+    "END": "e",
+}
+# Already-compressed media and fonts gain nothing from another deflate pass.
+STORED_PART_SUFFIXES = {
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".webp",
+    ".mp4",
+    ".mp3",
+    ".ttf",
+    ".otf",
+    ".woff",
+    ".woff2",
+}
 MIN_PANDOC_VERSION = (2, 14)
+# Bound pandoc's Haskell heap so one pathological input cannot exhaust memory. The stack
+# is left uncapped by default (pandoc only recommends -M); deeply nested documents need it.
+DEFAULT_PANDOC_HEAP_MB = 512
+DEFAULT_PANDOC_STACK_MB = None
+# Per-conversion pandoc subprocess timeout in seconds; set by run_conversion.
+PANDOC_TIMEOUT = contextvars.ContextVar("pandoc_timeout", default=None)
+# Pandoc server for the current conversion's text-only passes; set by run_conversion(use_server=True).
+PANDOC_SERVER = contextvars.ContextVar("pandoc_server", default=None)
 
 
+@functools.lru_cache(maxsize=512)
 def local_name(tag: str) -> str:
-    if "}" in tag:
-        return tag.rsplit("}", 1)[1]
-    return tag
+    # A DOCX uses a few dozen distinct tags, so nearly every call is a cache hit.
+    return tag.rpartition("}")[2]
 
 
-def get_attr_local(elem: ET.Element, attr_name: str):
+def get_attr_local(elem: ET.Element, attr_name: str, qualified_name=None):
+    # Qualified lookup is a single dict hit; keep the scan for unexpected prefixes.
+    if qualified_name is not None:
+        value = elem.get(qualified_name)
+        if value is not None:
+            return value
     for key, value in elem.attrib.items():
         if key == attr_name or key.endswith("}" + attr_name):
             return value
@@ -94,33 +272,294 @@ def read_xml(xml_path: Path):
 
 
 def write_xml(tree: ET.ElementTree, xml_path: Path):
-    tree.write(xml_path, encoding="utf-8", xml_declaration=True)
-
+    # Serialize in memory and write the part in one call instead of one write per fragment.
+    data = ET.tostring(tree.getroot(), encoding="utf-8", xml_declaration=True)
+    with open(xml_path, "wb") as fh:
+        fh.write(data)
+
+
+class DocxXmlCache:
+    """Parsed XML parts of one unpacked DOCX, shared by the post-processing passes.
+
+    Each part is parsed on first load; edited parts are marked dirty and written
+    back once by flush(), so later passes see earlier edits without a re-parse.
+    """
+
+    def __init__(self, docx_dir: Path):
+        self.docx_dir = docx_dir
+        self._parsed = {}
+        self._dirty = {}
+        self._story_paths = None
+
+    def load(self, xml_path: Path):
+        parsed = self._parsed.get(xml_path)
+        if parsed is None:
+            parsed = self._parsed[xml_path] = read_xml(xml_path)
+        return parsed
+
+    def mark_dirty(self, xml_path: Path):
+        self._dirty[xml_path] = self._parsed[xml_path][0]
+
+    def story_paths(self):
+        if self._story_paths is None:
+            self._story_paths = word_story_xml_candidates(self.docx_dir)
+        return self._story_paths
+
+    def flush(self):
+        dirty, self._dirty = self._dirty, {}
+        for xml_path, tree in dirty.items():
+            write_xml(tree, xml_path)
+        return len(dirty)
 
-def extract_docx(docx_path: Path, target_dir: Path):
-    with zipfile.ZipFile(docx_path, "r") as zf:
-        zf.extractall(target_dir)
 
+def is_docx_xml_part(name: str) -> bool:
+    return name.endswith((".xml", ".rels"))
 
-def pack_docx(source_dir: Path, output_docx: Path):
-    with zipfile.ZipFile(output_docx, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for root, _, files in os.walk(source_dir):
-            for filename in sorted(files):
-                full_path = Path(root) / filename
-                arcname = full_path.relative_to(source_dir).as_posix()
-                zf.write(full_path, arcname)
 
+def extract_docx(docx_path: Path, target_dir: Path, member_filter=None):
+    # With member_filter, only matching parts are written out; the names left packed are
+    # returned so pack_docx can re-compress them from the original package, skipping disk.
+    with zipfile.ZipFile(docx_path, "r") as zf:
+        if member_filter is None:
+            zf.extractall(target_dir)
+            return []
+        names = zf.namelist()
+        zf.extractall(target_dir, members=[name for name in names if member_filter(name)])
+        return [name for name in names if not member_filter(name) and not name.endswith("/")]
+
+
+def docx_part_compress_type(name: str):
+    if Path(name).suffix.lower() in STORED_PART_SUFFIXES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def read_docx_part(full_path: Path, arcname: str):
+    # Parts are small enough to deflate in one call instead of 8 KiB streamed chunks.
+    info = zipfile.ZipInfo.from_file(full_path, arcname)
+    info.compress_type = docx_part_compress_type(arcname)
+    return info, full_path.read_bytes()
+
+
+def pack_docx(source_dir: Path, output_docx: Path, base_docx: Path | None = None, passthrough_names=()):
+    disk_parts = {}
+    for root, _, files in os.walk(source_dir):
+        for filename in sorted(files):
+            full_path = Path(root) / filename
+            disk_parts[full_path.relative_to(source_dir).as_posix()] = full_path
+    passthrough = set(passthrough_names or ())
+    # Follow the base package's entry order when there is one; new parts go last.
+    plan = []
+    if base_docx is not None:
+        with zipfile.ZipFile(base_docx, "r") as base:
+            for name in base.namelist():
+                if name in passthrough:
+                    plan.append((name, None))
+                elif name in disk_parts:
+                    plan.append((name, disk_parts.pop(name)))
+    plan.extend(disk_parts.items())
 
-def run_pandoc(in_path: Path, out_path: Path, fmt_from=None, fmt_to=None, extra_args=None, cwd=None):
-    cmd = ["pandoc", str(in_path)]
+    with zipfile.ZipFile(output_docx, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # ZipFile cannot append pre-compressed members, so deflate stays on this thread
+        # while workers read the following parts ahead of it.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            pending = [
+                pool.submit(read_docx_part, full_path, name) if full_path is not None else None
+                for name, full_path in plan
+            ]
+            base = zipfile.ZipFile(base_docx, "r") if passthrough else None
+            try:
+                for (name, _), future in zip(plan, pending):
+                    if future is not None:
+                        zf.writestr(*future.result())
+                        continue
+                    # zipfile has no public raw-copy API: passthrough parts are inflated and
+                    # re-compressed here, which only saves the round-trip through disk.
+                    base_info = base.getinfo(name)
+                    info = zipfile.ZipInfo(name, base_info.date_time)
+                    info.external_attr = base_info.external_attr
+                    info.compress_type = docx_part_compress_type(name)
+                    zf.writestr(info, base.read(base_info))
+            finally:
+                if base is not None:
+                    base.close()
+
+
+def run_pandoc(in_path: Path, out_path: Path, fmt_from=None, fmt_to=None, extra_args=None, cwd=None, input_text=None):
+    # With input_text, the source is piped over stdin and in_path is not read.
+    cmd = ["pandoc"] if input_text is not None else ["pandoc", os.fspath(in_path)]
     if fmt_from:
         cmd.extend(["-f", fmt_from])
     if fmt_to:
         cmd.extend(["-t", fmt_to])
     if extra_args:
         cmd.extend(extra_args)
-    cmd.extend(["-o", str(out_path)])
-    subprocess.run(cmd, check=True, cwd=str(cwd) if cwd else None)
+    cmd.extend(["-o", os.fspath(out_path)])
+    subprocess.run(
+        cmd,
+        input=None if input_text is None else input_text.encode("utf-8"),
+        check=True,
+        cwd=os.fspath(cwd) if cwd else None,
+        timeout=PANDOC_TIMEOUT.get(),
+    )
+
+
+class PandocServer:
+    """A long-running `pandoc server` process for the text-only JSON/markdown passes.
+
+    The server is sandboxed (no file access, no arbitrary CLI flags), so it only
+    serves conversions that need neither; everything else stays on the CLI path.
+    rts_args is the `+RTS ... -RTS` block the process is started with, so the server
+    runs under the same heap/stack caps as the equivalent CLI calls.
+    """
+
+    def __init__(self, pandoc_bin="pandoc", startup_timeout=10.0, request_timeout=120, rts_args=()):
+        self.pandoc_bin = pandoc_bin
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self.rts_args = tuple(rts_args)
+        self.proc = None
+        self.url = None
+        # Never route loopback requests through an environment-configured proxy.
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    def start(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.proc = subprocess.Popen(
+            [
+                self.pandoc_bin,
+                *self.rts_args,
+                "server",
+                "--port",
+                str(port),
+                "--timeout",
+                str(self.request_timeout),
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                with self._opener.open(f"{self.url}/version", timeout=1):
+                    return True
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.05)
+        self.close()
+        return False
+
+    def convert(self, text: str, fmt_from: str, fmt_to: str, timeout=None) -> str:
+        payload = JSON_TEXT_ENCODER.encode({"text": text, "from": fmt_from, "to": fmt_to})
+        request = urllib.request.Request(
+            self.url,
+            data=payload.encode("utf-8"),
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+        )
+        try:
+            with self._opener.open(request, timeout=self.request_timeout if timeout is None else timeout) as response:
+                result = json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as exc:
+            detail = exc.read().decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"pandoc server failed ({fmt_from} -> {fmt_to}): {detail}") from exc
+        output = result.get("output") or ""
+        # The CLI terminates non-standalone output with a newline; the server does not.
+        if output and not output.endswith("\n"):
+            output += "\n"
+        return output
+
+    def close(self):
+        proc, self.proc = self.proc, None
+        if proc is None or proc.poll() is not None:
+            return
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+# Started (or attached) servers by RTS block. They are reused across conversions, but a
+# conversion only talks to one when it opts in through PANDOC_SERVER.
+_PANDOC_SERVERS = {}
+# Async conversions opt in from worker threads; only one of them may start a given server.
+_PANDOC_SERVERS_LOCK = threading.Lock()
+
+
+def enable_pandoc_server(rts_args=()):
+    """Start the shared pandoc server for rts_args once per process; False when unavailable."""
+    rts_args = tuple(rts_args)
+    with _PANDOC_SERVERS_LOCK:
+        if rts_args in _PANDOC_SERVERS:
+            return True
+        pandoc_bin = shutil.which("pandoc")
+        if pandoc_bin is None:
+            return False
+        server = PandocServer(pandoc_bin, rts_args=rts_args)
+        try:
+            started = server.start()
+        except OSError:
+            started = False
+        if not started:
+            return False
+        if not _PANDOC_SERVERS:
+            atexit.register(disable_pandoc_server)
+        _PANDOC_SERVERS[rts_args] = server
+        return True
+
+
+def disable_pandoc_server():
+    servers = list(_PANDOC_SERVERS.values())
+    _PANDOC_SERVERS.clear()
+    for server in servers:
+        server.close()
+
+
+def pandoc_server_url(rts_args=()):
+    server = _PANDOC_SERVERS.get(tuple(rts_args))
+    return None if server is None else server.url
+
+
+def attach_pandoc_server(url: str, rts_args=()):
+    """Route this process's server-capable passes to a server another process owns."""
+    # No proc handle: closing the attached client never stops the owner's server.
+    server = PandocServer(rts_args=rts_args)
+    server.url = url
+    _PANDOC_SERVERS[server.rts_args] = server
+
+
+def pandoc_server_for(extra_args):
+    # The server must run under the same RTS caps the CLI calls would get.
+    rts_args = tuple(pandoc_rts_args(extra_args))
+    if not enable_pandoc_server(rts_args):
+        return None
+    return _PANDOC_SERVERS[rts_args]
+
+
+def convert_with_pandoc_server(text: str, fmt_from: str, fmt_to: str):
+    """Convert through the current conversion's server; None means run the CLI instead."""
+    server = PANDOC_SERVER.get()
+    if server is None:
+        return None
+    timeout = PANDOC_TIMEOUT.get()
+    if timeout is not None and timeout > server.request_timeout:
+        # The server would cut the request off before the caller's limit; the CLI honors it.
+        return None
+    try:
+        return server.convert(text, fmt_from, fmt_to, timeout=timeout)
+    except (urllib.error.URLError, OSError) as exc:
+        if timeout is not None and (
+            isinstance(exc, TimeoutError) or isinstance(getattr(exc, "reason", None), TimeoutError)
+        ):
+            raise subprocess.TimeoutExpired(["pandoc", "server", fmt_from, fmt_to], timeout) from exc
+        # The server is gone; finish this conversion on the CLI path.
+        PANDOC_SERVER.set(None)
+        return None
 
 
 def temp_dir_root_for(path: Path):
@@ -130,8 +569,19 @@ def temp_dir_root_for(path: Path):
     return None
 
 
+def stripped_text(value) -> str:
+    # Same result as str(value or "").strip(), minus the coercions for plain strings.
+    if type(value) is str:
+        return value.strip()
+    return str(value or "").strip()
+
+
 def parse_state_token(state_value):
-    token = str(state_value or "").strip().lower()
+    if state_value is None or isinstance(state_value, str):
+        cached = STATE_TOKENS.get(state_value)
+        if cached is not None:
+            return cached
+    token = stripped_text(state_value).lower()
     if token == "resolved":
         return "resolved"
     return "active"
@@ -176,7 +626,52 @@ def pandoc_args_for_json_markdown_render(extra_args):
     return out
 
 
-def ensure_attr_pair(kvs, key: str, value: str):
+def with_pandoc_rts_limits(extra_args, heap_mb=None, stack_mb=None):
+    # Caller-supplied +RTS blocks win; otherwise cap the Haskell heap/stack.
+    args = extra_args or ()
+    if "+RTS" in args or (heap_mb is None and stack_mb is None):
+        return args
+    rts = ["+RTS"]
+    if heap_mb is not None:
+        rts.append(f"-M{int(heap_mb)}M")
+    if stack_mb is not None:
+        rts.append(f"-K{int(stack_mb)}m")
+    rts.append("-RTS")
+    return [*rts, *args]
+
+
+def pandoc_rts_args(extra_args):
+    # The `+RTS ... -RTS` blocks of extra_args, markers included.
+    out = []
+    in_rts = False
+    for arg in extra_args or ():
+        if arg == "+RTS":
+            in_rts = True
+        if in_rts:
+            out.append(arg)
+        if arg == "-RTS":
+            in_rts = False
+    return out
+
+
+def pandoc_args_without_rts(extra_args):
+    out = []
+    in_rts = False
+    for arg in extra_args or ():
+        if arg == "+RTS":
+            in_rts = True
+        elif arg == "-RTS":
+            in_rts = False
+        elif not in_rts:
+            out.append(arg)
+    return out
+
+
+def ensure_attr_pair(kvs, key: str, value: str, present=None):
+    # present is an optional key->value view of kvs; keys missing from it skip the scan.
+    if present is not None and key not in present:
+        kvs.append([key, value])
+        return True
     for item in kvs:
         if isinstance(item, list) and len(item) == 2 and item[0] == key:
             if item[1]:
@@ -188,22 +683,22 @@ def ensure_attr_pair(kvs, key: str, value: str):
 
 
 def remove_attr_pairs(kvs, keys):
-    kept = []
-    removed = False
-    for item in kvs:
+    # Most spans carry none of the keys, so only rebuild from the first match on.
+    for idx, item in enumerate(kvs):
         if isinstance(item, list) and len(item) == 2 and item[0] in keys:
-            removed = True
-            continue
-        kept.append(item)
-    if removed:
-        kvs[:] = kept
-    return removed
+            break
+    else:
+        return False
+    kvs[idx:] = [
+        item for item in kvs[idx + 1 :] if not (isinstance(item, list) and len(item) == 2 and item[0] in keys)
+    ]
+    return True
 
 
 def normalize_comment_span_id_attr(attr, classes, kvs):
     if "comment-start" not in classes and "comment-end" not in classes:
         return False
-    identifier = str(attr[0] or "").strip()
+    identifier = stripped_text(attr[0])
     if not identifier:
         return False
     changed = False
@@ -226,126 +721,103 @@ def normalize_comment_span_id_attr(attr, classes, kvs):
 
 def walk_pandoc_spans(doc, span_handler):
     changed = 0
+    # Explicit worklist of (node, in_inline_context); children are pushed in reverse so
+    # spans are still visited in document order without Python recursion.
+    stack = [(block, False) for block in reversed(doc.get("blocks", []) or [])]
+    while stack:
+        node, inline = stack.pop()
+        # Pandoc JSON only holds plain dicts and lists, so exact type checks suffice.
+        if type(node) is not dict:
+            continue
+        t = node.get("t")
+        if t in PANDOC_LEAF_TYPES:
+            continue
+        c = node.get("c")
+        children = []
+        if inline and t == "Span" and type(c) is list and len(c) == 2:
+            attr = c[0] if type(c[0]) is list else None
+            if attr is not None and span_handler(attr):
+                changed += 1
+            nested = c[1] if type(c[1]) is list else []
+            children = [(item, True) for item in nested]
+        elif t in PARA_BLOCK_TYPES and type(c) is list:
+            children = [(item, True) for item in c]
+        elif t == "Header" and type(c) is list and len(c) >= 3 and type(c[2]) is list:
+            children = [(item, True) for item in c[2]]
+        elif t == "BlockQuote" and type(c) is list:
+            children = [(item, False) for item in c]
+        elif t in LIST_BLOCK_TYPES and type(c) is list:
+            items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
+            for item in items:
+                children.extend((block, False) for block in item or [])
+        elif t == "DefinitionList" and type(c) is list:
+            for term, defs in c:
+                children.extend((item, True) for item in term or [])
+                for d in defs:
+                    children.extend((block, False) for block in d or [])
+        elif t == "Div" and type(c) is list and len(c) == 2 and type(c[1]) is list:
+            children = [(item, False) for item in c[1]]
+        elif inline and t in {"Link", "Image"} and type(c) is list and len(c) >= 2 and type(c[1]) is list:
+            children = [(item, True) for item in c[1]]
+        elif not inline and t == "Table" and type(c) is list:
+            for item in c:
+                if type(item) is list:
+                    children.extend((x, False) for x in item if type(x) is dict)
+        elif type(c) is list:
+            for item in c:
+                if type(item) is dict:
+                    children.append((item, False))
+                elif type(item) is list:
+                    children.extend((x, inline) for x in item)
+        stack.extend(reversed(children))
+    return changed
 
-    def walk_inlines(inlines):
-        nonlocal changed
-        for node in inlines or []:
-            if not isinstance(node, dict):
-                continue
-            t = node.get("t")
-            c = node.get("c")
-            if t == "Span" and isinstance(c, list) and len(c) == 2:
-                attr = c[0] if isinstance(c[0], list) else None
-                if attr is not None and span_handler(attr):
-                    changed += 1
-                nested = c[1] if isinstance(c[1], list) else []
-                walk_inlines(nested)
-                continue
-            if t in {"Para", "Plain"} and isinstance(c, list):
-                walk_inlines(c)
-                continue
-            if t == "Header" and isinstance(c, list) and len(c) >= 3 and isinstance(c[2], list):
-                walk_inlines(c[2])
-                continue
-            if t == "BlockQuote" and isinstance(c, list):
-                walk_blocks(c)
-                continue
-            if t in {"BulletList", "OrderedList"} and isinstance(c, list):
-                items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
-                for item in items:
-                    walk_blocks(item)
-                continue
-            if t == "DefinitionList" and isinstance(c, list):
-                for term, defs in c:
-                    walk_inlines(term)
-                    for d in defs:
-                        walk_blocks(d)
-                continue
-            if t == "Div" and isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                walk_blocks(c[1])
-                continue
-            if t in {"Link", "Image"} and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                walk_inlines(c[1])
-                continue
-            if isinstance(c, list):
-                for item in c:
-                    if isinstance(item, dict):
-                        walk_blocks([item])
-                    elif isinstance(item, list):
-                        walk_inlines(item)
 
-    def walk_blocks(blocks):
-        for block in blocks or []:
-            if not isinstance(block, dict):
-                continue
-            t = block.get("t")
-            c = block.get("c")
-            if t in {"Para", "Plain"} and isinstance(c, list):
-                walk_inlines(c)
-                continue
-            if t == "Header" and isinstance(c, list) and len(c) >= 3 and isinstance(c[2], list):
-                walk_inlines(c[2])
-                continue
-            if t == "BlockQuote" and isinstance(c, list):
-                walk_blocks(c)
-                continue
-            if t in {"BulletList", "OrderedList"} and isinstance(c, list):
-                items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
-                for item in items:
-                    walk_blocks(item)
-                continue
-            if t == "DefinitionList" and isinstance(c, list):
-                for term, defs in c:
-                    walk_inlines(term)
-                    for d in defs:
-                        walk_blocks(d)
-                continue
-            if t == "Div" and isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                walk_blocks(c[1])
-                continue
-            if t == "Table" and isinstance(c, list):
-                for item in c:
-                    if isinstance(item, list):
-                        walk_blocks([x for x in item if isinstance(x, dict)])
-                continue
-            if isinstance(c, list):
-                for item in c:
-                    if isinstance(item, dict):
-                        walk_blocks([item])
-                    elif isinstance(item, list):
-                        walk_blocks([x for x in item if isinstance(x, dict)])
+# Short fragments (anchors, separators, punctuation) recur; longer text is tokenized per call.
+TEXT_INLINE_CACHE_MAX_LEN = 256
 
-    walk_blocks(doc.get("blocks", []))
-    return changed
+
+def pandoc_inline_tokens(text: str):
+    out = []
+    # Newlines become SoftBreak; each run of other whitespace becomes one Space.
+    for line_idx, line in enumerate(text.split("\n")):
+        if line_idx:
+            out.append(("SoftBreak", None))
+        if not line:
+            continue
+        words = line.split()
+        if not words:
+            out.append(("Space", None))
+            continue
+        if line[0].isspace():
+            out.append(("Space", None))
+        for word_idx, word in enumerate(words):
+            if word_idx:
+                out.append(("Space", None))
+            out.append(("Str", word))
+        if line[-1].isspace():
+            out.append(("Space", None))
+    return tuple(out)
+
+
+@functools.lru_cache(maxsize=8192)
+def cached_pandoc_inline_tokens(text: str):
+    return pandoc_inline_tokens(text)
 
 
 def text_to_pandoc_inlines(text: str):
     if not text:
         return []
-    out = []
-    i = 0
-    n = len(text)
-    while i < n:
-        ch = text[i]
-        if ch == "\n":
-            out.append({"t": "SoftBreak"})
-            i += 1
-            continue
-        if ch.isspace():
-            while i < n and text[i].isspace() and text[i] != "\n":
-                i += 1
-            out.append({"t": "Space"})
-            continue
-        j = i
-        while j < n and (not text[j].isspace()) and text[j] != "\n":
-            j += 1
-        out.append({"t": "Str", "c": text[i:j]})
-        i = j
-    return out
+    if len(text) <= TEXT_INLINE_CACHE_MAX_LEN:
+        tokens = cached_pandoc_inline_tokens(text)
+    else:
+        tokens = pandoc_inline_tokens(text)
+    # Fresh dicts every call: callers splice these nodes into ASTs that may be mutated later.
+    return [{"t": t} if c is None else {"t": t, "c": c} for t, c in tokens]
 
 
 def milestone_marker_inline(comment_id: str, edge: str):
-    cid = str(comment_id or "").strip()
+    cid = stripped_text(comment_id)
     edge_token = normalize_milestone_edge(edge)
     if edge_token not in {"s", "e"}:
         edge_token = "s"
@@ -355,7 +827,11 @@ def milestone_marker_inline(comment_id: str, edge: str):
 
 
 def normalize_milestone_edge(edge_token: str) -> str:
-    token = str(edge_token or "").strip().lower()
+    if edge_token is None or isinstance(edge_token, str):
+        cached = MILESTONE_EDGE_TOKENS.get(edge_token)
+        if cached is not None:
+            return cached
+    token = stripped_text(edge_token).lower()
     if token in {"s", "start"}:
         return "s"
     if token in {"e", "end"}:
@@ -364,88 +840,174 @@ def normalize_milestone_edge(edge_token: str) -> str:
 
 
 def milestone_match_id_edge(match: re.Match):
-    group_dict = match.groupdict()
-    comment_id = str(
-        group_dict.get("id3c")
-        or group_dict.get("id3")
-        or ""
-    ).strip()
-    edge_token = str(
-        group_dict.get("edge3c")
-        or group_dict.get("edge3")
-        or ""
-    )
-    return comment_id, normalize_milestone_edge(edge_token)
+    comment_id = stripped_text(match.group("id"))
+    # `///C12.START///` carries comment 12; other identifiers are used verbatim.
+    if comment_id[:1] == "C" and comment_id[1:2].isdigit():
+        comment_id = comment_id[1:]
+    return sys.intern(comment_id), normalize_milestone_edge(match.group("edge"))
+
+
+def find_milestone_matches(text: str):
+    # Same matches as MILESTONE_TOKEN_RE.finditer, but str.find jumps between `///`
+    # candidates so the regex only runs where a token can start.
+    find = text.find
+    match_at = MILESTONE_TOKEN_RE.match
+    pos = find("///")
+    while pos >= 0:
+        match = match_at(text, pos)
+        if match:
+            yield match
+            pos = find("///", match.end())
+        else:
+            pos = find("///", pos + 1)
+
+
+def iter_milestone_tokens(text: str):
+    # Yield (start, end, match), widening the span over a balanced `==...==` wrapper.
+    # A `==` already consumed by the previous token is never reused.
+    prev_end = 0
+    text_len = len(text)
+    for match in find_milestone_matches(text):
+        start, end = match.span()
+        left = start
+        while left > prev_end and text[left - 1].isspace():
+            left -= 1
+        right = end
+        while right < text_len and text[right].isspace():
+            right += 1
+        if left - 2 >= prev_end and text.startswith("==", left - 2) and text.startswith("==", right):
+            start, end = left - 2, right + 2
+        prev_end = end
+        yield start, end, match
+
+
+def push_inline_children(items, stack):
+    # Reversed so the stack pops children in document order.
+    stack.extend(item for item in reversed(items) if isinstance(item, dict))
+
+
+def card_text_str(c, parts, stack):
+    if c:
+        parts.append(c)
+
+
+def card_text_space(c, parts, stack):
+    parts.append(" ")
+
+
+def card_text_break(c, parts, stack):
+    parts.append("\n")
+
+
+def card_text_code(c, parts, stack):
+    if isinstance(c, list) and c:
+        if c[-1]:
+            parts.append(c[-1])
+    elif isinstance(c, str) and c:
+        parts.append(c)
+
+
+def card_text_raw(c, parts, stack):
+    if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], str) and c[1]:
+        parts.append(c[1])
+
+
+def card_text_span(c, parts, stack):
+    if isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
+        push_inline_children(c[1], stack)
+
+
+def card_text_wrapper(c, parts, stack):
+    if isinstance(c, list):
+        push_inline_children(c, stack)
+
+
+def card_text_quoted(c, parts, stack):
+    if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
+        quote_type = c[0]
+        quote_name = (
+            stripped_text(quote_type.get("t"))
+            if isinstance(quote_type, dict)
+            else stripped_text(quote_type)
+        ).lower()
+        quote = "'" if "single" in quote_name else '"'
+        parts.append(quote)
+        # A plain string on the stack is the pending closing quote.
+        stack.append(quote)
+        push_inline_children(c[1], stack)
+
+
+def card_text_second_child(c, parts, stack):
+    if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
+        push_inline_children(c[1], stack)
+
+
+CARD_TEXT_HANDLERS = {
+    "Str": card_text_str,
+    "Space": card_text_space,
+    "SoftBreak": card_text_break,
+    "LineBreak": card_text_break,
+    "Code": card_text_code,
+    "Math": card_text_code,
+    "RawInline": card_text_raw,
+    "Span": card_text_span,
+    "Emph": card_text_wrapper,
+    "Strong": card_text_wrapper,
+    "Strikeout": card_text_wrapper,
+    "Superscript": card_text_wrapper,
+    "Subscript": card_text_wrapper,
+    "SmallCaps": card_text_wrapper,
+    "Underline": card_text_wrapper,
+    "Quoted": card_text_quoted,
+    "Cite": card_text_second_child,
+    "Link": card_text_second_child,
+    "Image": card_text_second_child,
+}
+
+
+def comment_text_soft_break(c, parts, stack):
+    # A trailing backslash before a soft break is a hard break in comment markdown.
+    if parts and parts[-1].endswith("\\"):
+        parts[-1] = parts[-1].rstrip("\\")
+        parts.append("\n")
+    else:
+        parts.append(" ")
 
 
-def inlines_to_card_text(inlines):
-    parts = []
+def comment_text_line_break(c, parts, stack):
+    # Convert line break markers in markdown comments to real newlines.
+    if parts and parts[-1].endswith("\\"):
+        parts[-1] = parts[-1].rstrip("\\")
+    parts.append("\n")
 
-    def emit(text):
-        if text:
-            parts.append(text)
 
-    def walk_inline(node):
-        if not isinstance(node, dict):
-            return
-        t = node.get("t")
+# Span comment text: like card text, but soft breaks stay spaces and quotes are not re-added.
+COMMENT_TEXT_HANDLERS = {
+    **CARD_TEXT_HANDLERS,
+    "SoftBreak": comment_text_soft_break,
+    "LineBreak": comment_text_line_break,
+    "Quoted": card_text_second_child,
+}
+
+
+def inlines_to_card_text(inlines):
+    parts = []
+    stack = []
+    push_inline_children(list(inlines or []), stack)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            parts.append(node)
+            continue
         c = node.get("c")
-        if t == "Str":
-            emit(c or "")
-        elif t == "Space":
-            emit(" ")
-        elif t in {"SoftBreak", "LineBreak"}:
-            emit("\n")
-        elif t in {"Code", "Math"}:
-            if isinstance(c, list) and c:
-                emit(c[-1] or "")
-            elif isinstance(c, str):
-                emit(c)
-        elif t == "RawInline":
-            if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], str):
-                emit(c[1])
-        elif t == "Span":
-            if isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                for item in c[1]:
-                    walk_inline(item)
-        elif t in {"Emph", "Strong", "Strikeout", "Superscript", "Subscript", "SmallCaps", "Underline"}:
-            if isinstance(c, list):
-                for item in c:
-                    walk_inline(item)
-        elif t == "Quoted":
-            if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                quote_type = c[0]
-                quote_name = (
-                    str(quote_type.get("t") or "").strip()
-                    if isinstance(quote_type, dict)
-                    else str(quote_type or "").strip()
-                ).lower()
-                if "single" in quote_name:
-                    open_quote, close_quote = "'", "'"
-                else:
-                    open_quote, close_quote = '"', '"'
-                emit(open_quote)
-                for item in c[1]:
-                    walk_inline(item)
-                emit(close_quote)
-        elif t == "Cite":
-            if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                for item in c[1]:
-                    walk_inline(item)
-        elif t in {"Link", "Image"}:
-            if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                for item in c[1]:
-                    walk_inline(item)
+        handler = CARD_TEXT_HANDLERS.get(node.get("t"))
+        if handler is not None:
+            handler(c, parts, stack)
         elif isinstance(c, list):
-            for item in c:
-                if isinstance(item, dict):
-                    walk_inline(item)
-
-    for item in inlines or []:
-        walk_inline(item)
+            push_inline_children(c, stack)
     text = "".join(parts)
     text = text.replace("\r\n", "\n").replace("\r", "\n")
-    text = re.sub(r"[ \t]+\n", "\n", text)
+    text = TRAILING_LINE_SPACE_RE.sub("\n", text)
     return text
 
 
@@ -453,7 +1015,7 @@ def extract_comment_card_text_from_blocks(blocks):
     parts = []
 
     def normalize_card_line(text: str):
-        line = str(text or "").strip()
+        line = stripped_text(text)
         if not line:
             return ""
         if CARD_HEADER_RE.match(line):
@@ -467,7 +1029,7 @@ def extract_comment_card_text_from_blocks(blocks):
             continue
         t = block.get("t")
         c = block.get("c")
-        if t in {"Para", "Plain"} and isinstance(c, list):
+        if t in PARA_BLOCK_TYPES and isinstance(c, list):
             line = normalize_card_line(inlines_to_card_text(c))
             if line:
                 parts.append(line)
@@ -493,8 +1055,9 @@ def parse_card_meta_marker(raw_html: str):
     match = CARD_META_INLINE_RE.search(raw_html or "")
     if not match:
         return "", {}
-    comment_id = str(match.group("id") or "").strip()
-    attrs_raw = str(match.group("attrs") or "").strip()
+    # Ids key many per-document maps; interning lets repeated lookups compare by identity.
+    comment_id = sys.intern(stripped_text(match.group("id")))
+    attrs_raw = stripped_text(match.group("attrs"))
     meta = {}
     if attrs_raw:
         try:
@@ -503,39 +1066,30 @@ def parse_card_meta_marker(raw_html: str):
             payload = {}
         if isinstance(payload, dict):
             for key, value in payload.items():
-                key_str = str(key or "").strip()
+                key_str = stripped_text(key)
                 if key_str:
-                    meta[key_str] = str(value or "").strip()
+                    meta[key_str] = stripped_text(value)
     return comment_id, meta
 
 
 def build_card_meta_marker(comment_id: str, meta: dict):
     attrs = []
-    for key in [
-        "author",
-        "date",
-        "parent",
-        "state",
-        "paraId",
-        "durableId",
-        "presenceProvider",
-        "presenceUserId",
-    ]:
-        value = str((meta or {}).get(key) or "").strip()
+    for key in CARD_META_KEYS:
+        value = stripped_text((meta or {}).get(key))
         if value:
-            attrs.append(f"{json.dumps(key)}:{json.dumps(value, ensure_ascii=False)}")
+            attrs.append(f'"{key}":{JSON_TEXT_ENCODER.encode(value)}')
     attrs_part = (" " + ",".join(attrs)) if attrs else ""
     return f"<!--CARD_META{{#{comment_id}{attrs_part}}}-->"
 
 
 def parse_comment_callout_header(line: str):
-    match = CARD_HEADER_RE.match(str(line or "").strip())
+    match = CARD_HEADER_RE.match(stripped_text(line))
     if not match:
         return {}
     return {
-        "kind": str(match.group("kind") or "").strip().upper(),
-        "id": str(match.group("id") or "").strip(),
-        "author": str(match.group("author") or "").strip(),
+        "kind": stripped_text(match.group("kind")).upper(),
+        "id": sys.intern(stripped_text(match.group("id"))),
+        "author": stripped_text(match.group("author")),
         "state": parse_state_token(match.group("state")),
     }
 
@@ -544,48 +1098,39 @@ def parse_comment_card_payload_text(payload_text: str, parent_hint=""):
     lines = str(payload_text or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
     header_idx = None
     header = {}
-    for idx, line in enumerate(lines):
-        if not str(line or "").strip():
-            continue
-        parsed = parse_comment_callout_header(line)
-        if parsed:
-            header_idx = idx
-            header = parsed
-            break
-    if header_idx is None:
-        return "", {}, "", ""
-
     meta_line_idx = None
     meta_comment_id = ""
     meta = {}
+    # One pass for both the first callout header and the first CARD_META line;
+    # the literal checks skip the regexes on ordinary body lines.
     for idx, line in enumerate(lines):
-        candidate_id, candidate_meta = parse_card_meta_marker(line)
-        if candidate_id:
-            meta_line_idx = idx
-            meta_comment_id = candidate_id
-            meta = candidate_meta
+        if header_idx is None and "[!" in line:
+            parsed = parse_comment_callout_header(line)
+            if parsed:
+                header_idx = idx
+                header = parsed
+        if meta_line_idx is None and "CARD_META" in line:
+            candidate_id, candidate_meta = parse_card_meta_marker(line)
+            if candidate_id:
+                meta_line_idx = idx
+                meta_comment_id = candidate_id
+                meta = candidate_meta
+        if header_idx is not None and meta_line_idx is not None:
             break
+    if header_idx is None:
+        return "", {}, "", ""
 
-    comment_id = str(meta_comment_id or header.get("id") or "").strip()
+    comment_id = stripped_text(meta_comment_id or header.get("id"))
     if not comment_id:
         return "", {}, "", ""
 
     out_meta = {}
-    for key in [
-        "author",
-        "date",
-        "parent",
-        "state",
-        "paraId",
-        "durableId",
-        "presenceProvider",
-        "presenceUserId",
-    ]:
-        value = str(meta.get(key) or "").strip()
+    for key in CARD_META_KEYS:
+        value = stripped_text(meta.get(key))
         if value:
             out_meta[key] = value
 
-    out_meta.setdefault("author", str(header.get("author") or "").strip())
+    out_meta.setdefault("author", stripped_text(header.get("author")))
     out_meta["state"] = parse_state_token(out_meta.get("state") or header.get("state"))
     if header.get("kind") == "REPLY" and parent_hint and not out_meta.get("parent"):
         out_meta["parent"] = str(parent_hint).strip()
@@ -622,7 +1167,7 @@ def parse_comment_card_blockquote(block, parent_hint=""):
         payload = inlines_to_card_text(primary_block.get("c", [None, None, []])[2])
     elif primary_block.get("t") == "RawBlock":
         c = primary_block.get("c")
-        fmt = str(c[0] or "").strip().lower() if isinstance(c, list) and len(c) == 2 else ""
+        fmt = stripped_text(c[0]).lower() if isinstance(c, list) and len(c) == 2 else ""
         payload = str(c[1] or "") if fmt in {"markdown", "md"} else ""
     else:
         payload = inlines_to_card_text(primary_block.get("c"))
@@ -641,10 +1186,10 @@ def parse_comment_card_blockquote(block, parent_hint=""):
         marker_id = ""
         marker_meta = {}
         if qtype == "RawBlock" and isinstance(qdata, list) and len(qdata) == 2:
-            fmt = str(qdata[0] or "").strip().lower()
+            fmt = stripped_text(qdata[0]).lower()
             if fmt == "html":
                 marker_id, marker_meta = parse_card_meta_marker(str(qdata[1] or ""))
-        elif qtype in {"Para", "Plain"} and isinstance(qdata, list):
+        elif qtype in PARA_BLOCK_TYPES and isinstance(qdata, list):
             marker_id, marker_meta = parse_card_meta_marker(inlines_to_card_text(qdata))
         elif qtype == "Header" and isinstance(qdata, list) and len(qdata) >= 3 and isinstance(qdata[2], list):
             marker_id, marker_meta = parse_card_meta_marker(inlines_to_card_text(qdata[2]))
@@ -656,17 +1201,8 @@ def parse_comment_card_blockquote(block, parent_hint=""):
 
     if detected_meta_id and detected_meta_id != comment_id:
         comment_id = detected_meta_id
-    for key in [
-        "author",
-        "date",
-        "parent",
-        "state",
-        "paraId",
-        "durableId",
-        "presenceProvider",
-        "presenceUserId",
-    ]:
-        value = str(detected_meta.get(key) or "").strip()
+    for key in CARD_META_KEYS:
+        value = stripped_text(detected_meta.get(key))
         if value and not meta.get(key):
             meta[key] = value
     meta["state"] = parse_state_token(meta.get("state"))
@@ -696,177 +1232,142 @@ def parse_comment_card_blockquote(block, parent_hint=""):
 
 def normalize_card_layout_text(text: str) -> str:
     out = str(text or "")
-    # Keep callout headers directly above metadata lines.
-    out = re.sub(
-        r"(^>+\s*\[!(?:COMMENT|REPLY)[^\n]*\])\n>+[ \t]*\n(?=>+[ \t]*<!--CARD_META)",
-        r"\1\n",
-        out,
-        flags=re.MULTILINE,
-    )
-    # Keep metadata lines directly above body lines.
-    out = re.sub(
-        r"(^>+[ \t]*<!--CARD_META\{#[^\n]*\}-->)\n>+[ \t]*\n(?=>+[ \t]*\S)",
-        r"\1\n",
-        out,
-        flags=re.MULTILINE,
-    )
-    return out
+    # Keep callout headers directly above metadata lines, and metadata lines
+    # directly above body lines, in a single pass.
+    return CARD_LAYOUT_GAP_RE.sub(r"\1\2\n", out)
 
 
 def parse_comment_cards_from_doc(doc):
     card_by_id = {}
     removed = 0
+    if not doc.get("blocks"):
+        return card_by_id, removed
 
-    def process_blocks(blocks):
+    def register_cards(entries):
         nonlocal removed
-        kept = []
-        idx = 0
-        while idx < len(blocks or []):
-            block = blocks[idx]
-            if not isinstance(block, dict):
-                kept.append(block)
-                idx += 1
+        for comment_id, meta in entries:
+            if not comment_id:
                 continue
-            t = block.get("t")
-            c = block.get("c")
-            if t == "BlockQuote":
-                entries = parse_comment_card_blockquote(block, parent_hint="")
-                if entries:
-                    for comment_id, meta in entries:
-                        if not comment_id:
-                            continue
-                        card_by_id[comment_id] = {
-                            "author": str(meta.get("author") or "").strip(),
-                            "date": str(meta.get("date") or "").strip(),
-                            "parent": str(meta.get("parent") or "").strip(),
-                            "state": parse_state_token(meta.get("state")),
-                            "paraId": str(meta.get("paraId") or "").strip(),
-                            "durableId": str(meta.get("durableId") or "").strip(),
-                            "presenceProvider": str(meta.get("presenceProvider") or "").strip(),
-                            "presenceUserId": str(meta.get("presenceUserId") or "").strip(),
-                            "anchor": str(meta.get("anchor") or "").strip(),
-                            "text": normalize_markdown_comment_text(meta.get("text") or ""),
-                        }
-                        removed += 1
-                    idx += 1
-                    continue
-                if isinstance(c, list):
-                    block["c"] = process_blocks(c)
-            elif t == "Div" and isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                block["c"][1] = process_blocks(c[1])
-            elif t in {"BulletList", "OrderedList"} and isinstance(c, list):
-                items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
-                for item in items:
-                    if isinstance(item, list):
-                        item[:] = process_blocks(item)
-            elif t == "DefinitionList" and isinstance(c, list):
-                for _, defs in c:
-                    for d in defs:
-                        if isinstance(d, list):
-                            d[:] = process_blocks(d)
-            elif t == "Table" and isinstance(c, list):
-                for item in c:
-                    if isinstance(item, list):
-                        for maybe_block in item:
-                            if isinstance(maybe_block, dict) and maybe_block.get("t") == "BlockQuote":
-                                maybe_entries = parse_comment_card_blockquote(maybe_block, parent_hint="")
-                                if maybe_entries:
-                                    for comment_id, meta in maybe_entries:
-                                        if not comment_id:
-                                            continue
-                                        card_by_id[comment_id] = {
-                                            "author": str(meta.get("author") or "").strip(),
-                                            "date": str(meta.get("date") or "").strip(),
-                                            "parent": str(meta.get("parent") or "").strip(),
-                                            "state": parse_state_token(meta.get("state")),
-                                            "paraId": str(meta.get("paraId") or "").strip(),
-                                            "durableId": str(meta.get("durableId") or "").strip(),
-                                            "presenceProvider": str(meta.get("presenceProvider") or "").strip(),
-                                            "presenceUserId": str(meta.get("presenceUserId") or "").strip(),
-                                            "anchor": str(meta.get("anchor") or "").strip(),
-                                            "text": normalize_markdown_comment_text(meta.get("text") or ""),
-                                        }
-                                        removed += 1
-            kept.append(block)
-            idx += 1
-        return kept
+            card = {key: stripped_text(meta.get(key)) for key in CARD_FIELD_KEYS}
+            card["state"] = parse_state_token(meta.get("state"))
+            card["text"] = normalize_markdown_comment_text(meta.get("text") or "")
+            card_by_id[comment_id] = card
+            removed += 1
 
-    if doc.get("blocks"):
-        doc["blocks"] = process_blocks(doc.get("blocks", []))
+    # Each frame filters one block list in place. Nested lists are pushed as soon as
+    # their parent block is kept, so cards still register in document order.
+    done = object()
+    blocks = doc["blocks"]
+    stack = [(blocks, iter(list(blocks)), [])]
+    while stack:
+        target, pending, kept = stack[-1]
+        block = next(pending, done)
+        if block is done:
+            target[:] = kept
+            stack.pop()
+            continue
+        if not isinstance(block, dict):
+            kept.append(block)
+            continue
+        t = block.get("t")
+        c = block.get("c")
+        nested = []
+        if t == "BlockQuote":
+            entries = parse_comment_card_blockquote(block, parent_hint="")
+            if entries:
+                register_cards(entries)
+                continue
+            if isinstance(c, list):
+                nested.append(c)
+        elif t == "Div" and isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
+            nested.append(c[1])
+        elif t in LIST_BLOCK_TYPES and isinstance(c, list):
+            items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
+            nested.extend(item for item in items if isinstance(item, list))
+        elif t == "DefinitionList" and isinstance(c, list):
+            for _, defs in c:
+                nested.extend(d for d in defs if isinstance(d, list))
+        elif t == "Table" and isinstance(c, list):
+            # Cards inside tables are registered but left in place.
+            for item in c:
+                if isinstance(item, list):
+                    for maybe_block in item:
+                        if isinstance(maybe_block, dict) and maybe_block.get("t") == "BlockQuote":
+                            register_cards(parse_comment_card_blockquote(maybe_block, parent_hint="") or [])
+        kept.append(block)
+        stack.extend((child, iter(list(child)), []) for child in reversed(nested))
     return card_by_id, removed
 
 
-def make_comment_span_inline(comment_id: str, edge: str, card_by_id=None):
+def card_anchor_text(card) -> str:
+    anchor = str(card.get("anchor") or "")
+    if len(anchor) > 120 or CARD_ANCHOR_REJECT_RE.search(anchor):
+        return ""
+    return anchor
+
+
+def build_card_anchor_table(card_by_id):
+    # Sanitized anchors keyed by comment id, computed once per document.
+    anchor_by_id = {}
+    for comment_id, card in (card_by_id or {}).items():
+        anchor = card_anchor_text(card or {})
+        if anchor:
+            anchor_by_id[comment_id] = anchor
+    return anchor_by_id
+
+
+def make_comment_span_inline(comment_id: str, edge: str, card_by_id=None, anchor_by_id=None):
     if edge == "e":
         return {"t": "Span", "c": [["", ["comment-end"], [["id", comment_id]]], []]}
     card = (card_by_id or {}).get(comment_id) or {}
     attrs = [["id", comment_id]]
-    for key in [
-        "author",
-        "date",
-        "parent",
-        "state",
-        "paraId",
-        "durableId",
-        "presenceProvider",
-        "presenceUserId",
-    ]:
-        value = str(card.get(key) or "").strip()
+    for key in CARD_META_KEYS:
+        value = stripped_text(card.get(key))
         if value:
             attrs.append([key, value])
-    anchor = str(card.get("anchor") or "")
-    if (
-        "\n" in anchor
-        or "\r" in anchor
-        or "---" in anchor
-        or len(anchor) > 120
-    ):
-        anchor = ""
+    anchor = anchor_by_id.get(comment_id, "") if anchor_by_id is not None else card_anchor_text(card)
     nested = text_to_pandoc_inlines(anchor) if anchor else []
     return {"t": "Span", "c": [["", ["comment-start"], attrs], nested]}
 
 
-def expand_milestone_tokens_in_text(text: str, card_by_id=None):
-    if not text:
-        return None, 0
-    matches = list(MILESTONE_TOKEN_RE.finditer(text))
-    if not matches:
+def expand_milestone_tokens_in_text(text: str, card_by_id=None, anchor_by_id=None):
+    # Most text runs hold no token at all; reject them before building anything.
+    if not text or "///" not in text:
         return None, 0
     out = []
     cursor = 0
-    for match in matches:
-        if match.start() > cursor:
-            out.extend(text_to_pandoc_inlines(text[cursor : match.start()]))
+    count = 0
+    for start, end, match in iter_milestone_tokens(text):
+        count += 1
+        if start > cursor:
+            out.extend(text_to_pandoc_inlines(text[cursor:start]))
         comment_id, edge = milestone_match_id_edge(match)
         if comment_id and edge in {"s", "e"}:
-            out.append(make_comment_span_inline(comment_id, edge, card_by_id))
-            next_cursor = match.end()
+            out.append(make_comment_span_inline(comment_id, edge, card_by_id, anchor_by_id))
+            next_cursor = end
             if edge == "s":
-                card = (card_by_id or {}).get(comment_id) or {}
-                anchor = str(card.get("anchor") or "")
-                if (
-                    "\n" in anchor
-                    or "\r" in anchor
-                    or "---" in anchor
-                    or len(anchor) > 120
-                ):
-                    anchor = ""
-                if anchor and text[next_cursor:].startswith(anchor):
+                if anchor_by_id is not None:
+                    anchor = anchor_by_id.get(comment_id, "")
+                else:
+                    anchor = card_anchor_text((card_by_id or {}).get(comment_id) or {})
+                if anchor and text.startswith(anchor, next_cursor):
                     next_cursor += len(anchor)
         else:
-            out.extend(text_to_pandoc_inlines(match.group(0)))
-            next_cursor = match.end()
+            out.extend(text_to_pandoc_inlines(text[start:end]))
+            next_cursor = end
         cursor = next_cursor
+    if not count:
+        return None, 0
     if cursor < len(text):
         out.extend(text_to_pandoc_inlines(text[cursor:]))
-    return out, len(matches)
+    return out, count
 
 
-def rewrite_milestone_tokens_in_inlines(inlines, card_by_id=None):
+def rewrite_milestone_tokens_in_inlines(inlines, card_by_id=None, anchor_by_id=None):
     changed = 0
-    out = []
+    # Rebuilt lazily from the first replacement; untouched lists are never copied.
+    out = None
     i = 0
-    text_nodes = {"Str", "Space", "SoftBreak", "LineBreak"}
 
     def node_text(node):
         t = node.get("t")
@@ -880,24 +1381,31 @@ def rewrite_milestone_tokens_in_inlines(inlines, card_by_id=None):
 
     while i < len(inlines):
         node = inlines[i]
-        if isinstance(node, dict) and node.get("t") in text_nodes:
+        if type(node) is dict and node.get("t") in PANDOC_TEXT_NODE_TYPES:
             start = i
             text_parts = []
             while i < len(inlines):
                 probe = inlines[i]
-                if not isinstance(probe, dict) or probe.get("t") not in text_nodes:
+                if type(probe) is not dict or probe.get("t") not in PANDOC_TEXT_NODE_TYPES:
                     break
                 text_parts.append(node_text(probe))
                 i += 1
             segment = "".join(text_parts)
-            replacement, replaced_count = expand_milestone_tokens_in_text(segment, card_by_id=card_by_id)
+            replaced_count = 0
+            if "///" in segment:
+                replacement, replaced_count = expand_milestone_tokens_in_text(
+                    segment, card_by_id=card_by_id, anchor_by_id=anchor_by_id
+                )
             if replaced_count:
+                if out is None:
+                    out = inlines[:start]
                 out.extend(replacement)
                 changed += replaced_count
-            else:
+            elif out is not None:
                 out.extend(inlines[start:i])
             continue
-        out.append(node)
+        if out is not None:
+            out.append(node)
         i += 1
     if changed:
         inlines[:] = out
@@ -906,84 +1414,70 @@ def rewrite_milestone_tokens_in_inlines(inlines, card_by_id=None):
 
 def rewrite_milestone_tokens_in_doc(doc, card_by_id=None):
     changed = 0
-
-    def walk_inlines(inlines):
-        nonlocal changed
-        if not isinstance(inlines, list):
-            return
-        changed += rewrite_milestone_tokens_in_inlines(inlines, card_by_id=card_by_id)
-        for node in inlines:
-            if not isinstance(node, dict):
-                continue
-            t = node.get("t")
-            c = node.get("c")
-            if t == "Span" and isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                walk_inlines(c[1])
-                continue
-            if t in {"Emph", "Strong", "Strikeout", "Superscript", "Subscript", "SmallCaps", "Underline"}:
-                if isinstance(c, list):
-                    walk_inlines(c)
-                continue
-            if t == "Quoted" and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                walk_inlines(c[1])
-                continue
-            if t == "Cite" and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                walk_inlines(c[1])
-                continue
-            if t in {"Link", "Image"} and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                walk_inlines(c[1])
-                continue
-
-    def walk_blocks(blocks):
-        if not isinstance(blocks, list):
-            return
-        for block in blocks:
-            if not isinstance(block, dict):
-                continue
-            t = block.get("t")
-            c = block.get("c")
-            if t in {"Para", "Plain"} and isinstance(c, list):
-                walk_inlines(c)
-                continue
-            if t == "Header" and isinstance(c, list) and len(c) >= 3 and isinstance(c[2], list):
-                walk_inlines(c[2])
-                if isinstance(c[1], list) and len(c[1]) >= 1:
-                    header_id = str(c[1][0] or "").strip().lower()
-                    if "dc_comment" in header_id:
-                        c[1][0] = ""
-                continue
-            if t == "BlockQuote" and isinstance(c, list):
-                walk_blocks(c)
-                continue
-            if t == "Div" and isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                walk_blocks(c[1])
-                continue
-            if t in {"BulletList", "OrderedList"} and isinstance(c, list):
-                items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
-                for item in items:
-                    walk_blocks(item)
-                continue
-            if t == "DefinitionList" and isinstance(c, list):
-                for term, defs in c:
-                    walk_inlines(term)
-                    for d in defs:
-                        walk_blocks(d)
-                continue
-            if t == "Table" and isinstance(c, list):
-                for item in c:
-                    if isinstance(item, list):
-                        walk_blocks([x for x in item if isinstance(x, dict)])
-                continue
-
-    walk_blocks(doc.get("blocks", []))
+    anchor_by_id = build_card_anchor_table(card_by_id)
+    # Worklist of (is_inline, list); children are pushed in reverse so lists are still
+    # rewritten in document order without recursing per nesting level.
+    stack = [(False, doc.get("blocks", []))]
+    while stack:
+        inline, items = stack.pop()
+        if type(items) is not list:
+            continue
+        children = []
+        if inline:
+            changed += rewrite_milestone_tokens_in_inlines(
+                items, card_by_id=card_by_id, anchor_by_id=anchor_by_id
+            )
+            for node in items:
+                if type(node) is not dict:
+                    continue
+                t = node.get("t")
+                c = node.get("c")
+                if t == "Span" and type(c) is list and len(c) == 2 and type(c[1]) is list:
+                    children.append((True, c[1]))
+                elif t in INLINE_CONTAINER_TYPES:
+                    if type(c) is list:
+                        children.append((True, c))
+                elif t in {"Quoted", "Cite", "Link", "Image"}:
+                    if type(c) is list and len(c) >= 2 and type(c[1]) is list:
+                        children.append((True, c[1]))
+        else:
+            for block in items:
+                if type(block) is not dict:
+                    continue
+                t = block.get("t")
+                c = block.get("c")
+                if t in PARA_BLOCK_TYPES and type(c) is list:
+                    children.append((True, c))
+                elif t == "Header" and type(c) is list and len(c) >= 3 and type(c[2]) is list:
+                    children.append((True, c[2]))
+                    if type(c[1]) is list and len(c[1]) >= 1:
+                        header_id = stripped_text(c[1][0]).lower()
+                        if "dc_comment" in header_id:
+                            c[1][0] = ""
+                elif t == "BlockQuote" and type(c) is list:
+                    children.append((False, c))
+                elif t == "Div" and type(c) is list and len(c) == 2 and type(c[1]) is list:
+                    children.append((False, c[1]))
+                elif t in LIST_BLOCK_TYPES and type(c) is list:
+                    list_items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
+                    children.extend((False, item) for item in list_items)
+                elif t == "DefinitionList" and type(c) is list:
+                    for term, defs in c:
+                        children.append((True, term))
+                        children.extend((False, d) for d in defs)
+                elif t == "Table" and type(c) is list:
+                    for item in c:
+                        if type(item) is list:
+                            children.append((False, [x for x in item if type(x) is dict]))
+        stack.extend(reversed(children))
     return changed
 
 
 def build_comment_card_blockquote(comment_id: str, meta: dict, children=None):
     local_meta = dict(meta or {})
-    author = str(local_meta.get("author") or "").strip() or "Unknown"
+    author = stripped_text(local_meta.get("author")) or "Unknown"
     state = parse_state_token(local_meta.get("state"))
-    kind = "REPLY" if str(local_meta.get("parent") or "").strip() else "COMMENT"
+    kind = "REPLY" if stripped_text(local_meta.get("parent")) else "COMMENT"
     header_text = f"[!{kind} {comment_id}: {author} ({state})]"
     marker_text = build_card_meta_marker(comment_id, local_meta)
     body_text = normalize_markdown_comment_text(local_meta.get("text") or "")
@@ -1000,45 +1494,69 @@ def build_comment_card_blockquote(comment_id: str, meta: dict, children=None):
     return {"t": "BlockQuote", "c": quote_blocks}
 
 
-def rewrite_comment_spans_to_milestones_in_doc(doc, child_ids=None):
+def rewrite_comment_spans_to_milestones_in_doc(doc, child_ids=None, first_start_index=None, last_end_index=None):
+    # When first_start_index/last_end_index dicts are passed, they are filled with the
+    # top-level block index of each id's first START and last END milestone in the output.
     child_id_set = set(str(cid) for cid in (child_ids or set()))
     start_order = []
     seen_starts = set()
     anchor_by_id = {}
     changed = 0
+    track_markers = first_start_index is not None and last_end_index is not None
+
+    def note_markers(text, block_idx):
+        for match in find_milestone_matches(text):
+            mid, edge = milestone_match_id_edge(match)
+            if not mid:
+                continue
+            if edge == "s":
+                first_start_index.setdefault(mid, block_idx)
+            elif edge == "e":
+                last_end_index[mid] = block_idx
 
     def comment_id_from_attr(attr):
         if not (isinstance(attr, list) and len(attr) == 3):
             return ""
-        identifier = str(attr[0] or "").strip()
+        identifier = stripped_text(attr[0])
         if identifier:
             return identifier
         kvs = attr[2] if isinstance(attr[2], list) else []
         for item in kvs:
             if isinstance(item, list) and len(item) == 2 and item[0] == "id":
-                return str(item[1] or "").strip()
+                return stripped_text(item[1])
         return ""
 
-    def walk_inlines(inlines):
+    def rewrite_inlines(inlines, block_idx):
         nonlocal changed
-        if not isinstance(inlines, list):
-            return
-        out = []
-        for node in inlines:
-            if not isinstance(node, dict):
+        # Frames of (target, pending nodes, rebuilt list). A nested list gets its own frame
+        # and is finished before its parent resumes, so starts are seen in document order.
+        done = object()
+        frames = [(inlines, iter(list(inlines)), [])]
+        while frames:
+            target, pending, out = frames[-1]
+            node = next(pending, done)
+            if node is done:
+                target[:] = out
+                frames.pop()
+                continue
+            if type(node) is not dict:
                 out.append(node)
                 continue
             t = node.get("t")
             c = node.get("c")
-            if t == "Span" and isinstance(c, list) and len(c) == 2 and isinstance(c[0], list):
+            nested = None
+            if t == "Span" and type(c) is list and len(c) == 2 and type(c[0]) is list:
                 attr = c[0]
-                nested = c[1] if isinstance(c[1], list) else []
-                classes = attr[1] if isinstance(attr[1], list) else []
+                nested = c[1] if type(c[1]) is list else []
+                classes = attr[1] if type(attr[1]) is list else []
                 cid = comment_id_from_attr(attr)
                 if cid and "comment-start" in classes:
                     # Root anchors stay in prose as milestones; replies are carried by cards only.
                     if cid not in child_id_set:
-                        out.append(milestone_marker_inline(cid, "s"))
+                        marker = milestone_marker_inline(cid, "s")
+                        if track_markers:
+                            note_markers(marker["c"], block_idx)
+                        out.append(marker)
                         if cid not in seen_starts:
                             seen_starts.add(cid)
                             start_order.append(cid)
@@ -1046,70 +1564,61 @@ def rewrite_comment_spans_to_milestones_in_doc(doc, child_ids=None):
                     continue
                 if cid and "comment-end" in classes:
                     if cid not in child_id_set:
-                        out.append(milestone_marker_inline(cid, "e"))
+                        marker = milestone_marker_inline(cid, "e")
+                        if track_markers:
+                            note_markers(marker["c"], block_idx)
+                        out.append(marker)
                     changed += 1
                     continue
-                walk_inlines(nested)
-                out.append({"t": "Span", "c": [attr, nested]})
-                continue
-            if t in {"Emph", "Strong", "Strikeout", "Superscript", "Subscript", "SmallCaps", "Underline"}:
-                if isinstance(c, list):
-                    walk_inlines(c)
-                out.append(node)
-                continue
-            if t == "Quoted" and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                walk_inlines(c[1])
-                out.append(node)
-                continue
-            if t == "Cite" and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                walk_inlines(c[1])
-                out.append(node)
-                continue
-            if t in {"Link", "Image"} and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                walk_inlines(c[1])
-                out.append(node)
-                continue
+                node = {"t": "Span", "c": [attr, nested]}
+            elif t in INLINE_CONTAINER_TYPES:
+                if type(c) is list:
+                    nested = c
+            elif t in {"Quoted", "Cite", "Link", "Image"}:
+                if type(c) is list and len(c) >= 2 and type(c[1]) is list:
+                    nested = c[1]
+            elif t == "Str" and track_markers:
+                note_markers(str(c or ""), block_idx)
             out.append(node)
-        inlines[:] = out
-
-    def walk_blocks(blocks):
-        if not isinstance(blocks, list):
-            return
-        for block in blocks:
-            if not isinstance(block, dict):
+            if nested is not None:
+                frames.append((nested, iter(list(nested)), []))
+
+    # Entries are (is_inline, items, top-level block index); the top list has no index yet.
+    stack = [(False, doc.get("blocks", []), None)]
+    while stack:
+        inline, items, top_idx = stack.pop()
+        if type(items) is not list:
+            continue
+        if inline:
+            rewrite_inlines(items, top_idx)
+            continue
+        children = []
+        for idx, block in enumerate(items):
+            if type(block) is not dict:
                 continue
+            block_idx = idx if top_idx is None else top_idx
             t = block.get("t")
             c = block.get("c")
-            if t in {"Para", "Plain"} and isinstance(c, list):
-                walk_inlines(c)
-                continue
-            if t == "Header" and isinstance(c, list) and len(c) >= 3 and isinstance(c[2], list):
-                walk_inlines(c[2])
-                continue
-            if t == "BlockQuote" and isinstance(c, list):
-                walk_blocks(c)
-                continue
-            if t == "Div" and isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                walk_blocks(c[1])
-                continue
-            if t in {"BulletList", "OrderedList"} and isinstance(c, list):
-                items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
-                for item in items:
-                    walk_blocks(item)
-                continue
-            if t == "DefinitionList" and isinstance(c, list):
+            if t in PARA_BLOCK_TYPES and type(c) is list:
+                children.append((True, c, block_idx))
+            elif t == "Header" and type(c) is list and len(c) >= 3 and type(c[2]) is list:
+                children.append((True, c[2], block_idx))
+            elif t == "BlockQuote" and type(c) is list:
+                children.append((False, c, block_idx))
+            elif t == "Div" and type(c) is list and len(c) == 2 and type(c[1]) is list:
+                children.append((False, c[1], block_idx))
+            elif t in LIST_BLOCK_TYPES and type(c) is list:
+                list_items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
+                children.extend((False, item, block_idx) for item in list_items)
+            elif t == "DefinitionList" and type(c) is list:
                 for term, defs in c:
-                    walk_inlines(term)
-                    for d in defs:
-                        walk_blocks(d)
-                continue
-            if t == "Table" and isinstance(c, list):
+                    children.append((True, term, block_idx))
+                    children.extend((False, d, block_idx) for d in defs)
+            elif t == "Table" and type(c) is list:
                 for item in c:
-                    if isinstance(item, list):
-                        walk_blocks([x for x in item if isinstance(x, dict)])
-                continue
-
-    walk_blocks(doc.get("blocks", []))
+                    if type(item) is list:
+                        children.append((False, [x for x in item if type(x) is dict], block_idx))
+        stack.extend(reversed(children))
     return changed, start_order, anchor_by_id
 
 
@@ -1122,159 +1631,54 @@ def emit_milestones_and_cards_ast(
     cwd=None,
 ):
     doc = run_pandoc_json(md_path, fmt_from="markdown", extra_args=pandoc_extra_args)
-    changed, start_order, anchor_by_id = rewrite_comment_spans_to_milestones_in_doc(doc, child_ids=child_ids)
+    first_start_index = {}
+    last_end_index = {}
+    changed, start_order, anchor_by_id = rewrite_comment_spans_to_milestones_in_doc(
+        doc,
+        child_ids=child_ids,
+        first_start_index=first_start_index,
+        last_end_index=last_end_index,
+    )
     if start_order:
-        cards_meta_by_id = {str(cid): dict(meta or {}) for cid, meta in (comment_cards_by_id or {}).items()}
-        order_index = {cid: idx for idx, cid in enumerate(cards_meta_by_id.keys())}
+        cards_meta_by_id = {}
+        order_index = {}
+        for cid, meta in (comment_cards_by_id or {}).items():
+            cid = str(cid)
+            cards_meta_by_id[cid] = dict(meta or {})
+            # setdefault keeps the first position when str() folds two keys together.
+            order_index.setdefault(cid, len(order_index))
         children_by_parent = {}
         for cid, meta in cards_meta_by_id.items():
-            parent = str((meta or {}).get("parent") or "").strip()
+            parent = stripped_text(meta.get("parent"))
             if parent and parent != cid and parent in cards_meta_by_id:
                 children_by_parent.setdefault(parent, []).append(cid)
-        for parent, children in children_by_parent.items():
-            children.sort(key=lambda x: order_index.get(x, 10**9))
-
-        def build_thread_blockquote(comment_id, seen=None):
-            if seen is None:
-                seen = set()
-            if comment_id in seen:
-                return None
-            seen.add(comment_id)
-            meta = dict(cards_meta_by_id.get(comment_id) or {})
-            children = []
-            for child_id in children_by_parent.get(comment_id, []):
-                child_block = build_thread_blockquote(child_id, seen=seen)
-                if child_block is not None:
-                    children.append(child_block)
-            return build_comment_card_blockquote(comment_id, meta, children=children)
-
-        cards_by_root_id = {}
-        for root_id in start_order:
-            root_block = build_thread_blockquote(root_id, seen=set())
-            cards_by_root_id[root_id] = [root_block] if root_block is not None else []
-
-        marker_order = []
-
-        def push_marker_ids_from_text(text, start_ids, end_ids):
-            for match in MILESTONE_TOKEN_RE.finditer(text or ""):
-                mid, edge = milestone_match_id_edge(match)
-                if not mid or edge not in {"s", "e"}:
-                    continue
-                if edge == "s":
-                    if mid not in start_ids:
-                        start_ids.append(mid)
-                    if mid not in marker_order:
-                        marker_order.append(mid)
-                else:
-                    if mid not in end_ids:
-                        end_ids.append(mid)
-
-        def scan_inlines_for_markers(inlines, start_ids, end_ids):
-            if not isinstance(inlines, list):
-                return
-            for node in inlines:
-                if not isinstance(node, dict):
-                    continue
-                t = node.get("t")
-                c = node.get("c")
-                if t == "Str":
-                    push_marker_ids_from_text(str(c or ""), start_ids, end_ids)
-                    continue
-                if t in {
-                    "Emph",
-                    "Strong",
-                    "Strikeout",
-                    "Superscript",
-                    "Subscript",
-                    "SmallCaps",
-                    "Underline",
-                } and isinstance(c, list):
-                    scan_inlines_for_markers(c, start_ids, end_ids)
-                    continue
-                if t == "Span" and isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                    scan_inlines_for_markers(c[1], start_ids, end_ids)
-                    continue
-                if t == "Quoted" and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                    scan_inlines_for_markers(c[1], start_ids, end_ids)
-                    continue
-                if t == "Cite" and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                    scan_inlines_for_markers(c[1], start_ids, end_ids)
-                    continue
-                if t in {"Link", "Image"} and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                    scan_inlines_for_markers(c[1], start_ids, end_ids)
+        # Every child is a cards_meta_by_id key, so order_index always has it.
+        for children in children_by_parent.values():
+            children.sort(key=order_index.__getitem__)
+
+        def build_thread_blockquote(root_id):
+            # Post-order over reply threads: a frame is (id, pending child ids, built child blocks).
+            # One seen set per thread drops cycles and replies already placed elsewhere in it.
+            seen = {root_id}
+            frames = [(root_id, iter(children_by_parent.get(root_id, [])), [])]
+            while True:
+                comment_id, pending, children = frames[-1]
+                child_id = next(pending, None)
+                if child_id is not None:
+                    if child_id not in seen:
+                        seen.add(child_id)
+                        frames.append((child_id, iter(children_by_parent.get(child_id, [])), []))
                     continue
+                frames.pop()
+                meta = dict(cards_meta_by_id.get(comment_id) or {})
+                block = build_comment_card_blockquote(comment_id, meta, children=children)
+                if not frames:
+                    return block
+                frames[-1][2].append(block)
 
-        def collect_block_markers(block, start_ids, end_ids):
-            if not isinstance(block, dict):
-                return
-            t = block.get("t")
-            c = block.get("c")
-            if t in {"Para", "Plain"} and isinstance(c, list):
-                scan_inlines_for_markers(c, start_ids, end_ids)
-            elif t == "Header" and isinstance(c, list) and len(c) >= 3 and isinstance(c[2], list):
-                scan_inlines_for_markers(c[2], start_ids, end_ids)
-
-        def block_markers_in_subtree(block):
-            starts = []
-            ends = []
-
-            def walk_block(node):
-                if not isinstance(node, dict):
-                    return
-                collect_block_markers(node, starts, ends)
-                t = node.get("t")
-                c = node.get("c")
-                if t == "BlockQuote" and isinstance(c, list):
-                    for child in c:
-                        walk_block(child)
-                    return
-                if t == "Div" and isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                    for child in c[1]:
-                        walk_block(child)
-                    return
-                if t == "BulletList" and isinstance(c, list):
-                    for item in c:
-                        if isinstance(item, list):
-                            for child in item:
-                                walk_block(child)
-                    return
-                if t == "OrderedList" and isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                    for item in c[1]:
-                        if isinstance(item, list):
-                            for child in item:
-                                walk_block(child)
-                    return
-                if t == "DefinitionList" and isinstance(c, list):
-                    for term, defs in c:
-                        scan_inlines_for_markers(term, starts, ends)
-                        for d in defs:
-                            if isinstance(d, list):
-                                for child in d:
-                                    walk_block(child)
-                    return
-                if t == "Table" and isinstance(c, list):
-                    for item in c:
-                        if isinstance(item, list):
-                            for maybe_block in item:
-                                if isinstance(maybe_block, dict):
-                                    walk_block(maybe_block)
-
-            walk_block(block)
-            return starts, ends
+        cards_by_root_id = {root_id: [build_thread_blockquote(root_id)] for root_id in start_order}
 
         top_blocks = doc.get("blocks", [])
-        first_start_index = {}
-        last_end_index = {}
-        root_set = set(start_order)
-        for idx, block in enumerate(top_blocks):
-            starts, ends = block_markers_in_subtree(block)
-            for cid in starts:
-                if cid in root_set and cid not in first_start_index:
-                    first_start_index[cid] = idx
-            for cid in ends:
-                if cid in root_set:
-                    last_end_index[cid] = idx
-
         cards_after_index = {}
         pending_append = []
         for cid in start_order:
@@ -1306,14 +1710,26 @@ def emit_milestones_and_cards_ast(
     return changed, len(start_order)
 
 
+def markdown_may_carry_comments(text: str) -> bool:
+    return any(hint in text for hint in COMMENT_TRANSPORT_HINTS)
+
+
 def normalize_milestone_tokens_ast(
     md_path: Path,
     out_md_path: Path,
     pandoc_extra_args=None,
     writer_format="markdown",
     cwd=None,
+    source_text=None,
 ):
-    doc = run_pandoc_json(md_path, fmt_from="markdown", extra_args=pandoc_extra_args)
+    if source_text is None:
+        source_text = md_path.read_text(encoding="utf-8")
+    if not markdown_may_carry_comments(source_text):
+        # No milestones or cards to rewrite: skip the pandoc round-trip entirely.
+        if md_path != out_md_path:
+            out_md_path.write_text(source_text, encoding="utf-8")
+        return 0, {}
+    doc = run_pandoc_json(md_path, fmt_from="markdown", extra_args=pandoc_extra_args, input_text=source_text)
     card_by_id, removed_cards = parse_comment_cards_from_doc(doc)
     changed = rewrite_milestone_tokens_in_doc(doc, card_by_id=card_by_id)
     if changed or removed_cards or md_path != out_md_path:
@@ -1327,10 +1743,26 @@ def normalize_milestone_tokens_ast(
     return changed, card_by_id
 
 
-def line_col_for_offset(text: str, offset: int):
+def newline_offsets(text: str):
+    offsets = []
+    pos = text.find("\n")
+    while pos >= 0:
+        offsets.append(pos)
+        pos = text.find("\n", pos + 1)
+    return offsets
+
+
+def line_col_for_offset(text: str, offset: int, newline_index=None):
+    # With newline_index from newline_offsets(text), a lookup is a bisect instead of a
+    # count/rfind scan from the top of the document.
     safe_offset = max(0, min(len(text or ""), int(offset)))
-    line = (text or "").count("\n", 0, safe_offset) + 1
-    last_newline = (text or "").rfind("\n", 0, safe_offset)
+    if newline_index is None:
+        line = (text or "").count("\n", 0, safe_offset) + 1
+        last_newline = (text or "").rfind("\n", 0, safe_offset)
+    else:
+        before = bisect.bisect_left(newline_index, safe_offset)
+        line = before + 1
+        last_newline = newline_index[before - 1] if before else -1
     col = safe_offset - (last_newline + 1) + 1
     return line, col
 
@@ -1345,45 +1777,74 @@ def line_excerpt(text: str, line_no: int, max_len: int = 140):
     return excerpt
 
 
-def collect_span_marker_positions(markdown_text: str):
-    starts_by_id = {}
-    ends_by_id = {}
+def kv_attr_values(attrs_text: str, keys):
+    # The requested keys of dict(KV_ATTR_RE.findall(attrs_text)), last occurrence winning,
+    # without building a dict entry for every other attribute.
+    found = {}
+    for key, value in KV_ATTR_RE.findall(attrs_text or ""):
+        if key in keys:
+            found[key] = value
+    return found
 
-    for match in COMMENT_START_ATTR_BLOCK_RE.finditer(markdown_text or ""):
-        attrs = {k: v for k, v in KV_ATTR_RE.findall(match.group("attrs"))}
-        comment_id = str(attrs.get("id") or "").strip()
-        if not comment_id:
-            continue
-        line_no, col_no = line_col_for_offset(markdown_text, match.start())
-        starts_by_id.setdefault(comment_id, []).append(
-            {"offset": match.start(), "line": line_no, "col": col_no}
-        )
 
-    for match in COMMENT_END_ATTR_BLOCK_RE.finditer(markdown_text or ""):
-        attrs = {k: v for k, v in KV_ATTR_RE.findall(match.group("attrs"))}
-        comment_id = str(attrs.get("id") or "").strip()
+def iter_comment_marker_blocks(markdown_text: str):
+    # ("start" | "end", match) for every comment marker block, in document order, from one
+    # pass over `{.comment-` candidates. Each kind resumes after its own previous match, as
+    # separate finditer scans would, so an unterminated start block cannot hide an end block.
+    text = markdown_text or ""
+    start_resume = end_resume = 0
+    pos = text.find("{.comment-")
+    while pos >= 0:
+        if text.startswith("start", pos + 10) and pos >= start_resume:
+            match = COMMENT_START_ATTR_BLOCK_RE.match(text, pos)
+            if match:
+                start_resume = match.end()
+                yield "start", match
+        elif text.startswith("end", pos + 10) and pos >= end_resume:
+            match = COMMENT_END_ATTR_BLOCK_RE.match(text, pos)
+            if match:
+                end_resume = match.end()
+                yield "end", match
+        pos = text.find("{.comment-", pos + 1)
+
+
+def collect_span_marker_positions(markdown_text: str):
+    text = markdown_text or ""
+    buckets = {"start": {}, "end": {}}
+    # Line numbers are advanced incrementally instead of recounted from the top for every marker.
+    line_no = 1
+    line_start = 0
+    counted = 0
+    for kind, match in iter_comment_marker_blocks(text):
+        comment_id = stripped_text(kv_attr_values(match.group("attrs"), ("id",)).get("id"))
         if not comment_id:
             continue
-        line_no, col_no = line_col_for_offset(markdown_text, match.start())
-        ends_by_id.setdefault(comment_id, []).append(
-            {"offset": match.start(), "line": line_no, "col": col_no}
-        )
+        pos = match.start()
+        newlines = text.count("\n", counted, pos)
+        if newlines:
+            line_no += newlines
+            line_start = text.rfind("\n", counted, pos) + 1
+        counted = pos
+        buckets[kind].setdefault(comment_id, []).append({"offset": pos, "line": line_no, "col": pos - line_start + 1})
 
-    return starts_by_id, ends_by_id
+    return buckets["start"], buckets["end"]
 
 
 def collect_root_card_lines(markdown_text: str):
     root_line_by_id = {}
+    newline_index = None
     for match in CARD_META_INLINE_RE.finditer(markdown_text or ""):
         comment_id, meta = parse_card_meta_marker(match.group(0) or "")
         if not comment_id:
             continue
-        parent_id = str((meta or {}).get("parent") or "").strip()
+        parent_id = stripped_text((meta or {}).get("parent"))
         if parent_id:
             continue
         if comment_id in root_line_by_id:
             continue
-        line_no, _ = line_col_for_offset(markdown_text, match.start())
+        if newline_index is None:
+            newline_index = newline_offsets(markdown_text)
+        line_no, _ = line_col_for_offset(markdown_text, match.start(), newline_index)
         root_line_by_id[comment_id] = line_no
     return root_line_by_id
 
@@ -1397,26 +1858,28 @@ def format_marker_locations(locations):
 def collect_one_sided_wrapper_issues(markdown_text: str):
     text = markdown_text or ""
     issues = []
-    for match in MILESTONE_CORE_TOKEN_RE.finditer(text):
+    # Without any `==` in the document there is no wrapper, one-sided or otherwise.
+    if "==" not in text:
+        return issues
+    newline_index = None
+    for match in find_milestone_matches(text):
         comment_id, edge = milestone_match_id_edge(match)
         if not comment_id or edge not in {"s", "e"}:
             continue
 
+        # Wrappers are probed, not consumed: adjacent tokens may share one `==`.
         left_idx = match.start()
         while left_idx > 0 and text[left_idx - 1] in {" ", "\t"}:
             left_idx -= 1
-        has_left_wrapper = left_idx >= 2 and text[left_idx - 2:left_idx] == "=="
-
-        right_idx = match.end()
-        text_len = len(text)
-        while right_idx < text_len and text[right_idx] in {" ", "\t"}:
-            right_idx += 1
-        has_right_wrapper = right_idx + 1 < text_len and text[right_idx:right_idx + 2] == "=="
+        has_left_wrapper = left_idx >= 2 and text.startswith("==", left_idx - 2)
+        has_right_wrapper = MILESTONE_RIGHT_WRAPPER_RE.match(text, match.end()) is not None
 
         if has_left_wrapper == has_right_wrapper:
             continue
 
-        line_no, col_no = line_col_for_offset(text, match.start())
+        if newline_index is None:
+            newline_index = newline_offsets(text)
+        line_no, col_no = line_col_for_offset(text, match.start(), newline_index)
         excerpt = line_excerpt(text, line_no)
         token = "START" if edge == "s" else "END"
         issue = (
@@ -1434,16 +1897,29 @@ def validate_comment_marker_integrity(source_text: str, normalized_text: str, ca
     starts_by_id, ends_by_id = collect_span_marker_positions(normalized_text)
     root_line_by_id = collect_root_card_lines(source_text)
     for comment_id, card in (card_by_id or {}).items():
-        cid = str(comment_id or "").strip()
+        cid = stripped_text(comment_id)
         if not cid:
             continue
-        if str((card or {}).get("parent") or "").strip():
+        if stripped_text((card or {}).get("parent")):
             continue
         root_line_by_id.setdefault(cid, 0)
 
     issues = []
-    all_ids = set(starts_by_id.keys()) | set(ends_by_id.keys()) | set(root_line_by_id.keys())
-    for comment_id in sorted(all_ids, key=lambda value: (len(value), value)):
+    balanced = (
+        starts_by_id.keys() == ends_by_id.keys()
+        and root_line_by_id.keys() <= starts_by_id.keys()
+        and all(
+            len(starts) == 1 and len(ends_by_id[cid]) == 1 and starts[0]["offset"] <= ends_by_id[cid][0]["offset"]
+            for cid, starts in starts_by_id.items()
+        )
+    )
+    if balanced:
+        # Every id has exactly one START before one END, so no per-id check below can fire.
+        check_ids = ()
+    else:
+        all_ids = set(starts_by_id.keys()) | set(ends_by_id.keys()) | set(root_line_by_id.keys())
+        check_ids = sorted(all_ids, key=lambda value: (len(value), value))
+    for comment_id in check_ids:
         starts = starts_by_id.get(comment_id, [])
         ends = ends_by_id.get(comment_id, [])
         start_count = len(starts)
@@ -1517,19 +1993,23 @@ def render_pandoc_json_to_markdown(
     extra_args=None,
     cwd=None,
 ):
-    with tempfile.TemporaryDirectory(prefix=".docx-comments-json-", dir=temp_dir_root_for(out_path)) as tmp:
-        tmp_dir = Path(tmp)
-        json_in = tmp_dir / "ast.json"
-        json_in.write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
-        render_args = pandoc_args_for_json_markdown_render(extra_args)
-        run_pandoc(
-            json_in,
-            out_path,
-            fmt_from="json",
-            fmt_to=writer_format or "markdown",
-            extra_args=render_args,
-            cwd=cwd,
-        )
+    render_args = pandoc_args_for_json_markdown_render(extra_args)
+    doc_json = JSON_TEXT_ENCODER.encode(doc)
+    if not pandoc_args_without_rts(render_args):
+        rendered = convert_with_pandoc_server(doc_json, "json", writer_format or "markdown")
+        if rendered is not None:
+            out_path.write_text(rendered, encoding="utf-8")
+            return
+    # The AST goes to pandoc over stdin rather than through a temporary ast.json.
+    run_pandoc(
+        None,
+        out_path,
+        fmt_from="json",
+        fmt_to=writer_format or "markdown",
+        extra_args=render_args,
+        cwd=cwd,
+        input_text=doc_json,
+    )
 
 
 def annotate_markdown_comment_attrs(
@@ -1553,7 +2033,11 @@ def annotate_markdown_comment_attrs(
         and not presence_user_by_id
     ):
         return 0
-    doc = run_pandoc_json(md_path, fmt_from="markdown", extra_args=pandoc_extra_args)
+    text = md_path.read_text(encoding="utf-8")
+    if "comment-" not in text:
+        # Only comment-start/comment-end spans are annotated.
+        return 0
+    doc = run_pandoc_json(md_path, fmt_from="markdown", extra_args=pandoc_extra_args, input_text=text)
 
     def on_span(attr):
         if not (isinstance(attr, list) and len(attr) == 3):
@@ -1561,35 +2045,35 @@ def annotate_markdown_comment_attrs(
         classes = attr[1] if isinstance(attr[1], list) else []
         kvs = attr[2] if isinstance(attr[2], list) else []
         changed_here = normalize_comment_span_id_attr(attr, classes, kvs)
-        identifier = str(attr[0] or "").strip()
+        identifier = stripped_text(attr[0])
         if "comment-start" not in classes:
             return changed_here
         kv = {}
         for item in kvs:
             if isinstance(item, list) and len(item) == 2:
                 kv[item[0]] = item[1]
-        cid = identifier or str(kv.get("id") or "").strip()
+        cid = identifier or stripped_text(kv.get("id"))
         if not cid:
             return changed_here
 
         pid = (parent_map or {}).get(cid)
         if pid and not kv.get("parent"):
-            changed_here = ensure_attr_pair(kvs, "parent", str(pid)) or changed_here
+            changed_here = ensure_attr_pair(kvs, "parent", str(pid), kv) or changed_here
         if not kv.get("state"):
             state_token = parse_state_token((state_by_id or {}).get(cid))
-            changed_here = ensure_attr_pair(kvs, "state", state_token) or changed_here
+            changed_here = ensure_attr_pair(kvs, "state", state_token, kv) or changed_here
         para_id = (para_by_id or {}).get(cid)
         if para_id and not kv.get("paraId"):
-            changed_here = ensure_attr_pair(kvs, "paraId", str(para_id)) or changed_here
+            changed_here = ensure_attr_pair(kvs, "paraId", str(para_id), kv) or changed_here
         durable_id = (durable_by_id or {}).get(cid)
         if durable_id and not kv.get("durableId"):
-            changed_here = ensure_attr_pair(kvs, "durableId", str(durable_id)) or changed_here
+            changed_here = ensure_attr_pair(kvs, "durableId", str(durable_id), kv) or changed_here
         presence_provider = (presence_provider_by_id or {}).get(cid)
         if presence_provider and not kv.get("presenceProvider"):
-            changed_here = ensure_attr_pair(kvs, "presenceProvider", str(presence_provider)) or changed_here
+            changed_here = ensure_attr_pair(kvs, "presenceProvider", str(presence_provider), kv) or changed_here
         presence_user = (presence_user_by_id or {}).get(cid)
         if presence_user and not kv.get("presenceUserId"):
-            changed_here = ensure_attr_pair(kvs, "presenceUserId", str(presence_user)) or changed_here
+            changed_here = ensure_attr_pair(kvs, "presenceUserId", str(presence_user), kv) or changed_here
         return changed_here
 
     changed = walk_pandoc_spans(doc, on_span)
@@ -1610,8 +2094,12 @@ def strip_comment_transport_attrs_ast(
     pandoc_extra_args=None,
     writer_format="markdown",
     cwd=None,
+    source_text=None,
+    doc=None,
 ):
-    doc = run_pandoc_json(md_path, fmt_from="markdown", extra_args=pandoc_extra_args)
+    # A caller that already parsed md_path may pass that AST as doc; it is edited in place.
+    if doc is None:
+        doc = run_pandoc_json(md_path, fmt_from="markdown", extra_args=pandoc_extra_args, input_text=source_text)
 
     def on_span(attr):
         if not (isinstance(attr, list) and len(attr) == 3):
@@ -1638,11 +2126,14 @@ def repair_unbalanced_comment_markers(markdown_text: str):
     starts = []
     end_positions_by_id = {}
 
-    for m in COMMENT_START_ATTR_BLOCK_RE.finditer(markdown_text):
-        attrs = {k: v for k, v in KV_ATTR_RE.findall(m.group("attrs"))}
+    for kind, m in iter_comment_marker_blocks(markdown_text):
+        attrs = kv_attr_values(m.group("attrs"), ("id", "parent"))
         cid = attrs.get("id")
         if not cid:
             continue
+        if kind == "end":
+            end_positions_by_id.setdefault(cid, []).append(m.end())
+            continue
         starts.append(
             {
                 "id": cid,
@@ -1651,13 +2142,6 @@ def repair_unbalanced_comment_markers(markdown_text: str):
             }
         )
 
-    for m in COMMENT_END_ATTR_BLOCK_RE.finditer(markdown_text):
-        attrs = {k: v for k, v in KV_ATTR_RE.findall(m.group("attrs"))}
-        cid = attrs.get("id")
-        if not cid:
-            continue
-        end_positions_by_id.setdefault(cid, []).append(m.end())
-
     start_ids = [s["id"] for s in starts]
     if not start_ids:
         return markdown_text, 0
@@ -1672,28 +2156,38 @@ def repair_unbalanced_comment_markers(markdown_text: str):
         if pid:
             children.setdefault(pid, []).append(s["id"])
 
-    def descendant_end_positions(cid, seen):
-        if cid in seen:
-            return []
-        seen.add(cid)
-        out = []
-        for child_id in children.get(cid, []):
-            out.extend(end_positions_by_id.get(child_id, []))
-            out.extend(descendant_end_positions(child_id, seen))
-        return out
+    def last_descendant_end(cid):
+        # Latest end marker among every reply reachable from cid; None when there is none.
+        last = None
+        seen = {cid}
+        stack = list(children.get(cid, []))
+        while stack:
+            child_id = stack.pop()
+            ends = end_positions_by_id.get(child_id)
+            if ends:
+                last = max(ends) if last is None else max(last, max(ends))
+            if child_id not in seen:
+                seen.add(child_id)
+                stack.extend(children.get(child_id, []))
+        return last
 
     insertions = []
     for cid in missing_ids:
         base = starts_by_id[cid]["pos_end"]
-        desc_ends = descendant_end_positions(cid, set())
-        pos = max(desc_ends) if desc_ends else base
+        desc_end = last_descendant_end(cid)
+        pos = base if desc_end is None else desc_end
         insertions.append((pos, f'[]{{.comment-end id="{cid}"}}'))
 
-    updated = markdown_text
-    for pos, token in sorted(insertions, key=lambda x: x[0], reverse=True):
-        updated = updated[:pos] + token + updated[pos:]
-
-    return updated, len(insertions)
+    # One forward pass over the text; markers sharing a position keep the reversed
+    # request order that back-to-front in-place insertion produced.
+    parts = []
+    last = 0
+    for pos, token in sorted(reversed(insertions), key=lambda x: x[0]):
+        parts.append(markdown_text[last:pos])
+        parts.append(token)
+        last = pos
+    parts.append(markdown_text[last:])
+    return "".join(parts), len(insertions)
 
 
 def strip_comment_transport_attrs(markdown_text: str):
@@ -1701,12 +2195,8 @@ def strip_comment_transport_attrs(markdown_text: str):
 
     def repl(match):
         nonlocal removed
-        block = match.group(0)
-        updated = re.sub(r'\s+paraId="[^"]*"', "", block)
-        updated = re.sub(r'\s+durableId="[^"]*"', "", updated)
-        updated = re.sub(r'\s+presenceProvider="[^"]*"', "", updated)
-        updated = re.sub(r'\s+presenceUserId="[^"]*"', "", updated)
-        if updated != block:
+        updated, count = COMMENT_TRANSPORT_ATTR_RE.subn("", match.group(0))
+        if count:
             removed += 1
         return updated
 
@@ -1732,32 +2222,42 @@ def normalize_nested_comment_end_markers(markdown_text: str):
     return updated, changed
 
 
+@functools.lru_cache(maxsize=4096)
 def normalize_markdown_comment_text(text: str) -> str:
+    # Memoized: each comment body is normalized again by card parsing, card rendering,
+    # and comment extraction within one conversion.
     text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
     # Pandoc emits hard line breaks in comment brackets as backslash-newline.
-    text = re.sub(r"\\+[ \t]*\n", "\n", text)
+    text = COMMENT_HARD_BREAK_RE.sub("\n", text)
     # Handle wrapped hard-break output forms like "\\ " conservatively.
-    text = re.sub(r"\\\\[ \t]+", "\n", text)
-    text = (
-        text.replace("\u2018", "'")
-        .replace("\u2019", "'")
-        .replace("\u201c", '"')
-        .replace("\u201d", '"')
-    )
-    text = re.sub(r"(?m)^[\u2014\u2015]\s*$", "---", text)
+    text = COMMENT_WRAPPED_BREAK_RE.sub("\n", text)
+    text = text.translate(SMART_QUOTE_TABLE)
+    text = COMMENT_DASH_LINE_RE.sub("---", text)
     return text.strip()
 
 
-def run_pandoc_json(in_path: Path, fmt_from=None, extra_args=None):
-    cmd = ["pandoc", str(in_path)]
+def run_pandoc_json(in_path: Path, fmt_from=None, extra_args=None, input_text=None):
+    # With input_text, the source is piped over stdin and in_path is not read.
+    if PANDOC_SERVER.get() is not None and fmt_from and not pandoc_args_without_rts(extra_args):
+        if input_text is None:
+            input_text = Path(in_path).read_text(encoding="utf-8")
+        served = convert_with_pandoc_server(input_text, fmt_from, "json")
+        if served is not None:
+            return PANDOC_JSON_LOADS(served)
+    cmd = ["pandoc"] if input_text is not None else ["pandoc", os.fspath(in_path)]
     if fmt_from:
         cmd.extend(["-f", fmt_from])
     if extra_args:
         cmd.extend(extra_args)
     cmd.extend(["-t", "json"])
-    # Pandoc emits UTF-8 JSON; force decoding so Windows locale codecs do not break.
-    out = subprocess.check_output(cmd, text=True, encoding="utf-8")
-    return json.loads(out)
+    # Pandoc emits UTF-8 JSON. json.loads decodes the raw bytes itself, so no locale codec
+    # is involved and no separately decoded, newline-translated copy of the output is made.
+    out = subprocess.check_output(
+        cmd,
+        input=None if input_text is None else input_text.encode("utf-8"),
+        timeout=PANDOC_TIMEOUT.get(),
+    )
+    return PANDOC_JSON_LOADS(out)
 
 
 def has_extract_media_arg(args):
@@ -1770,7 +2270,7 @@ def has_extract_media_arg(args):
 def parse_length_to_inches(length_value: str):
     if not length_value:
         return None
-    m = re.match(r"^\s*([0-9]*\.?[0-9]+(?:e[-+]?[0-9]+)?)\s*([a-zA-Z]*)\s*$", length_value)
+    m = LENGTH_VALUE_RE.match(length_value)
     if not m:
         return None
     value = float(m.group(1))
@@ -1789,22 +2289,22 @@ def parse_length_to_inches(length_value: str):
 
 
 def should_strip_placeholder_image(alt, src, title, attrs):
-    title = (title or "").strip().lower()
-    alt = (alt or "").strip()
-    if alt:
+    # Cheapest guards first; most images carry alt text or no "shape" title.
+    if alt and alt.strip():
         return False
-    if title != "shape":
+    if not title or title.strip().lower() != "shape":
         return False
 
     src_norm = (src or "").strip().lower()
-    if "/media/" not in f"/{src_norm}" and not src_norm.startswith("./media/"):
+    # Same as testing "/media/" in "/" + src_norm, which also covers "./media/".
+    if not src_norm.startswith("media/") and "/media/" not in src_norm:
         return False
 
     basename = Path(src_norm).name
-    if not re.match(r"^image[0-9]+\.(png|jpg|jpeg|gif|bmp|emf|wmf|svg)$", basename):
+    if not PLACEHOLDER_IMAGE_NAME_RE.match(basename):
         return False
 
-    kv = {k: v for k, v in KV_ATTR_RE.findall(attrs or "")}
+    kv = kv_attr_values(attrs, ("width", "height"))
     width_in = parse_length_to_inches(kv.get("width", ""))
     height_in = parse_length_to_inches(kv.get("height", ""))
     if width_in is None or height_in is None:
@@ -1827,18 +2327,32 @@ def strip_placeholder_shape_images(markdown_text: str):
 
     updated = INLINE_IMAGE_RE.sub(repl, markdown_text)
     # Normalize excess whitespace left behind by removals.
-    updated = re.sub(r"\n{3,}", "\n\n", updated).strip() + "\n"
+    updated = BLANK_LINE_RUN_RE.sub("\n\n", updated).strip() + "\n"
     return updated, removed
 
 
+def scan_tree_relative(root_dir: Path):
+    # DirEntry caches the entry type from the directory read, so no per-entry stat.
+    files = []
+    dirs = []
+    stack = [(os.fspath(root_dir), "")]
+    while stack:
+        path, prefix = stack.pop()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                rel = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(rel)
+                    stack.append((entry.path, rel + "/"))
+                elif entry.is_file():
+                    files.append(rel)
+    return files, dirs
+
+
 def list_files_relative(root_dir: Path):
     if not root_dir.exists():
         return set()
-    out = set()
-    for p in root_dir.rglob("*"):
-        if p.is_file():
-            out.add(p.relative_to(root_dir).as_posix())
-    return out
+    return set(scan_tree_relative(root_dir)[0])
 
 
 def extract_media_refs_from_markdown(markdown_text: str):
@@ -1868,12 +2382,11 @@ def prune_unreferenced_new_media(media_dir: Path, files_before, markdown_text: s
                 p.unlink()
                 removed += 1
     # Clean up empty directories left behind.
-    for d in sorted(media_dir.rglob("*"), reverse=True):
-        if d.is_dir():
-            try:
-                d.rmdir()
-            except OSError:
-                pass
+    for rel in sorted(scan_tree_relative(media_dir)[1], reverse=True):
+        try:
+            os.rmdir(media_dir / rel)
+        except OSError:
+            pass
     if media_dir.exists():
         try:
             media_dir.rmdir()
@@ -1884,78 +2397,35 @@ def prune_unreferenced_new_media(media_dir: Path, files_before, markdown_text: s
 
 def inlines_to_text(inlines):
     parts = []
-
-    def emit(text):
-        if text:
-            parts.append(text)
-
-    def walk_inline(node):
-        if not isinstance(node, dict):
-            return
+    stack = []
+    push_inline_children(list(inlines or []), stack)
+    while stack:
+        node = stack.pop()
         t = node.get("t")
         c = node.get("c")
+        # Str and Space make up most comment text; handle them without a handler call.
         if t == "Str":
-            emit(c or "")
-        elif t == "Space":
-            emit(" ")
-        elif t == "SoftBreak":
-            if parts and parts[-1].endswith("\\"):
-                parts[-1] = parts[-1].rstrip("\\")
-                emit("\n")
-            else:
-                emit(" ")
-        elif t == "LineBreak":
-            # Convert line break markers in markdown comments to real newlines.
-            if parts and parts[-1].endswith("\\"):
-                parts[-1] = parts[-1].rstrip("\\")
-            emit("\n")
-        elif t in {"Code", "Math"}:
-            if isinstance(c, list) and c:
-                emit(c[-1] or "")
-            elif isinstance(c, str):
-                emit(c)
-        elif t == "Span":
-            # Span c = [attr, inlines]
-            if isinstance(c, list) and len(c) == 2 and isinstance(c[1], list):
-                for item in c[1]:
-                    walk_inline(item)
-        elif t in {"Emph", "Strong", "Strikeout", "Superscript", "Subscript", "SmallCaps", "Underline"}:
-            # Emph/Strong/etc. c = inlines
-            if isinstance(c, list):
-                for item in c:
-                    walk_inline(item)
-        elif t == "Quoted":
-            # Quoted c = [quoteType, inlines]
-            if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                for item in c[1]:
-                    walk_inline(item)
-        elif t == "Cite":
-            # Cite c = [citations, inlines]
-            if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                for item in c[1]:
-                    walk_inline(item)
-        elif t in {"Link", "Image"}:
-            if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], list):
-                for item in c[1]:
-                    walk_inline(item)
-        elif t == "RawInline":
-            # Keep plain textual payload where possible.
-            if isinstance(c, list) and len(c) >= 2 and isinstance(c[1], str):
-                emit(c[1])
+            if c:
+                parts.append(c)
+            continue
+        if t == "Space":
+            parts.append(" ")
+            continue
+        handler = COMMENT_TEXT_HANDLERS.get(t)
+        if handler is not None:
+            handler(c, parts, stack)
         elif isinstance(c, list):
-            for item in c:
-                if isinstance(item, dict):
-                    walk_inline(item)
-
-    for item in inlines or []:
-        walk_inline(item)
+            # Fallback for rarely used inline constructors.
+            push_inline_children(c, stack)
     text = "".join(parts)
-    text = re.sub(r"[ \t]+\n", "\n", text)
+    text = TRAILING_LINE_SPACE_RE.sub("\n", text)
     return normalize_markdown_comment_text(text)
 
 
-def extract_comment_texts_from_markdown(md_path: Path, pandoc_extra_args, card_by_id=None):
-    doc = run_pandoc_json(md_path, fmt_from="markdown", extra_args=pandoc_extra_args)
+def extract_comment_texts_from_markdown(md_path: Path, pandoc_extra_args, card_by_id=None, source_text=None, doc=None):
+    # Only reads the AST, so a doc passed in can be reused by later passes.
+    if doc is None:
+        doc = run_pandoc_json(md_path, fmt_from="markdown", extra_args=pandoc_extra_args, input_text=source_text)
     own_text_by_id = {}
     children_by_id = {}
     meta_by_id = {}
@@ -2045,6 +2515,9 @@ def extract_comment_texts_from_markdown(md_path: Path, pandoc_extra_args, card_b
             if not isinstance(node, dict):
                 continue
             t = node.get("t")
+            if t in PANDOC_LEAF_TYPES:
+                # Atoms never hold a comment span; most nodes are Str/Space, so test them first.
+                continue
             c = node.get("c")
 
             if t == "Span" and isinstance(c, list) and len(c) == 2:
@@ -2059,20 +2532,7 @@ def extract_comment_texts_from_markdown(md_path: Path, pandoc_extra_args, card_b
                 walk_inlines(nested_inlines)
                 continue
 
-            if t == "Str":
-                continue
-
-            if t in {
-                "Emph",
-                "Strong",
-                "Strikeout",
-                "Superscript",
-                "Subscript",
-                "SmallCaps",
-                "Underline",
-                "Quoted",
-                "Cite",
-            } and isinstance(c, list):
+            if (t in INLINE_CONTAINER_TYPES or t in {"Quoted", "Cite"}) and isinstance(c, list):
                 tail = c[-1] if c else []
                 if isinstance(tail, list):
                     walk_inlines(tail)
@@ -2105,7 +2565,7 @@ def extract_comment_texts_from_markdown(md_path: Path, pandoc_extra_args, card_b
                 walk_blocks(c)
                 continue
 
-            if t in {"BulletList", "OrderedList"} and isinstance(c, list):
+            if t in LIST_BLOCK_TYPES and isinstance(c, list):
                 items = c if t == "BulletList" else (c[1] if len(c) > 1 else [])
                 for item in items:
                     walk_blocks(item)
@@ -2138,17 +2598,13 @@ def extract_comment_texts_from_markdown(md_path: Path, pandoc_extra_args, card_b
             return f"---\nReply from: {author} ({date})\n---"
         return f"---\nReply from: {author}\n---"
 
-    def flatten_comment(comment_id: str, seen):
-        if comment_id in seen:
-            return own_text_by_id.get(comment_id, "").strip()
-        seen.add(comment_id)
-
+    def flatten_comment(comment_id: str):
         parts = []
         own = own_text_by_id.get(comment_id, "").strip()
         if own:
             parts.append(own)
         for child_id in children_by_id.get(comment_id, []):
-            child_flat = flatten_comment(child_id, seen)
+            child_flat = flat_by_id[child_id]
             if child_flat:
                 parts.append(f"{reply_header(child_id)}\n{child_flat}")
         return "\n\n".join(parts).strip()
@@ -2209,30 +2665,26 @@ def extract_comment_texts_from_markdown(md_path: Path, pandoc_extra_args, card_b
     visit_state = {}
     cycle_issues = []
 
-    def detect_cycle(comment_id, stack):
-        state = visit_state.get(comment_id, 0)
-        if state == 1:
-            if comment_id in stack:
-                idx = stack.index(comment_id)
-                cycle = stack[idx:] + [comment_id]
-            else:
-                cycle = stack + [comment_id]
+    def detect_cycle(comment_id):
+        # Each comment has at most one parent, so the walk is a chain. Nodes are marked with
+        # the id the walk started from; reaching a node with this walk's mark means the chain
+        # looped back on itself, and only then is the cycle spelled out.
+        walk_mark = comment_id
+        while comment_id and comment_id not in visit_state:
+            visit_state[comment_id] = walk_mark
+            comment_id = valid_parent_by_id.get(comment_id)
+        if comment_id and visit_state.get(comment_id) == walk_mark:
+            cycle = [comment_id]
+            node = valid_parent_by_id[comment_id]
+            while node != comment_id:
+                cycle.append(node)
+                node = valid_parent_by_id[node]
+            cycle.append(comment_id)
             cycle_issues.append(" -> ".join(cycle))
-            return
-        if state == 2:
-            return
-
-        visit_state[comment_id] = 1
-        stack.append(comment_id)
-        parent_id = valid_parent_by_id.get(comment_id)
-        if parent_id:
-            detect_cycle(parent_id, stack)
-        stack.pop()
-        visit_state[comment_id] = 2
 
     for cid in ordered_started_ids:
-        if cid in valid_parent_by_id and visit_state.get(cid, 0) == 0:
-            detect_cycle(cid, [])
+        if cid in valid_parent_by_id and cid not in visit_state:
+            detect_cycle(cid)
 
     if invalid_parent_issues or cycle_issues:
         issues = []
@@ -2245,16 +2697,34 @@ def extract_comment_texts_from_markdown(md_path: Path, pandoc_extra_args, card_b
             + "\n- Fix parent IDs so every reply points to an existing comment and no cycles exist."
         )
 
-    flattened_by_id = {}
+    # With cycles rejected, threads form a forest: flatten every reply once, children
+    # before parents, and reuse the result for each ancestor.
+    flat_by_id = {}
     for cid in ordered_started_ids:
-        flattened_by_id[cid] = flatten_comment(cid, set())
+        if cid in flat_by_id:
+            continue
+        stack = [(cid, False)]
+        while stack:
+            comment_id, children_done = stack.pop()
+            if comment_id in flat_by_id:
+                continue
+            if children_done:
+                flat_by_id[comment_id] = flatten_comment(comment_id)
+                continue
+            stack.append((comment_id, True))
+            stack.extend((child_id, False) for child_id in children_by_id.get(comment_id, []))
 
     child_ids = set(valid_parent_by_id.keys())
-    root_ids = [cid for cid in ordered_started_ids if cid not in child_ids]
-    if not root_ids:
-        root_ids = list(ordered_started_ids)
-
+    root_ids = []
+    flattened_by_id = {}
+    text_by_id = {}
+    author_by_id = {}
+    date_by_id = {}
+    # One pass per id fills every result map; the stripped author also feeds presence_by_author.
     for cid in ordered_started_ids:
+        if cid not in child_ids:
+            root_ids.append(cid)
+        flattened_by_id[cid] = flat_by_id[cid]
         state_by_id[cid] = parse_state_token(state_by_id.get(cid))
         meta = meta_by_id.get(cid, {})
         author = (meta.get("author") or "").strip()
@@ -2266,15 +2736,11 @@ def extract_comment_texts_from_markdown(md_path: Path, pandoc_extra_args, card_b
                     "provider_id": provider_id,
                     "user_id": user_id,
                 }
-
-    text_by_id = {}
-    author_by_id = {}
-    date_by_id = {}
-    for cid in ordered_started_ids:
-        meta = meta_by_id.get(cid, {})
         text_by_id[cid] = normalize_markdown_comment_text(own_text_by_id.get(cid) or "")
-        author_by_id[cid] = (meta.get("author") or "").strip()
+        author_by_id[cid] = author
         date_by_id[cid] = (meta.get("date") or "").strip()
+    if not root_ids:
+        root_ids = list(ordered_started_ids)
 
     return {
         "ordered_ids": ordered_started_ids,
@@ -2298,51 +2764,73 @@ def append_comment_paragraph(
     with_annotation_ref=False,
     paragraph_attrs=None,
 ):
-    p = ET.SubElement(comment_elem, f"{{{W_NS}}}p")
+    p = ET.SubElement(comment_elem, W_P_TAG)
     if paragraph_attrs:
         for key, value in paragraph_attrs.items():
             p.set(key, value)
-    ppr = ET.SubElement(p, f"{{{W_NS}}}pPr")
-    pstyle = ET.SubElement(ppr, f"{{{W_NS}}}pStyle")
-    pstyle.set(f"{{{W_NS}}}val", "CommentText")
+    ppr = ET.SubElement(p, W_PPR_TAG)
+    ET.SubElement(ppr, W_PSTYLE_TAG, {W_VAL_ATTR: "CommentText"})
 
     if with_annotation_ref:
-        ref_r = ET.SubElement(p, f"{{{W_NS}}}r")
-        ref_rpr = ET.SubElement(ref_r, f"{{{W_NS}}}rPr")
-        ref_style = ET.SubElement(ref_rpr, f"{{{W_NS}}}rStyle")
-        ref_style.set(f"{{{W_NS}}}val", "CommentReference")
-        ET.SubElement(ref_r, f"{{{W_NS}}}annotationRef")
-
-    r = ET.SubElement(p, f"{{{W_NS}}}r")
-    t = ET.SubElement(r, f"{{{W_NS}}}t")
+        ref_r = ET.SubElement(p, W_R_TAG)
+        ref_rpr = ET.SubElement(ref_r, W_RPR_TAG)
+        ET.SubElement(ref_rpr, W_RSTYLE_TAG, {W_VAL_ATTR: "CommentReference"})
+        ET.SubElement(ref_r, W_ANNOTATION_REF_TAG)
+
+    r = ET.SubElement(p, W_R_TAG)
+    t = ET.SubElement(r, W_T_TAG)
     if text[:1].isspace() or text[-1:].isspace():
-        t.set(f"{{{XML_NS}}}space", "preserve")
+        t.set(XML_SPACE_ATTR, "preserve")
     t.text = text
 
 
 def topological_comment_order(ordered_ids, parent_by_id):
-    pending = [str(cid) for cid in ordered_ids or [] if str(cid)]
-    pending_set = set(pending)
-    emitted = []
-    while pending_set:
-        progressed = False
-        for cid in pending:
-            if cid not in pending_set:
-                continue
-            parent_id = str((parent_by_id or {}).get(cid) or "").strip()
-            if parent_id and parent_id in pending_set:
-                continue
-            emitted.append(cid)
-            pending_set.remove(cid)
-            progressed = True
-        if progressed:
-            continue
-        # Should be unreachable after cycle validation, but keep deterministic fallback.
-        for cid in pending:
-            if cid in pending_set:
-                emitted.append(cid)
-                pending_set.remove(cid)
-    return emitted
+    # Same order as repeated in-order passes over ordered_ids that emit each id once its
+    # parent is out: an id leaves at its first position after the parent's emission in
+    # the same pass, else at its first position in the next pass. Ids stuck behind a
+    # cycle go last.
+    positions_by_id = {}
+    for pos, cid in enumerate(ordered_ids or []):
+        cid = str(cid)
+        if cid:
+            positions_by_id.setdefault(cid, []).append(pos)
+    parent_by_id = parent_by_id or {}
+    parent_of = {}
+    for cid in positions_by_id:
+        parent_id = stripped_text(parent_by_id.get(cid))
+        if parent_id and parent_id in positions_by_id:
+            parent_of[cid] = parent_id
+    stuck = float("inf")
+    emitted_at = {}
+    for cid in positions_by_id:
+        chain = []
+        on_chain = set()
+        node = cid
+        while node not in emitted_at:
+            if node in on_chain:
+                for chained in chain:
+                    emitted_at[chained] = (stuck, positions_by_id[chained][0])
+                break
+            parent_id = parent_of.get(node)
+            if parent_id is None:
+                emitted_at[node] = (0, positions_by_id[node][0])
+                break
+            on_chain.add(node)
+            chain.append(node)
+            node = parent_id
+        for chained in reversed(chain):
+            if chained in emitted_at:
+                break
+            parent_pass, parent_pos = emitted_at[parent_of[chained]]
+            positions = positions_by_id[chained]
+            later = bisect.bisect_right(positions, parent_pos)
+            if parent_pass == stuck:
+                emitted_at[chained] = (stuck, positions[0])
+            elif later < len(positions):
+                emitted_at[chained] = (parent_pass, positions[later])
+            else:
+                emitted_at[chained] = (parent_pass + 1, positions[0])
+    return sorted(emitted_at, key=emitted_at.__getitem__)
 
 
 def rewrite_comments_from_markdown_threaded(
@@ -2352,33 +2840,36 @@ def rewrite_comments_from_markdown_threaded(
     author_by_id,
     date_by_id,
     parent_by_id,
+    xml_cache=None,
+    comment_order=None,
 ):
     comments_path = docx_dir / "word" / "comments.xml"
     if not comments_path.exists() or not ordered_ids:
         return 0
 
-    tree, root = read_xml(comments_path)
+    tree, root = xml_cache.load(comments_path) if xml_cache is not None else read_xml(comments_path)
     changed = False
 
-    for child in list(root):
-        if local_name(child.tag) == "comment":
-            root.remove(child)
-            changed = True
+    # Drop the old comments with one slice assignment; root.remove rescans the children each call.
+    kept = [child for child in root if local_name(child.tag) != "comment"]
+    if len(kept) != len(root):
+        root[:] = kept
+        changed = True
 
-    ordered = topological_comment_order(ordered_ids, parent_by_id)
+    ordered = comment_order if comment_order is not None else topological_comment_order(ordered_ids, parent_by_id)
     for cid in ordered:
-        comment = ET.SubElement(root, f"{{{W_NS}}}comment")
-        comment.set(f"{{{W_NS}}}id", str(cid))
+        attrib = {W_ID_ATTR: str(cid)}
 
-        author = str((author_by_id or {}).get(cid) or "").strip()
+        author = stripped_text((author_by_id or {}).get(cid))
         if author:
-            comment.set(f"{{{W_NS}}}author", author)
+            attrib[W_AUTHOR_ATTR] = author
 
-        date = str((date_by_id or {}).get(cid) or "").strip()
+        date = stripped_text((date_by_id or {}).get(cid))
         if date:
-            comment.set(f"{{{W_NS}}}date", date)
+            attrib[W_DATE_ATTR] = date
 
-        comment.set(f"{{{W_NS}}}initials", "DC")
+        attrib[W_INITIALS_ATTR] = "DC"
+        comment = ET.SubElement(root, W_COMMENT_TAG, attrib)
 
         raw = normalize_markdown_comment_text((text_by_id or {}).get(cid) or "")
         lines = raw.split("\n") if raw else [""]
@@ -2386,31 +2877,39 @@ def rewrite_comments_from_markdown_threaded(
         for line in lines:
             append_comment_paragraph(comment, line, with_annotation_ref=False)
 
-    write_xml(tree, comments_path)
+    if xml_cache is not None:
+        xml_cache.mark_dirty(comments_path)
+    else:
+        write_xml(tree, comments_path)
     return 1 if (changed or ordered) else 0
 
 
-def generate_unique_para_id(seed: str, used_para_ids):
+def generate_unique_hex_id(seed: str, used_ids):
+    # crc32(prefix + suffix) == crc32(suffix, crc32(prefix)): the seed is hashed once and each
+    # retry only feeds its counter digits, giving the same ids as hashing f"{seed}:{counter}".
+    seed_crc = zlib.crc32(f"{seed}:".encode("utf-8"))
     counter = 0
     while True:
-        candidate = f"{zlib.crc32(f'{seed}:{counter}'.encode('utf-8')) & 0xFFFFFFFF:08X}"
-        if candidate != "00000000" and candidate not in used_para_ids:
-            used_para_ids.add(candidate)
-            return candidate
+        crc = zlib.crc32(str(counter).encode("ascii"), seed_crc)
+        # Zero is never a valid id; reject it on the int before formatting.
+        if crc:
+            candidate = f"{crc:08X}"
+            if candidate not in used_ids:
+                used_ids.add(candidate)
+                return candidate
         counter += 1
 
 
+def generate_unique_para_id(seed: str, used_para_ids):
+    return generate_unique_hex_id(seed, used_para_ids)
+
+
 def generate_unique_durable_id(seed: str, used_durable_ids):
-    counter = 0
-    while True:
-        candidate = f"{zlib.crc32(f'{seed}:{counter}'.encode('utf-8')) & 0xFFFFFFFF:08X}"
-        if candidate != "00000000" and candidate not in used_durable_ids:
-            used_durable_ids.add(candidate)
-            return candidate
-        counter += 1
+    return generate_unique_hex_id(seed, used_durable_ids)
 
 
-def ensure_word_relationship(docx_dir: Path, rel_type: str, target: str):
+def ensure_word_relationships(docx_dir: Path, specs):
+    # Applies each (rel_type, target) in order with one read and at most one write of the rels part.
     rels_path = docx_dir / "word" / "_rels" / "document.xml.rels"
     if not rels_path.exists():
         return False
@@ -2418,29 +2917,37 @@ def ensure_word_relationship(docx_dir: Path, rel_type: str, target: str):
     tree, root = read_xml(rels_path)
     changed = False
     max_rid = 0
-    has_ext_rel = False
+    rels_by_type = {}
 
     for rel in root:
         if local_name(rel.tag) != "Relationship":
             continue
         rid = rel.attrib.get("Id", "")
-        m = re.match(r"^rId([0-9]+)$", rid)
-        if m:
-            max_rid = max(max_rid, int(m.group(1)))
-        current_type = rel.attrib.get("Type", "")
-        current_target = rel.attrib.get("Target", "")
-        if current_type == rel_type:
-            has_ext_rel = True
-            if current_target != target:
-                rel.attrib["Target"] = target
-                changed = True
-
-    if not has_ext_rel:
-        rel_ns = root.tag.split("}", 1)[0][1:] if root.tag.startswith("{") else PKG_REL_NS
+        # Plain "rId<digits>" ids skip the regex; isascii keeps non-ASCII digits out of int().
+        tail = rid[3:]
+        if rid.startswith("rId") and tail.isascii() and tail.isdigit():
+            max_rid = max(max_rid, int(tail))
+        else:
+            m = RELATIONSHIP_ID_RE.match(rid)
+            if m:
+                max_rid = max(max_rid, int(m.group(1)))
+        rels_by_type.setdefault(rel.attrib.get("Type", ""), []).append(rel)
+
+    rel_ns = root.tag.split("}", 1)[0][1:] if root.tag.startswith("{") else PKG_REL_NS
+    for rel_type, target in specs:
+        existing = rels_by_type.get(rel_type)
+        if existing:
+            for rel in existing:
+                if rel.attrib.get("Target", "") != target:
+                    rel.attrib["Target"] = target
+                    changed = True
+            continue
+        max_rid += 1
         rel = ET.SubElement(root, f"{{{rel_ns}}}Relationship")
-        rel.set("Id", f"rId{max_rid + 1}")
+        rel.set("Id", f"rId{max_rid}")
         rel.set("Type", rel_type)
         rel.set("Target", target)
+        rels_by_type[rel_type] = [rel]
         changed = True
 
     if changed:
@@ -2448,31 +2955,36 @@ def ensure_word_relationship(docx_dir: Path, rel_type: str, target: str):
     return changed
 
 
-def ensure_word_content_type_override(docx_dir: Path, part_name: str, content_type: str):
+def ensure_word_relationship(docx_dir: Path, rel_type: str, target: str):
+    return ensure_word_relationships(docx_dir, ((rel_type, target),))
+
+
+def ensure_word_content_type_overrides(docx_dir: Path, specs):
+    # Applies each (part_name, content_type) in order with one read and at most one write.
     content_types_path = docx_dir / "[Content_Types].xml"
     if not content_types_path.exists():
         return False
 
     tree, root = read_xml(content_types_path)
     changed = False
-    has_override = False
     ct_ns = root.tag.split("}", 1)[0][1:] if root.tag.startswith("{") else PKG_CT_NS
-
+    # Only the first override per part name is updated.
+    overrides_by_part = {}
     for elem in root:
-        if local_name(elem.tag) != "Override":
-            continue
-        current_part_name = elem.attrib.get("PartName", "")
-        if current_part_name == part_name:
-            has_override = True
+        if local_name(elem.tag) == "Override":
+            overrides_by_part.setdefault(elem.attrib.get("PartName", ""), elem)
+
+    for part_name, content_type in specs:
+        elem = overrides_by_part.get(part_name)
+        if elem is not None:
             if elem.attrib.get("ContentType", "") != content_type:
                 elem.attrib["ContentType"] = content_type
                 changed = True
-            break
-
-    if not has_override:
+            continue
         override = ET.SubElement(root, f"{{{ct_ns}}}Override")
         override.set("PartName", part_name)
         override.set("ContentType", content_type)
+        overrides_by_part[part_name] = override
         changed = True
 
     if changed:
@@ -2480,6 +2992,10 @@ def ensure_word_content_type_override(docx_dir: Path, part_name: str, content_ty
     return changed
 
 
+def ensure_word_content_type_override(docx_dir: Path, part_name: str, content_type: str):
+    return ensure_word_content_type_overrides(docx_dir, ((part_name, content_type),))
+
+
 def ensure_comments_extended_relationship(docx_dir: Path):
     return ensure_word_relationship(docx_dir, COMMENTS_EXT_REL_TYPE, "commentsExtended.xml")
 
@@ -2517,19 +3033,21 @@ def ensure_people_content_type(docx_dir: Path):
 
 
 def rewrite_people_part(docx_dir: Path, authors, presence_by_author=None):
-    people_root = ET.Element(f"{{{W15_NS}}}people")
-    for author in sorted({str(a).strip() for a in (authors or []) if str(a).strip()}):
-        person = ET.SubElement(people_root, f"{{{W15_NS}}}person")
-        person.set(f"{{{W15_NS}}}author", author)
-        presence = (presence_by_author or {}).get(author) or {}
-        provider_id = str(presence.get("provider_id") or "").strip()
-        user_id = str(presence.get("user_id") or "").strip()
+    people_root = ET.Element(W15_PEOPLE_TAG)
+    presence_by_author = presence_by_author or {}
+    # Each author is converted and stripped once.
+    for author in sorted({name for a in (authors or []) if (name := str(a).strip())}):
+        person = ET.SubElement(people_root, W15_PERSON_TAG)
+        person.set(W15_AUTHOR_ATTR, author)
+        presence = presence_by_author.get(author) or {}
+        provider_id = stripped_text(presence.get("provider_id"))
+        user_id = stripped_text(presence.get("user_id"))
         if provider_id or user_id:
-            presence_info = ET.SubElement(person, f"{{{W15_NS}}}presenceInfo")
+            presence_info = ET.SubElement(person, W15_PRESENCE_INFO_TAG)
             if provider_id:
-                presence_info.set(f"{{{W15_NS}}}providerId", provider_id)
+                presence_info.set(W15_PROVIDER_ID_ATTR, provider_id)
             if user_id:
-                presence_info.set(f"{{{W15_NS}}}userId", user_id)
+                presence_info.set(W15_USER_ID_ATTR, user_id)
     people_path = docx_dir / "word" / "people.xml"
     write_xml(ET.ElementTree(people_root), people_path)
     return True
@@ -2537,11 +3055,19 @@ def rewrite_people_part(docx_dir: Path, authors, presence_by_author=None):
 
 def ensure_comments_xml_state_compatibility(root: ET.Element):
     changed = False
-    current_ignorable = root.attrib.get(f"{{{MC_NS}}}Ignorable")
+    current_ignorable = root.attrib.get(MC_IGNORABLE_ATTR)
     if current_ignorable is not None:
+        # Already-normalized values skip the split/join: isprintable() rules out every
+        # separator str.split() knows except the ASCII space, which must be single and inner.
+        if (
+            current_ignorable.isprintable()
+            and "  " not in current_ignorable
+            and current_ignorable == current_ignorable.strip()
+        ):
+            return changed
         normalized = " ".join([tok for tok in str(current_ignorable).split() if tok])
         if normalized != current_ignorable:
-            root.set(f"{{{MC_NS}}}Ignorable", normalized)
+            root.set(MC_IGNORABLE_ATTR, normalized)
             changed = True
 
     return changed
@@ -2561,15 +3087,15 @@ def ensure_word_settings_modern_compatibility(docx_dir: Path, minimum_mode: int
             compat = child
             break
     if compat is None:
-        compat = ET.SubElement(root, f"{{{W_NS}}}compat")
+        compat = ET.SubElement(root, W_COMPAT_TAG)
         changed = True
 
     mode_entries = []
     for child in list(compat):
         if local_name(child.tag) != "compatSetting":
             continue
-        name = (get_attr_local(child, "name") or "").strip()
-        uri = (get_attr_local(child, "uri") or "").strip()
+        name = (get_attr_local(child, "name", W_NAME_ATTR) or "").strip()
+        uri = (get_attr_local(child, "uri", W_URI_ATTR) or "").strip()
         if name == "compatibilityMode" and uri == WORD_COMPAT_URI:
             mode_entries.append(child)
 
@@ -2580,28 +3106,28 @@ def ensure_word_settings_modern_compatibility(docx_dir: Path, minimum_mode: int
 
     desired_mode = str(int(minimum_mode))
     if mode_setting is None:
-        mode_setting = ET.Element(f"{{{W_NS}}}compatSetting")
-        mode_setting.set(f"{{{W_NS}}}name", "compatibilityMode")
-        mode_setting.set(f"{{{W_NS}}}uri", WORD_COMPAT_URI)
-        mode_setting.set(f"{{{W_NS}}}val", desired_mode)
+        mode_setting = ET.Element(W_COMPAT_SETTING_TAG)
+        mode_setting.set(W_NAME_ATTR, "compatibilityMode")
+        mode_setting.set(W_URI_ATTR, WORD_COMPAT_URI)
+        mode_setting.set(W_VAL_ATTR, desired_mode)
         compat.insert(0, mode_setting)
         changed = True
     else:
-        if (get_attr_local(mode_setting, "name") or "").strip() != "compatibilityMode":
-            mode_setting.set(f"{{{W_NS}}}name", "compatibilityMode")
+        if (get_attr_local(mode_setting, "name", W_NAME_ATTR) or "").strip() != "compatibilityMode":
+            mode_setting.set(W_NAME_ATTR, "compatibilityMode")
             changed = True
-        if (get_attr_local(mode_setting, "uri") or "").strip() != WORD_COMPAT_URI:
-            mode_setting.set(f"{{{W_NS}}}uri", WORD_COMPAT_URI)
+        if (get_attr_local(mode_setting, "uri", W_URI_ATTR) or "").strip() != WORD_COMPAT_URI:
+            mode_setting.set(W_URI_ATTR, WORD_COMPAT_URI)
             changed = True
 
-        current_mode = (get_attr_local(mode_setting, "val") or "").strip()
+        current_mode = (get_attr_local(mode_setting, "val", W_VAL_ATTR) or "").strip()
         current_mode_int = None
         try:
             current_mode_int = int(current_mode)
         except ValueError:
             current_mode_int = None
         if current_mode_int is None or current_mode_int < minimum_mode:
-            mode_setting.set(f"{{{W_NS}}}val", desired_mode)
+            mode_setting.set(W_VAL_ATTR, desired_mode)
             changed = True
 
     if changed:
@@ -2620,8 +3146,8 @@ def load_comments_ids_durable_map(docx_dir: Path):
     for elem in root.iter():
         if local_name(elem.tag) != "commentId":
             continue
-        para_id = get_attr_local(elem, "paraId")
-        durable_id = get_attr_local(elem, "durableId")
+        para_id = get_attr_local(elem, "paraId", W16CID_PARA_ID_ATTR)
+        durable_id = get_attr_local(elem, "durableId", W16CID_DURABLE_ID_ATTR)
         if durable_id:
             used_durable_ids.add(durable_id)
         if para_id and durable_id:
@@ -2637,12 +3163,14 @@ def rewrite_comments_extended_state(
     para_by_id=None,
     durable_by_id=None,
     presence_by_author=None,
+    xml_cache=None,
+    comment_order=None,
 ):
     comments_path = docx_dir / "word" / "comments.xml"
     if not comments_path.exists() or not ordered_ids:
         return 0
 
-    tree, root = read_xml(comments_path)
+    tree, root = xml_cache.load(comments_path) if xml_cache is not None else read_xml(comments_path)
     changed_comments_xml = False
     authors = set()
 
@@ -2651,8 +3179,10 @@ def rewrite_comments_extended_state(
 
     used_para_ids = set()
     comments_by_id = {}
-    for comment in root.findall(f".//{{{W_NS}}}comment"):
-        cid = get_attr_local(comment, "id")
+    # Paragraph lists are collected once here and reused when picking thread paragraphs.
+    paragraphs_by_id = {}
+    for comment in root.iter(W_COMMENT_TAG):
+        cid = get_attr_local(comment, "id", W_ID_ATTR)
         if cid is None:
             continue
         comments_by_id[cid] = comment
@@ -2663,92 +3193,97 @@ def rewrite_comments_extended_state(
         para_id = get_attr_local(comment, "paraId")
         if para_id:
             used_para_ids.add(para_id)
-        for p in comment.findall(f"./{{{W_NS}}}p"):
-            p_para_id = get_attr_local(p, "paraId")
+        paragraphs = comment.findall(W_P_TAG)
+        paragraphs_by_id[cid] = paragraphs
+        for p in paragraphs:
+            p_para_id = get_attr_local(p, "paraId", W14_PARA_ID_ATTR)
             if p_para_id:
                 used_para_ids.add(p_para_id)
 
     existing_durable_by_para, used_durable_ids = load_comments_ids_durable_map(docx_dir)
-    ordered = [cid for cid in topological_comment_order(ordered_ids, parent_by_id) if cid in comments_by_id]
+    if comment_order is None:
+        comment_order = topological_comment_order(ordered_ids, parent_by_id)
+    ordered = [cid for cid in comment_order if cid in comments_by_id]
     if not ordered:
         return 0
 
     comment_meta_by_id = {}
     for cid in ordered:
         comment = comments_by_id[cid]
-        paragraphs = comment.findall(f"./{{{W_NS}}}p")
+        paragraphs = paragraphs_by_id[cid]
         if not paragraphs:
             append_comment_paragraph(comment, "", with_annotation_ref=True)
-            paragraphs = comment.findall(f"./{{{W_NS}}}p")
+            paragraphs = comment.findall(W_P_TAG)
             changed_comments_xml = True
         thread_p = paragraphs[-1]
 
-        preferred_para_id = str((para_by_id or {}).get(cid) or "").strip()
-        para_id = get_attr_local(thread_p, "paraId") or get_attr_local(comment, "paraId")
+        preferred_para_id = stripped_text((para_by_id or {}).get(cid))
+        para_id = get_attr_local(thread_p, "paraId", W14_PARA_ID_ATTR) or get_attr_local(comment, "paraId")
         if preferred_para_id:
             if para_id != preferred_para_id:
-                thread_p.set(f"{{{W14_NS}}}paraId", preferred_para_id)
+                thread_p.set(W14_PARA_ID_ATTR, preferred_para_id)
                 changed_comments_xml = True
             para_id = preferred_para_id
         if not para_id:
             para_id = generate_unique_para_id(f"comment-{cid}", used_para_ids)
-            thread_p.set(f"{{{W14_NS}}}paraId", para_id)
+            thread_p.set(W14_PARA_ID_ATTR, para_id)
             changed_comments_xml = True
         else:
             used_para_ids.add(para_id)
 
-        durable_id = str((durable_by_id or {}).get(cid) or "").strip() or existing_durable_by_para.get(para_id)
+        durable_id = stripped_text((durable_by_id or {}).get(cid)) or existing_durable_by_para.get(para_id)
         if not durable_id:
             durable_id = generate_unique_durable_id(f"durable-{para_id}", used_durable_ids)
         else:
             used_durable_ids.add(durable_id)
 
-        author = (get_attr_local(comment, "author") or "").strip()
+        author = (get_attr_local(comment, "author", W_AUTHOR_ATTR) or "").strip()
         if author:
             authors.add(author)
 
         comment_meta_by_id[cid] = {
             "para_id": para_id,
             "durable_id": durable_id,
-            "date": get_attr_local(comment, "date") or "",
+            "date": get_attr_local(comment, "date", W_DATE_ATTR) or "",
         }
 
     if changed_comments_xml:
-        write_xml(tree, comments_path)
+        if xml_cache is not None:
+            xml_cache.mark_dirty(comments_path)
+        else:
+            write_xml(tree, comments_path)
 
-    comments_ext_root = ET.Element(f"{{{W15_NS}}}commentsEx")
+    # All three side parts are filled in one pass over the comments.
+    comments_ext_root = ET.Element(W15_COMMENTS_EX_TAG)
+    comments_ids_root = ET.Element(W16CID_COMMENTS_IDS_TAG)
+    comments_extensible_root = ET.Element(W16CEX_COMMENTS_EXTENSIBLE_TAG)
     for cid in ordered:
         meta = comment_meta_by_id.get(cid) or {}
         para_id = meta.get("para_id")
         if not para_id:
             continue
         state_token = parse_state_token((state_by_id or {}).get(cid))
-        entry = ET.SubElement(comments_ext_root, f"{{{W15_NS}}}commentEx")
-        entry.set(f"{{{W15_NS}}}paraId", para_id)
-        entry.set(f"{{{W15_NS}}}done", "1" if state_token == "resolved" else "0")
-        parent_id = str((parent_by_id or {}).get(cid) or "").strip()
+        entry = ET.SubElement(comments_ext_root, W15_COMMENT_EX_TAG)
+        entry.set(W15_PARA_ID_ATTR, para_id)
+        entry.set(W15_DONE_ATTR, "1" if state_token == "resolved" else "0")
+        parent_id = stripped_text((parent_by_id or {}).get(cid))
         if parent_id:
             parent_meta = comment_meta_by_id.get(parent_id) or {}
-            parent_para_id = str(parent_meta.get("para_id") or "").strip()
+            parent_para_id = stripped_text(parent_meta.get("para_id"))
             if parent_para_id:
-                entry.set(f"{{{W15_NS}}}paraIdParent", parent_para_id)
+                entry.set(W15_PARA_ID_PARENT_ATTR, parent_para_id)
 
-    comments_ids_root = ET.Element(f"{{{W16CID_NS}}}commentsIds")
-    comments_extensible_root = ET.Element(f"{{{W16CEX_NS}}}commentsExtensible")
-    for cid in ordered:
-        meta = comment_meta_by_id.get(cid) or {}
-        para_id = meta.get("para_id")
         durable_id = meta.get("durable_id")
         date_utc = meta.get("date") or ""
-        if not para_id or not durable_id:
+        if not durable_id:
             continue
-        id_entry = ET.SubElement(comments_ids_root, f"{{{W16CID_NS}}}commentId")
-        id_entry.set(f"{{{W16CID_NS}}}paraId", para_id)
-        id_entry.set(f"{{{W16CID_NS}}}durableId", durable_id)
-        ext_entry = ET.SubElement(comments_extensible_root, f"{{{W16CEX_NS}}}commentExtensible")
-        ext_entry.set(f"{{{W16CEX_NS}}}durableId", durable_id)
+        id_entry = ET.SubElement(comments_ids_root, W16CID_COMMENT_ID_TAG)
+        id_entry.set(W16CID_PARA_ID_ATTR, para_id)
+        id_entry.set(W16CID_DURABLE_ID_ATTR, durable_id)
+        ext_entry = ET.SubElement(comments_extensible_root, W16CEX_COMMENT_EXTENSIBLE_TAG)
+        ext_entry.set(W16CEX_DURABLE_ID_ATTR, durable_id)
         if date_utc:
-            ext_entry.set(f"{{{W16CEX_NS}}}dateUtc", date_utc)
+            ext_entry.set(W16CEX_DATE_UTC_ATTR, date_utc)
 
     comments_ext_path = docx_dir / "word" / "commentsExtended.xml"
     comments_ids_path = docx_dir / "word" / "commentsIds.xml"
@@ -2758,17 +3293,8 @@ def rewrite_comments_extended_state(
     write_xml(ET.ElementTree(comments_ids_root), comments_ids_path)
     write_xml(ET.ElementTree(comments_extensible_root), comments_extensible_path)
 
-    rel_changed = False
-    rel_changed |= ensure_comments_extended_relationship(docx_dir)
-    rel_changed |= ensure_comments_ids_relationship(docx_dir)
-    rel_changed |= ensure_comments_extensible_relationship(docx_dir)
-    rel_changed |= ensure_people_relationship(docx_dir)
-
-    ct_changed = False
-    ct_changed |= ensure_comments_extended_content_type(docx_dir)
-    ct_changed |= ensure_comments_ids_content_type(docx_dir)
-    ct_changed |= ensure_comments_extensible_content_type(docx_dir)
-    ct_changed |= ensure_people_content_type(docx_dir)
+    rel_changed = ensure_word_relationships(docx_dir, COMMENT_SIDE_PART_RELATIONSHIPS)
+    ct_changed = ensure_word_content_type_overrides(docx_dir, COMMENT_SIDE_PART_CONTENT_TYPES)
 
     return 1 if (changed_comments_xml or rel_changed or ct_changed or ordered) else 0
 
@@ -2785,7 +3311,22 @@ def word_story_xml_candidates(docx_dir: Path):
     return [p for p in candidates if p.exists()]
 
 
-def collect_story_marker_counts(docx_dir: Path):
+def iter_story_elements(xml_path: Path):
+    # Streams a story part in document order; each block is dropped once read, so a
+    # large document.xml is never held in memory whole. Attributes are set on "start".
+    path = []
+    for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            path.append(elem)
+            yield elem
+            continue
+        path.pop()
+        if len(path) == 2:
+            path[-1].remove(elem)
+
+
+def collect_story_marker_counts(docx_dir: Path, xml_cache=None):
+    # With xml_cache, the parsed stories stay cached for callers that edit them next.
     counts = {
         "start": {},
         "end": {},
@@ -2796,13 +3337,20 @@ def collect_story_marker_counts(docx_dir: Path):
         "commentRangeEnd": "end",
         "commentReference": "ref",
     }
-    for xml_path in word_story_xml_candidates(docx_dir):
-        _, root = read_xml(xml_path)
-        for elem in root.iter():
-            bucket = marker_to_bucket.get(local_name(elem.tag))
+    # Stories repeat a few dozen tags, so resolve each tag's bucket once.
+    bucket_by_tag = {}
+    story_paths = xml_cache.story_paths() if xml_cache is not None else word_story_xml_candidates(docx_dir)
+    for xml_path in story_paths:
+        # Only cached callers edit the stories afterwards; counting alone streams the part.
+        elems = xml_cache.load(xml_path)[1].iter() if xml_cache is not None else iter_story_elements(xml_path)
+        for elem in elems:
+            tag = elem.tag
+            if tag not in bucket_by_tag:
+                bucket_by_tag[tag] = marker_to_bucket.get(local_name(tag))
+            bucket = bucket_by_tag[tag]
             if not bucket:
                 continue
-            cid = (get_attr_local(elem, "id") or "").strip()
+            cid = (get_attr_local(elem, "id", W_ID_ATTR) or "").strip()
             if not cid:
                 continue
             counts[bucket][cid] = int(counts[bucket].get(cid, 0)) + 1
@@ -2821,51 +3369,61 @@ def synthesize_child_markers_in_story(
     parent_id = str(parent_id)
     child_id = str(child_id)
 
-    def is_marker(elem: ET.Element, marker_name: str, cid: str) -> bool:
-        if local_name(elem.tag) != marker_name:
-            return False
-        return (get_attr_local(elem, "id") or "").strip() == cid
-
     def make_marker(local_tag: str) -> ET.Element:
         marker = ET.Element(f"{{{W_NS}}}{local_tag}")
-        marker.set(f"{{{W_NS}}}id", child_id)
+        marker.set(W_ID_ATTR, child_id)
         return marker
 
+    marker_names = {"commentRangeStart", "commentRangeEnd", "commentReference"}
+    # Tag -> marker local name (None for everything else), resolved once per distinct tag.
+    marker_name_by_tag = {}
     for container in root.iter():
-        children = list(container)
-        if not children:
+        # Most elements are leaves; skip them before copying their (empty) child list.
+        if not len(container):
             continue
+        children = list(container)
         idx = 0
         while idx < len(children):
             elem = children[idx]
-
-            if need_start and inserted["start"] == 0 and is_marker(elem, "commentRangeStart", parent_id):
+            tag = elem.tag
+            if tag not in marker_name_by_tag:
+                tag_name = local_name(tag)
+                marker_name_by_tag[tag] = tag_name if tag_name in marker_names else None
+            lname = marker_name_by_tag[tag]
+            # Only comment markers have their id read.
+            is_parent_marker = lname is not None and (get_attr_local(elem, "id", W_ID_ATTR) or "").strip() == parent_id
+
+            if need_start and inserted["start"] == 0 and is_parent_marker and lname == "commentRangeStart":
                 insert_at = idx + 1
                 while insert_at < len(children) and local_name(children[insert_at].tag) == "commentRangeStart":
                     insert_at += 1
-                container.insert(insert_at, make_marker("commentRangeStart"))
+                marker = make_marker("commentRangeStart")
+                # Keep the local child list in step with the container instead of re-listing it.
+                container.insert(insert_at, marker)
+                children.insert(insert_at, marker)
                 inserted["start"] += 1
-                children = list(container)
                 idx = insert_at + 1
                 continue
 
-            if need_end and inserted["end"] == 0 and is_marker(elem, "commentRangeEnd", parent_id):
+            if need_end and inserted["end"] == 0 and is_parent_marker and lname == "commentRangeEnd":
                 insert_at = idx
                 while insert_at > 0 and local_name(children[insert_at - 1].tag) == "commentRangeEnd":
                     insert_at -= 1
-                container.insert(insert_at, make_marker("commentRangeEnd"))
+                marker = make_marker("commentRangeEnd")
+                container.insert(insert_at, marker)
+                children.insert(insert_at, marker)
                 inserted["end"] += 1
-                children = list(container)
                 idx += 1
                 continue
 
-            if need_ref and inserted["ref"] == 0 and is_marker(elem, "commentReference", parent_id):
+            if need_ref and inserted["ref"] == 0 and is_parent_marker and lname == "commentReference":
                 insert_at = idx + 1
                 while insert_at < len(children) and local_name(children[insert_at].tag) == "commentReference":
                     insert_at += 1
-                container.insert(insert_at, make_marker("commentReference"))
+                marker = make_marker("commentReference")
+                container.insert(insert_at, marker)
+                children.insert(insert_at, marker)
                 inserted["ref"] += 1
-                children = list(container)
                 idx = insert_at + 1
                 continue
 
@@ -2881,17 +3439,24 @@ def synthesize_child_markers_in_story(
     return inserted
 
 
-def ensure_thread_reply_anchors(docx_dir: Path, ordered_ids, parent_by_id):
-    child_ids = [str(cid) for cid in (ordered_ids or []) if str((parent_by_id or {}).get(str(cid)) or "").strip()]
+def ensure_thread_reply_anchors(docx_dir: Path, ordered_ids, parent_by_id, xml_cache=None, comment_order=None):
+    child_ids = [str(cid) for cid in (ordered_ids or []) if stripped_text((parent_by_id or {}).get(str(cid)))]
     if not child_ids:
         return 0
 
-    marker_counts = collect_story_marker_counts(docx_dir)
+    # Each story is parsed once; edits for every reply land on the same tree and are written at the end.
+    owns_cache = xml_cache is None
+    if owns_cache:
+        xml_cache = DocxXmlCache(docx_dir)
+    marker_counts = collect_story_marker_counts(docx_dir, xml_cache)
+    # Counts (reply, story) insertions, i.e. the story writes the per-reply rewrite used to make.
     changed_files = 0
     unresolved = []
 
-    for child_id in topological_comment_order(ordered_ids or [], parent_by_id or {}):
-        parent_id = str((parent_by_id or {}).get(str(child_id)) or "").strip()
+    if comment_order is None:
+        comment_order = topological_comment_order(ordered_ids or [], parent_by_id or {})
+    for child_id in comment_order:
+        parent_id = stripped_text((parent_by_id or {}).get(str(child_id)))
         if not parent_id:
             continue
         child_id = str(child_id)
@@ -2915,10 +3480,10 @@ def ensure_thread_reply_anchors(docx_dir: Path, ordered_ids, parent_by_id):
         need_end = not has_end
         need_ref = not has_ref
 
-        for xml_path in word_story_xml_candidates(docx_dir):
+        for xml_path in xml_cache.story_paths():
             if not (need_start or need_end or need_ref):
                 break
-            tree, root = read_xml(xml_path)
+            _, root = xml_cache.load(xml_path)
             inserted = synthesize_child_markers_in_story(
                 root,
                 parent_id=parent_id,
@@ -2928,7 +3493,7 @@ def ensure_thread_reply_anchors(docx_dir: Path, ordered_ids, parent_by_id):
                 need_ref=need_ref,
             )
             if inserted["start"] or inserted["end"] or inserted["ref"]:
-                write_xml(tree, xml_path)
+                xml_cache.mark_dirty(xml_path)
                 changed_files += 1
                 marker_counts["start"][child_id] = int(marker_counts["start"].get(child_id, 0)) + int(
                     inserted["start"]
@@ -2951,6 +3516,9 @@ def ensure_thread_reply_anchors(docx_dir: Path, ordered_ids, parent_by_id):
                 f"reply {child_id} still missing: {', '.join(missing)} (parent {parent_id})"
             )
 
+    if owns_cache:
+        xml_cache.flush()
+
     if unresolved:
         raise ValueError(
             "Unable to restore reply anchors required for threaded Word comments.\n"
@@ -2960,127 +3528,122 @@ def ensure_thread_reply_anchors(docx_dir: Path, ordered_ids, parent_by_id):
     return changed_files
 
 
+def remove_children_where(root: ET.Element, should_remove) -> int:
+    # One slice assignment per container that loses children, instead of an O(n) remove per
+    # match; removed subtrees are dropped before root.iter() would descend into them.
+    removed = 0
+    for parent in root.iter():
+        if not len(parent):
+            continue
+        kept = [child for child in parent if not should_remove(child)]
+        if len(kept) != len(parent):
+            removed += len(parent) - len(kept)
+            parent[:] = kept
+    return removed
+
+
 def prune_child_comment_artifacts(docx_dir: Path, child_ids):
     child_set = {str(cid) for cid in (child_ids or []) if str(cid)}
     if not child_set:
         return 0
 
     removed = 0
+    marker_names = {"commentRangeStart", "commentRangeEnd", "commentReference"}
 
-    # Remove child anchors/references in all word "story" XMLs.
-    for xml_path in word_story_xml_candidates(docx_dir):
+    def prune_part(xml_path, should_remove):
         tree, root = read_xml(xml_path)
-        changed = False
-        for parent in root.iter():
-            for child in list(parent):
-                lname = local_name(child.tag)
-                if lname not in {"commentRangeStart", "commentRangeEnd", "commentReference"}:
-                    continue
-                cid = get_attr_local(child, "id")
-                if cid in child_set:
-                    parent.remove(child)
-                    removed += 1
-                    changed = True
-        if changed:
+        count = remove_children_where(root, should_remove)
+        if count:
             write_xml(tree, xml_path)
+        return count
+
+    def is_child_marker(elem):
+        return local_name(elem.tag) in marker_names and get_attr_local(elem, "id", W_ID_ATTR) in child_set
+
+    # Remove child anchors/references in all word "story" XMLs.
+    for xml_path in word_story_xml_candidates(docx_dir):
+        removed += prune_part(xml_path, is_child_marker)
 
     # Remove child comment nodes from comments.xml and capture paraIds.
     child_para_ids = set()
+
+    def is_child_comment(elem):
+        if local_name(elem.tag) != "comment":
+            return False
+        if get_attr_local(elem, "id", W_ID_ATTR) not in child_set:
+            return False
+        para_id = get_attr_local(elem, "paraId")
+        if not para_id:
+            for node in elem.iter():
+                if local_name(node.tag) == "p":
+                    para_id = get_attr_local(node, "paraId", W14_PARA_ID_ATTR)
+                    if para_id:
+                        break
+        if para_id:
+            child_para_ids.add(para_id)
+        return True
+
     comments_path = docx_dir / "word" / "comments.xml"
     if comments_path.exists():
-        tree, root = read_xml(comments_path)
-        changed = False
-        for parent in root.iter():
-            for child in list(parent):
-                if local_name(child.tag) != "comment":
-                    continue
-                cid = get_attr_local(child, "id")
-                if cid not in child_set:
-                    continue
-                para_id = get_attr_local(child, "paraId")
-                if not para_id:
-                    for node in child.iter():
-                        if local_name(node.tag) == "p":
-                            para_id = get_attr_local(node, "paraId")
-                            if para_id:
-                                break
-                if para_id:
-                    child_para_ids.add(para_id)
-                parent.remove(child)
-                removed += 1
-                changed = True
-        if changed:
-            write_xml(tree, comments_path)
+        removed += prune_part(comments_path, is_child_comment)
 
     # Keep package internals consistent: prune child entries in extension/id files.
     if child_para_ids:
         child_durable_ids = set()
+
+        def is_child_comment_ex(elem):
+            return (
+                local_name(elem.tag) == "commentEx"
+                and get_attr_local(elem, "paraId", W15_PARA_ID_ATTR) in child_para_ids
+            )
+
+        def is_child_comment_id(elem):
+            if local_name(elem.tag) != "commentId":
+                return False
+            if get_attr_local(elem, "paraId", W16CID_PARA_ID_ATTR) not in child_para_ids:
+                return False
+            durable_id = get_attr_local(elem, "durableId", W16CID_DURABLE_ID_ATTR)
+            if durable_id:
+                child_durable_ids.add(durable_id)
+            return True
+
+        def is_child_comment_extensible(elem):
+            return (
+                local_name(elem.tag) == "commentExtensible"
+                and get_attr_local(elem, "durableId", W16CEX_DURABLE_ID_ATTR) in child_durable_ids
+            )
+
         comments_ext_path = docx_dir / "word" / "commentsExtended.xml"
         if comments_ext_path.exists():
-            tree, root = read_xml(comments_ext_path)
-            changed = False
-            for parent in root.iter():
-                for child in list(parent):
-                    if local_name(child.tag) != "commentEx":
-                        continue
-                    para_id = get_attr_local(child, "paraId")
-                    if para_id in child_para_ids:
-                        parent.remove(child)
-                        removed += 1
-                        changed = True
-            if changed:
-                write_xml(tree, comments_ext_path)
+            removed += prune_part(comments_ext_path, is_child_comment_ex)
 
         comments_ids_path = docx_dir / "word" / "commentsIds.xml"
         if comments_ids_path.exists():
-            tree, root = read_xml(comments_ids_path)
-            changed = False
-            for parent in root.iter():
-                for child in list(parent):
-                    if local_name(child.tag) != "commentId":
-                        continue
-                    para_id = get_attr_local(child, "paraId")
-                    if para_id in child_para_ids:
-                        durable_id = get_attr_local(child, "durableId")
-                        if durable_id:
-                            child_durable_ids.add(durable_id)
-                        parent.remove(child)
-                        removed += 1
-                        changed = True
-            if changed:
-                write_xml(tree, comments_ids_path)
+            removed += prune_part(comments_ids_path, is_child_comment_id)
 
         comments_extensible_path = docx_dir / "word" / "commentsExtensible.xml"
         if comments_extensible_path.exists() and child_durable_ids:
-            tree, root = read_xml(comments_extensible_path)
-            changed = False
-            for parent in root.iter():
-                for child in list(parent):
-                    if local_name(child.tag) != "commentExtensible":
-                        continue
-                    durable_id = get_attr_local(child, "durableId")
-                    if durable_id in child_durable_ids:
-                        parent.remove(child)
-                        removed += 1
-                        changed = True
-            if changed:
-                write_xml(tree, comments_extensible_path)
+            removed += prune_part(comments_extensible_path, is_child_comment_extensible)
 
     return removed
 
 
 def extract_comment_text(comment_elem: ET.Element) -> str:
     paragraphs = []
-    for p in comment_elem.iter(f"{{{W_NS}}}p"):
+    for p in comment_elem.iter(W_P_TAG):
         pieces = []
         for node in p.iter():
-            lname = local_name(node.tag)
-            if lname == "t" and node.text:
+            tag = node.tag
+            try:
+                piece = COMMENT_TEXT_PIECE_BY_TAG[tag]
+            except KeyError:
+                piece = COMMENT_TEXT_PIECE_BY_TAG[tag] = COMMENT_TEXT_PIECE_BY_NAME.get(local_name(tag))
+            if piece is None:
+                continue
+            if piece:
+                pieces.append(piece)
+            elif node.text:
                 pieces.append(node.text)
-            elif lname == "tab":
-                pieces.append("\t")
-            elif lname in {"br", "cr"}:
-                pieces.append("\n")
         text = "".join(pieces).strip()
         if text:
             paragraphs.append(text)
@@ -3089,8 +3652,8 @@ def extract_comment_text(comment_elem: ET.Element) -> str:
 
 def comment_paragraph_para_ids(comment_elem: ET.Element):
     para_ids = []
-    for p in comment_elem.findall(f"./{{{W_NS}}}p"):
-        para_id = get_attr_local(p, "paraId")
+    for p in comment_elem.findall(W_P_TAG):
+        para_id = get_attr_local(p, "paraId", W14_PARA_ID_ATTR)
         if para_id:
             para_ids.append(para_id)
     return para_ids
@@ -3115,16 +3678,18 @@ def parse_docx_comments(docx_dir: Path):
     para_to_id = {}
     durable_by_para = {}
     ordered_comment_ids = []
-    resolved_by_id = {}
 
     if comments_path.exists():
         _, root = read_xml(comments_path)
-        for idx, comment in enumerate(root.findall(f".//{{{W_NS}}}comment")):
-            cid = get_attr_local(comment, "id")
+        for idx, comment in enumerate(root.iter(W_COMMENT_TAG)):
+            cid = get_attr_local(comment, "id", W_ID_ATTR)
             if cid is None:
                 continue
-            author = get_attr_local(comment, "author") or ""
-            date = get_attr_local(comment, "date") or ""
+            # Ids recur as parent links and a few authors sign every comment; intern both so
+            # the returned maps share one string object per value.
+            cid = sys.intern(cid)
+            author = sys.intern(get_attr_local(comment, "author", W_AUTHOR_ATTR) or "")
+            date = get_attr_local(comment, "date", W_DATE_ATTR) or ""
             text = extract_comment_text(comment)
             para_id = comment_thread_para_id(comment)
             for p_para_id in comment_paragraph_para_ids(comment):
@@ -3133,9 +3698,8 @@ def parse_docx_comments(docx_dir: Path):
             if para_id:
                 para_to_id[para_id] = cid
             if parent:
-                parent_map[cid] = parent
+                parent_map[cid] = sys.intern(parent)
             ordered_comment_ids.append(cid)
-            resolved_by_id[cid] = False
             comments[cid] = {
                 "author": author,
                 "date": date,
@@ -3152,10 +3716,11 @@ def parse_docx_comments(docx_dir: Path):
         _, cid_root = read_xml(comments_ids_path)
         para_ids_in_order = []
         for elem in cid_root.iter():
-            if local_name(elem.tag) != "commentId":
+            # Qualified tag first; the local-name check only runs for other elements.
+            if elem.tag != W16CID_COMMENT_ID_TAG and local_name(elem.tag) != "commentId":
                 continue
-            para_id = get_attr_local(elem, "paraId")
-            durable_id = get_attr_local(elem, "durableId")
+            para_id = get_attr_local(elem, "paraId", W16CID_PARA_ID_ATTR)
+            durable_id = get_attr_local(elem, "durableId", W16CID_DURABLE_ID_ATTR)
             if para_id:
                 para_ids_in_order.append(para_id)
             if para_id and durable_id:
@@ -3175,19 +3740,16 @@ def parse_docx_comments(docx_dir: Path):
     if comments_ext_path.exists() and para_to_id:
         _, root = read_xml(comments_ext_path)
         for elem in root.iter():
-            if local_name(elem.tag) != "commentEx":
+            if elem.tag != W15_COMMENT_EX_TAG and local_name(elem.tag) != "commentEx":
                 continue
-            para_id = get_attr_local(elem, "paraId")
-            parent_para_id = get_attr_local(elem, "paraIdParent")
-            done = get_attr_local(elem, "done")
+            para_id = get_attr_local(elem, "paraId", W15_PARA_ID_ATTR)
+            parent_para_id = get_attr_local(elem, "paraIdParent", W15_PARA_ID_PARENT_ATTR)
+            done = get_attr_local(elem, "done", W15_DONE_ATTR)
             child_id = para_to_id.get(para_id) if para_id else None
             if child_id:
-                is_resolved = str(done or "").strip() == "1"
-                resolved_by_id[child_id] = is_resolved
-                if child_id in comments:
-                    comments[child_id]["resolved"] = is_resolved
-                    if para_id:
-                        comments[child_id]["para_id"] = para_id
+                # para_to_id only maps to ids parsed from comments.xml.
+                comments[child_id]["resolved"] = stripped_text(done) == "1"
+                comments[child_id]["para_id"] = para_id
             if not para_id or not parent_para_id:
                 continue
             parent_id = para_to_id.get(parent_para_id)
@@ -3201,9 +3763,6 @@ def parse_docx_comments(docx_dir: Path):
     for sibling_ids in children.values():
         sibling_ids.sort(key=lambda cid: comments[cid]["order"])
 
-    for cid in comments:
-        comments[cid]["resolved"] = bool(resolved_by_id.get(cid, False))
-
     return comments, parent_map, children
 
 
@@ -3217,7 +3776,7 @@ def parse_docx_people_presence(docx_dir: Path):
     for person in root.iter():
         if local_name(person.tag) != "person":
             continue
-        author = (get_attr_local(person, "author") or "").strip()
+        author = (get_attr_local(person, "author", W15_AUTHOR_ATTR) or "").strip()
         if not author:
             continue
         provider_id = ""
@@ -3225,8 +3784,8 @@ def parse_docx_people_presence(docx_dir: Path):
         for child in list(person):
             if local_name(child.tag) != "presenceInfo":
                 continue
-            provider_id = (get_attr_local(child, "providerId") or "").strip()
-            user_id = (get_attr_local(child, "userId") or "").strip()
+            provider_id = (get_attr_local(child, "providerId", W15_PROVIDER_ID_ATTR) or "").strip()
+            user_id = (get_attr_local(child, "userId", W15_USER_ID_ATTR) or "").strip()
             break
         if provider_id or user_id:
             presence_by_author[author] = {
@@ -3238,11 +3797,10 @@ def parse_docx_people_presence(docx_dir: Path):
 
 
 def collect_anchors_from_xml(xml_path: Path):
-    _, root = read_xml(xml_path)
     anchors = []
-    for elem in root.iter():
+    for elem in iter_story_elements(xml_path):
         if local_name(elem.tag) == "commentRangeStart":
-            cid = get_attr_local(elem, "id")
+            cid = get_attr_local(elem, "id", W_ID_ATTR)
             if cid is not None:
                 anchors.append(cid)
     return anchors
@@ -3308,21 +3866,21 @@ def flatten_thread(anchor_id: str, comments, parent_map, children):
 
 
 def make_comment_element(comment_id: str, author: str, date: str, text: str) -> ET.Element:
-    comment = ET.Element(f"{{{W_NS}}}comment")
-    comment.set(f"{{{W_NS}}}id", comment_id)
+    comment = ET.Element(W_COMMENT_TAG)
+    comment.set(W_ID_ATTR, comment_id)
     if author:
-        comment.set(f"{{{W_NS}}}author", author)
+        comment.set(W_AUTHOR_ATTR, author)
     if date:
-        comment.set(f"{{{W_NS}}}date", date)
-    comment.set(f"{{{W_NS}}}initials", "DC")
+        comment.set(W_DATE_ATTR, date)
+    comment.set(W_INITIALS_ATTR, "DC")
 
     lines = text.splitlines() if text else [""]
     for line in lines:
-        p = ET.SubElement(comment, f"{{{W_NS}}}p")
-        r = ET.SubElement(p, f"{{{W_NS}}}r")
-        t = ET.SubElement(r, f"{{{W_NS}}}t")
+        p = ET.SubElement(comment, W_P_TAG)
+        r = ET.SubElement(p, W_R_TAG)
+        t = ET.SubElement(r, W_T_TAG)
         if line[:1].isspace() or line[-1:].isspace():
-            t.set(f"{{{XML_NS}}}space", "preserve")
+            t.set(XML_SPACE_ATTR, "preserve")
         t.text = line
     return comment
 
@@ -3340,7 +3898,7 @@ def rewrite_comments_with_flattened_threads(docx_dir: Path):
     if not anchors:
         return 0
 
-    new_root = ET.Element(f"{{{W_NS}}}comments")
+    new_root = ET.Element(W_COMMENTS_TAG)
     count = 0
 
     for anchor_id in anchors:
@@ -3370,6 +3928,9 @@ def rewrite_comments_with_flattened_threads(docx_dir: Path):
 
 
 def convert_docx_to_md(in_docx: Path, out_md: Path, pandoc_extra_args):
+    if in_docx.stat().st_size == 0:
+        # A DOCX is a zip package even when the document is empty; zero bytes means corrupt.
+        raise ValueError(f"'{in_docx}' is empty (0 bytes) and is not a valid .docx package.")
     with tempfile.TemporaryDirectory(prefix=".docx-comments-", dir=temp_dir_root_for(in_docx)) as tmp:
         tmp_dir = Path(tmp)
         src_dir = tmp_dir / "src"
@@ -3397,8 +3958,8 @@ def convert_docx_to_md(in_docx: Path, out_md: Path, pandoc_extra_args):
             author = (meta.get("author") or "").strip()
             if author:
                 presence = people_presence_by_author.get(author) or {}
-                provider_id = str(presence.get("provider_id") or "").strip()
-                user_id = str(presence.get("user_id") or "").strip()
+                provider_id = stripped_text(presence.get("provider_id"))
+                user_id = stripped_text(presence.get("user_id"))
                 if provider_id:
                     presence_provider_by_id[cid] = provider_id
                 if user_id:
@@ -3459,25 +4020,22 @@ def convert_docx_to_md(in_docx: Path, out_md: Path, pandoc_extra_args):
         prune_unreferenced_new_media(media_dir, media_before, cleaned)
 
 
-def convert_md_to_docx(in_md: Path, out_docx: Path, pandoc_extra_args):
+def build_docx_from_markdown(in_md: Path, text: str, out_docx: Path, pandoc_extra_args):
     with tempfile.TemporaryDirectory(prefix=".docx-comments-mdinput-", dir=temp_dir_root_for(in_md)) as tmp:
         tmp_dir = Path(tmp)
-        sanitized_md = tmp_dir / "input.md"
         normalized_md = tmp_dir / "normalized.md"
         pandoc_input_md = tmp_dir / "pandoc-input.md"
-        text = in_md.read_text(encoding="utf-8")
         cleaned, _ = strip_placeholder_shape_images(text)
-        sanitized_md.write_text(cleaned, encoding="utf-8")
         _, card_by_id = normalize_milestone_tokens_ast(
-            sanitized_md,
+            in_md,
             normalized_md,
             pandoc_extra_args=pandoc_extra_args,
             writer_format="markdown",
             cwd=in_md.parent,
+            source_text=cleaned,
         )
         normalized_text = normalized_md.read_text(encoding="utf-8")
         normalized_text, _ = normalize_nested_comment_end_markers(normalized_text)
-        normalized_md.write_text(normalized_text, encoding="utf-8")
         validate_comment_marker_integrity(
             cleaned,
             normalized_text,
@@ -3485,10 +4043,19 @@ def convert_md_to_docx(in_md: Path, out_docx: Path, pandoc_extra_args):
             source_label=str(in_md),
         )
 
+        # Both passes read the same normalized markdown, so it is parsed once: extraction
+        # only reads the AST and the strip pass then edits it in place.
+        normalized_doc = run_pandoc_json(
+            normalized_md,
+            fmt_from="markdown",
+            extra_args=pandoc_extra_args,
+            input_text=normalized_text,
+        )
         comment_data = extract_comment_texts_from_markdown(
             normalized_md,
             pandoc_extra_args,
             card_by_id=card_by_id,
+            doc=normalized_doc,
         )
         strip_comment_transport_attrs_ast(
             normalized_md,
@@ -3496,10 +4063,10 @@ def convert_md_to_docx(in_md: Path, out_docx: Path, pandoc_extra_args):
             pandoc_extra_args=pandoc_extra_args,
             writer_format="markdown",
             cwd=in_md.parent,
+            doc=normalized_doc,
         )
         pandoc_text = pandoc_input_md.read_text(encoding="utf-8")
         pandoc_text, _ = normalize_nested_comment_end_markers(pandoc_text)
-        pandoc_input_md.write_text(pandoc_text, encoding="utf-8")
 
         run_pandoc(
             pandoc_input_md,
@@ -3507,15 +4074,34 @@ def convert_md_to_docx(in_md: Path, out_docx: Path, pandoc_extra_args):
             fmt_from="markdown",
             extra_args=pandoc_extra_args,
             cwd=in_md.parent,
+            input_text=pandoc_text,
         )
+    return comment_data
+
+
+def convert_md_to_docx(in_md: Path, out_docx: Path, pandoc_extra_args):
+    text = in_md.read_text(encoding="utf-8")
+    if text.strip():
+        comment_data = build_docx_from_markdown(in_md, text, out_docx, pandoc_extra_args)
+    else:
+        # Blank input carries no comments or markers; skip the AST passes.
+        comment_data = None
+        run_pandoc(in_md, out_docx, fmt_from="markdown", extra_args=pandoc_extra_args, cwd=in_md.parent)
     with tempfile.TemporaryDirectory(prefix=".docx-comments-md2docx-", dir=temp_dir_root_for(in_md)) as tmp:
         tmp_dir = Path(tmp)
         unpacked = tmp_dir / "docx"
         unpacked.mkdir(parents=True, exist_ok=True)
-        extract_docx(out_docx, unpacked)
+        # Media is never edited here, so it is not extracted; repacking re-compresses it from out_docx.
+        passthrough_names = extract_docx(out_docx, unpacked, member_filter=is_docx_xml_part)
         package_changed = ensure_word_settings_modern_compatibility(unpacked)
 
         if comment_data and comment_data.get("ordered_ids"):
+            # comments.xml and the story parts are parsed once across the passes below.
+            xml_cache = DocxXmlCache(unpacked)
+            # The passes below share one thread order instead of each recomputing it.
+            comment_order = topological_comment_order(
+                comment_data.get("ordered_ids", []), comment_data.get("parent_by_id", {})
+            )
             changed = rewrite_comments_from_markdown_threaded(
                 unpacked,
                 comment_data.get("ordered_ids", []),
@@ -3523,11 +4109,15 @@ def convert_md_to_docx(in_md: Path, out_docx: Path, pandoc_extra_args):
                 comment_data.get("author_by_id", {}),
                 comment_data.get("date_by_id", {}),
                 comment_data.get("parent_by_id", {}),
+                xml_cache=xml_cache,
+                comment_order=comment_order,
             )
             anchor_changed = ensure_thread_reply_anchors(
                 unpacked,
                 comment_data.get("ordered_ids", []),
                 comment_data.get("parent_by_id", {}),
+                xml_cache=xml_cache,
+                comment_order=comment_order,
             )
             state_updated = rewrite_comments_extended_state(
                 unpacked,
@@ -3537,13 +4127,16 @@ def convert_md_to_docx(in_md: Path, out_docx: Path, pandoc_extra_args):
                 comment_data.get("para_by_id", {}),
                 comment_data.get("durable_by_id", {}),
                 comment_data.get("presence_by_author", {}),
+                xml_cache=xml_cache,
+                comment_order=comment_order,
             )
+            xml_cache.flush()
             package_changed = package_changed or bool(changed or state_updated or anchor_changed)
 
         if not package_changed:
             return
         patched_docx = tmp_dir / "patched.docx"
-        pack_docx(unpacked, patched_docx)
+        pack_docx(unpacked, patched_docx, base_docx=out_docx, passthrough_names=passthrough_names)
         shutil.copyfile(patched_docx, out_docx)
 
 
@@ -3551,6 +4144,41 @@ def default_out_path(in_path: Path, suffix: str):
     return in_path.with_suffix(suffix)
 
 
+@functools.lru_cache(maxsize=32)
+def real_reference_doc_path(abs_path: str) -> str:
+    return os.path.realpath(abs_path)
+
+
+def resolve_reference_doc(path) -> str:
+    # Relative paths are taken from the current directory. The resolved form is memoized per
+    # absolute path, so a cwd change never reuses another folder's answer; the existence check
+    # runs on every call so a removed file still fails before any pandoc spawn.
+    resolved = real_reference_doc_path(os.path.abspath(path))
+    try:
+        os.stat(resolved)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"reference doc not found: {os.fspath(path)}") from None
+    return resolved
+
+
+def with_resolved_reference_doc(extra_args):
+    # md2docx runs pandoc from the input's folder; pin --reference-doc to the caller's cwd first.
+    out = []
+    args = list(extra_args or ())
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "--reference-doc" and i + 1 < len(args):
+            out.extend((arg, resolve_reference_doc(args[i + 1])))
+            i += 2
+            continue
+        if arg.startswith("--reference-doc="):
+            arg = "--reference-doc=" + resolve_reference_doc(arg.split("=", 1)[1])
+        out.append(arg)
+        i += 1
+    return out
+
+
 def detect_mode_from_path(input_path: Path) -> str:
     suffix = input_path.suffix.lower()
     if suffix == ".docx":
@@ -3563,6 +4191,20 @@ def detect_mode_from_path(input_path: Path) -> str:
     )
 
 
+def copy_if_same_format(input_path: Path, output_path: Path) -> bool:
+    # e.g. `dmc notes.md -o copy.md`: nothing to convert, so copy instead of running pandoc.
+    try:
+        same_format = detect_mode_from_path(input_path) == detect_mode_from_path(output_path)
+    except ValueError:
+        return False
+    if not same_format:
+        return False
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if not output_path.exists() or not os.path.samefile(input_path, output_path):
+        shutil.copyfile(input_path, output_path)
+    return True
+
+
 def normalize_argv(argv):
     # Backward compatibility: docx-comments docx2md input.docx -o out.md
     # becomes docx-comments --mode docx2md input.docx -o out.md
@@ -3602,11 +4244,9 @@ def parse_pandoc_version(version_output: str):
     return (major, minor, patch)
 
 
-def check_prerequisites():
-    pandoc_bin = shutil.which("pandoc")
-    if pandoc_bin is None:
-        raise RuntimeError("pandoc is not installed or not on PATH.")
-
+@functools.lru_cache(maxsize=None)
+def probe_pandoc_version(pandoc_bin: str):
+    # One `pandoc --version` spawn per binary and process; failures are not cached.
     proc = subprocess.run([pandoc_bin, "--version"], capture_output=True, text=True, check=False)
     if proc.returncode != 0:
         raise RuntimeError(f"failed to run pandoc --version (exit {proc.returncode}).")
@@ -3614,6 +4254,16 @@ def check_prerequisites():
     version = parse_pandoc_version(proc.stdout)
     if version is None:
         raise RuntimeError("could not parse pandoc version output.")
+    return version
+
+
+def check_prerequisites():
+    # Returns the pandoc version, which also keys the conversion cache.
+    pandoc_bin = shutil.which("pandoc")
+    if pandoc_bin is None:
+        raise RuntimeError("pandoc is not installed or not on PATH.")
+
+    version = probe_pandoc_version(pandoc_bin)
 
     minimum = MIN_PANDOC_VERSION + (0,)
     if version < minimum:
@@ -3622,23 +4272,128 @@ def check_prerequisites():
         raise RuntimeError(
             f"pandoc version {current} is too old; require at least {required}."
         )
+    return version
+
+
+def conversion_cache_dir() -> Path:
+    override = os.environ.get("DMC_CACHE_DIR")
+    if override:
+        return Path(override)
+    base = os.environ.get("XDG_CACHE_HOME")
+    return (Path(base) if base else Path.home() / ".cache") / "dmc"
+
 
+def update_digest_from_file(digest, path):
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
 
-def run_conversion(mode: str, input_path: Path, output_path: Path | None, pandoc_extra_args):
-    check_prerequisites()
+
+def markdown_local_resource_refs(markdown_text: str):
+    # Files the markdown pulls in (images, reference targets); URLs and fragments are skipped.
+    refs = set()
+    for pattern in (IMAGE_LINK_RE, LINK_REFERENCE_DEF_RE, HTML_IMG_SRC_RE):
+        for m in pattern.finditer(markdown_text):
+            src = urllib.parse.unquote(m.group("src"))
+            if src.startswith("#") or "://" in src or src.startswith(("data:", "mailto:")):
+                continue
+            refs.add(src)
+    return refs
+
+
+def is_conversion_cacheable(pandoc_extra_args) -> bool:
+    # A resource path makes pandoc search directories whose contents the key cannot cover.
+    return not any(arg == "--resource-path" or arg.startswith("--resource-path=") for arg in pandoc_extra_args)
+
+
+def conversion_cache_key(mode: str, input_path: Path, pandoc_extra_args, pandoc_version) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    version_token = ".".join(str(part) for part in pandoc_version)
+    digest.update(f"{__version__}\0{version_token}\0{mode}\0".encode("utf-8"))
+    digest.update(b"\0".join(os.fsencode(arg) for arg in pandoc_extra_args))
+    source = input_path.read_bytes()
+    digest.update(source)
+    # Files named by arguments (--reference-doc, --lua-filter, --defaults, ...) are hashed by
+    # content, so editing one invalidates outputs even when its path is unchanged. Relative
+    # paths are tried from the cwd and from the input's folder, where md2docx runs pandoc.
+    base_dir = input_path.parent
+    hashed = set()
+    for arg in pandoc_extra_args:
+        value = arg.split("=", 1)[1] if arg.startswith("--") and "=" in arg else arg
+        for candidate in {os.path.abspath(value), os.path.abspath(base_dir / value)}:
+            if candidate not in hashed and os.path.isfile(candidate):
+                hashed.add(candidate)
+                digest.update(os.fsencode(candidate))
+                update_digest_from_file(digest, candidate)
+    if mode == "md2docx":
+        for ref in sorted(markdown_local_resource_refs(source.decode("utf-8", errors="replace"))):
+            ref_path = base_dir / ref
+            digest.update(b"\0ref\0" + os.fsencode(ref))
+            if ref_path.is_file():
+                update_digest_from_file(digest, ref_path)
+            else:
+                digest.update(b"\0missing")
+    return digest.hexdigest()
+
+
+def store_cached_conversion(mode: str, out_path: Path, cached: Path):
+    if mode == "docx2md":
+        # Extracted media lives next to the markdown, so only media-free output is reusable.
+        if extract_media_refs_from_markdown(out_path.read_text(encoding="utf-8")):
+            return
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    staged = cached.with_name(f".{cached.name}.{os.getpid()}.{threading.get_ident()}")
+    shutil.copyfile(out_path, staged)
+    os.replace(staged, cached)
+
+
+def run_conversion(
+    mode: str,
+    input_path: Path,
+    output_path: Path | None,
+    pandoc_extra_args,
+    timeout=None,
+    use_server=False,
+    use_cache=False,
+):
+    pandoc_version = check_prerequisites()
+    pandoc_extra_args = list(pandoc_extra_args or ())
     resolved_mode = mode
     if resolved_mode == "auto":
         resolved_mode = detect_mode_from_path(input_path)
-
-    if resolved_mode == "docx2md":
-        out_md = output_path or default_out_path(input_path, ".md")
-        convert_docx_to_md(input_path, out_md, pandoc_extra_args)
-        return 0
+    if resolved_mode not in {"docx2md", "md2docx"}:
+        raise ValueError(f"Unknown mode: {resolved_mode}")
+    out_path = output_path or default_out_path(input_path, ".md" if resolved_mode == "docx2md" else ".docx")
     if resolved_mode == "md2docx":
-        out_docx = output_path or default_out_path(input_path, ".docx")
-        convert_md_to_docx(input_path, out_docx, pandoc_extra_args)
+        pandoc_extra_args = with_resolved_reference_doc(pandoc_extra_args)
+    # An explicit mode always converts; only auto mode treats same-format output as a copy.
+    # The copy is cheaper than a cache lookup, and its output is not in resolved_mode's format.
+    if mode == "auto" and copy_if_same_format(input_path, out_path):
         return 0
-    raise ValueError(f"Unknown mode: {resolved_mode}")
+
+    cached = None
+    if use_cache and is_conversion_cacheable(pandoc_extra_args):
+        key = conversion_cache_key(resolved_mode, input_path, pandoc_extra_args, pandoc_version)
+        cached = conversion_cache_dir() / f"{key}{out_path.suffix}"
+        if cached.is_file():
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(cached, out_path)
+            return 0
+
+    timeout_token = PANDOC_TIMEOUT.set(timeout)
+    # Only this call's passes use the server; later calls without use_server stay on the CLI.
+    server_token = PANDOC_SERVER.set(pandoc_server_for(pandoc_extra_args) if use_server else None)
+    try:
+        if resolved_mode == "docx2md":
+            convert_docx_to_md(input_path, out_path, pandoc_extra_args)
+        else:
+            convert_md_to_docx(input_path, out_path, pandoc_extra_args)
+    finally:
+        PANDOC_SERVER.reset(server_token)
+        PANDOC_TIMEOUT.reset(timeout_token)
+    if cached is not None:
+        store_cached_conversion(resolved_mode, out_path, cached)
+    return 0
 
 
 def legacy_main(argv=None, prog_name=None):
@@ -3647,6 +4402,7 @@ def legacy_main(argv=None, prog_name=None):
     args, pandoc_extra_args = parser.parse_known_args(normalize_argv(parsed_argv))
 
     try:
+        pandoc_extra_args = with_pandoc_rts_limits(pandoc_extra_args, DEFAULT_PANDOC_HEAP_MB, DEFAULT_PANDOC_STACK_MB)
         return run_conversion(args.mode, args.input, args.output, pandoc_extra_args)
     except subprocess.CalledProcessError as exc:
         print(f"pandoc failed (exit {exc.returncode}): {' '.join(exc.cmd)}", file=sys.stderr)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 import shutil
+import socket
 import subprocess
 import sys
 import tempfile
@@ -94,12 +95,16 @@ class TestCliEntrypoints(unittest.TestCase):
     def test_ref_option_maps_to_reference_doc(self):
         from dmc import commands
 
+        case_dir = Path(tempfile.mkdtemp(prefix="cli-ref-"))
+        template = case_dir / "template.docx"
+        shutil.copyfile(FIXTURE_DOCX, template)
+
         with mock.patch("dmc.commands.converter.run_conversion") as run_conversion:
             run_conversion.return_value = 0
             output = commands.run_md2docx(
                 Path("draft.md"),
                 output_path=Path("draft.docx"),
-                reference_doc=Path("template.docx"),
+                reference_doc=template,
                 pandoc_extra_args=["--track-changes"],
             )
 
@@ -114,7 +119,187 @@ class TestCliEntrypoints(unittest.TestCase):
         self.assertIn("--track-changes", extra)
         self.assertIn("--reference-doc", extra)
         ref_idx = extra.index("--reference-doc")
-        self.assertEqual(extra[ref_idx + 1], "template.docx")
+        self.assertEqual(extra[ref_idx + 1], os.path.realpath(template))
+
+    def test_run_auto_leaves_mode_detection_to_converter(self):
+        from dmc import commands
+
+        # Auto mode is what lets `dmc a.docx -o b.docx` copy instead of converting to markdown.
+        with mock.patch("dmc.commands.converter.run_conversion", return_value=0) as run_conversion:
+            commands.run_auto(Path("a.docx"), output_path=Path("b.docx"))
+        mode, input_path, output_path, _ = run_conversion.call_args.args
+        self.assertEqual((mode, input_path, output_path), ("auto", Path("a.docx"), Path("b.docx")))
+
+    def test_missing_reference_doc_fails_before_pandoc(self):
+        from dmc import commands
+
+        missing = Path(tempfile.mkdtemp(prefix="cli-ref-missing-")) / "missing.docx"
+        with mock.patch("dmc.commands.converter.run_conversion") as run_conversion:
+            with self.assertRaises(FileNotFoundError):
+                commands.run_md2docx(Path("draft.md"), reference_doc=missing)
+        run_conversion.assert_not_called()
+
+    def test_conversion_cache_tracks_referenced_files_and_pandoc_version(self):
+        from dmc import converter
+
+        case_dir = Path(tempfile.mkdtemp(prefix="cli-cache-"))
+        seed_md = case_dir / "seed.md"
+        figure = case_dir / "fig.png"
+        out_docx = case_dir / "out.docx"
+        seed_md.write_text("Figure: ![](fig.png)\n", encoding="utf-8")
+        figure.write_bytes(b"first")
+        conversions = []
+
+        def fake_convert(in_md, out_path, extra_args):
+            conversions.append(in_md)
+            out_path.write_bytes(b"docx")
+
+        with mock.patch.dict(os.environ, {"DMC_CACHE_DIR": str(case_dir / "cache")}), mock.patch(
+            "dmc.converter.check_prerequisites", return_value=(3, 1, 0)
+        ) as prerequisites, mock.patch("dmc.converter.convert_md_to_docx", side_effect=fake_convert):
+            for _ in range(2):
+                converter.run_conversion("md2docx", seed_md, out_docx, [], use_cache=True)
+            self.assertEqual(len(conversions), 1, "Second identical conversion should be a cache hit")
+            self.assertEqual(prerequisites.call_count, 2, "Cache hits must still check prerequisites")
+
+            figure.write_bytes(b"second")
+            converter.run_conversion("md2docx", seed_md, out_docx, [], use_cache=True)
+            self.assertEqual(len(conversions), 2, "Editing a referenced image must invalidate the cache")
+
+            prerequisites.return_value = (3, 2, 0)
+            converter.run_conversion("md2docx", seed_md, out_docx, [], use_cache=True)
+            self.assertEqual(len(conversions), 3, "Upgrading pandoc must invalidate the cache")
+
+    def test_async_and_batch_entry_points_apply_rts_caps(self):
+        import asyncio
+
+        from dmc import commands
+
+        with mock.patch("dmc.commands.converter.run_conversion", return_value=0) as run_conversion:
+            asyncio.run(commands.run_docx2md_async(Path("draft.docx"), heap_mb=256, timeout=30, use_cache=True))
+        mode, _, _, extra = run_conversion.call_args.args
+        self.assertEqual(mode, "docx2md")
+        self.assertEqual(extra[:3], ("+RTS", "-M256M", "-RTS"))
+        # The async wrappers take the same options as the sync run_* functions.
+        self.assertEqual(run_conversion.call_args.kwargs, {"timeout": 30, "use_cache": True})
+
+        tasks = commands._batch_tasks("md2docx", [Path("draft.md")], None, None, None, stack_mb=64, timeout=10)
+        self.assertEqual(tasks[0][3][:4], ("+RTS", f"-M{commands.DEFAULT_PANDOC_HEAP_MB}M", "-K64m", "-RTS"))
+        self.assertEqual(tasks[0][4], 10)
+
+    def test_legacy_entry_point_applies_rts_caps(self):
+        from dmc import converter
+
+        with mock.patch("dmc.converter.run_conversion", return_value=0) as run_conversion:
+            self.assertEqual(converter.legacy_main(["draft.docx", "--wrap=none"]), 0)
+        extra = run_conversion.call_args.args[3]
+        self.assertEqual(list(extra), ["+RTS", f"-M{converter.DEFAULT_PANDOC_HEAP_MB}M", "-RTS", "--wrap=none"])
+
+        with mock.patch("dmc.converter.run_conversion", return_value=0) as run_conversion:
+            converter.legacy_main(["draft.docx", "+RTS", "-M2G", "-RTS"])
+        self.assertEqual(list(run_conversion.call_args.args[3]), ["+RTS", "-M2G", "-RTS"])
+
+    def test_reference_doc_is_resolved_from_cwd_per_call(self):
+        from dmc import converter
+
+        case_dir = Path(tempfile.mkdtemp(prefix="cli-ref-cwd-"))
+        (case_dir / "a").mkdir()
+        (case_dir / "b").mkdir()
+        (case_dir / "doc").mkdir()
+        template = case_dir / "a" / "t.docx"
+        shutil.copyfile(FIXTURE_DOCX, template)
+        draft = case_dir / "doc" / "draft.md"
+        draft.write_text("Body.\n", encoding="utf-8")
+        previous_cwd = os.getcwd()
+        self.addCleanup(os.chdir, previous_cwd)
+
+        os.chdir(case_dir / "a")
+        self.assertEqual(converter.resolve_reference_doc("t.docx"), os.path.realpath(template))
+        # The pass-through flag of docx-comments follows the same cwd-relative rule as --ref.
+        with mock.patch("dmc.converter.check_prerequisites", return_value=(3, 1, 0)), mock.patch(
+            "dmc.converter.convert_md_to_docx"
+        ) as convert:
+            converter.run_conversion("md2docx", draft, None, ["--reference-doc=t.docx"])
+        self.assertEqual(convert.call_args.args[2], [f"--reference-doc={os.path.realpath(template)}"])
+
+        template.unlink()
+        os.chdir(case_dir / "b")
+        with self.assertRaises(FileNotFoundError):
+            converter.resolve_reference_doc("t.docx")
+
+    def test_run_batch_converts_each_input(self):
+        from dmc import commands
+
+        case_dir = Path(tempfile.mkdtemp(prefix="cli-batch-"))
+        out_dir = case_dir / "out"
+        inputs = []
+        for idx in range(3):
+            seed_md = case_dir / f"seed{idx}.md"
+            seed_md.write_text(f"Batch conversion paragraph {idx}.\n", encoding="utf-8")
+            inputs.append(seed_md)
+
+        results = commands.run_batch("auto", inputs, output_dir=out_dir, processes=2)
+
+        self.assertEqual(results, [0, 0, 0])
+        for seed_md in inputs:
+            self.assertTrue((out_dir / f"{seed_md.stem}.docx").exists(), f"Missing batch output for {seed_md.name}")
+
+    def test_run_batch_rejects_colliding_outputs(self):
+        from dmc import commands
+
+        case_dir = Path(tempfile.mkdtemp(prefix="cli-batch-collide-"))
+        inputs = []
+        for folder in ("a", "b"):
+            seed_md = case_dir / folder / "x.md"
+            seed_md.parent.mkdir()
+            seed_md.write_text("Same stem, different folder.\n", encoding="utf-8")
+            inputs.append(seed_md)
+
+        with mock.patch("dmc.commands.multiprocessing.Pool") as pool_cls:
+            with self.assertRaises(ValueError):
+                commands.run_batch("auto", inputs, output_dir=case_dir / "out")
+        pool_cls.assert_not_called()
+
+    def test_run_batch_workers_attach_to_shared_server(self):
+        from dmc import commands
+
+        url = "http://127.0.0.1:3030"
+        with mock.patch("dmc.commands.converter.enable_pandoc_server", return_value=True), mock.patch(
+            "dmc.commands.converter.pandoc_server_url", return_value=url
+        ), mock.patch("dmc.commands.multiprocessing.Pool") as pool_cls:
+            pool = pool_cls.return_value.__enter__.return_value
+            pool.starmap.return_value = [0]
+            results = commands.run_batch("md2docx", [Path("draft.md")], use_server=True)
+
+        self.assertEqual(results, [0])
+        _, kwargs = pool_cls.call_args
+        self.assertIs(kwargs["initializer"], commands.converter.attach_pandoc_server)
+        rts_args = tuple(commands.converter.pandoc_rts_args(pool.starmap.call_args.args[1][0][3]))
+        self.assertEqual(kwargs["initargs"], (url, rts_args))
+        self.assertTrue(pool.starmap.call_args.args[1][0][5], "Batch tasks must opt in to the server")
+
+    def test_pandoc_server_is_scoped_to_opted_in_conversions(self):
+        from dmc import converter
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            dead_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        rts_args = ("+RTS", "-M64M", "-RTS")
+        converter.attach_pandoc_server(dead_url, rts_args)
+        self.addCleanup(converter.disable_pandoc_server)
+
+        # Attached but not opted in: the CLI path runs.
+        self.assertIsNone(converter.convert_with_pandoc_server("x", "markdown", "json"))
+
+        server = converter.pandoc_server_for(list(rts_args))
+        self.assertEqual(server.url, dead_url)
+        token = converter.PANDOC_SERVER.set(server)
+        try:
+            # An unreachable server falls back to the CLI for the rest of the conversion.
+            self.assertIsNone(converter.convert_with_pandoc_server("x", "markdown", "json"))
+            self.assertIsNone(converter.PANDOC_SERVER.get())
+        finally:
+            converter.PANDOC_SERVER.reset(token)
 
     def test_legacy_converter_still_operates(self):
         case_dir = Path(tempfile.mkdtemp(prefix="cli-legacy-"))
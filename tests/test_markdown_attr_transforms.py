@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import json
+import os
 import re
 import runpy
 import shutil
 import tempfile
 import unittest
+import zipfile
 from unittest import mock
 from pathlib import Path
 
@@ -12,6 +15,7 @@ from tests.helpers.markdown_inspector import extract_comment_start_attrs
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 CONVERTER_PATH = REPO_ROOT / "docx-comments"
+FIXTURE_DOCX = REPO_ROOT / "Preregistration_Original.docx"
 
 
 class TestMarkdownAttrTransforms(unittest.TestCase):
@@ -99,6 +103,23 @@ class TestMarkdownAttrTransforms(unittest.TestCase):
         self.assertNotIn("presenceProvider", attrs["20"])
         self.assertNotIn("presenceUserId", attrs["20"])
 
+    def test_strip_transport_attrs_reuses_parsed_doc(self) -> None:
+        strip_ast = self.converter_mod["strip_comment_transport_attrs_ast"]
+        out_md = Path(tempfile.mkdtemp(prefix="ast-strip-doc-")) / "output.md"
+        attr = ["", ["comment-start"], [["id", "7"], ["paraId", "AAAA0001"], ["durableId", "BBBB0002"]]]
+        doc = {
+            "pandoc-api-version": [1, 23, 1],
+            "meta": {},
+            "blocks": [{"t": "Para", "c": [{"t": "Span", "c": [attr, [{"t": "Str", "c": "anchor"}]]}]}],
+        }
+
+        with mock.patch("subprocess.check_output") as check_output, mock.patch("subprocess.run"):
+            changed = strip_ast(out_md.parent / "unused.md", out_md, doc=doc)
+
+        check_output.assert_not_called()
+        self.assertEqual(changed, 1)
+        self.assertEqual(attr[2], [["id", "7"]])
+
     def test_writer_passthrough_helpers(self) -> None:
         resolve_writer = self.converter_mod["resolve_pandoc_writer_format"]
         render_args = self.converter_mod["pandoc_args_for_json_markdown_render"]
@@ -126,20 +147,61 @@ class TestMarkdownAttrTransforms(unittest.TestCase):
 
     def test_run_pandoc_json_uses_utf8_decode(self) -> None:
         run_pandoc_json = self.converter_mod["run_pandoc_json"]
-        fake_doc = '{"pandoc-api-version":[1,23,1],"meta":{},"blocks":[]}'
+        fake_doc = '{"pandoc-api-version":[1,23,1],"meta":{},"blocks":[{"t":"Para","c":[{"t":"Str","c":"Zürich"}]}]}'
 
-        with mock.patch("subprocess.check_output", return_value=fake_doc) as check_output:
+        with mock.patch("subprocess.check_output", return_value=fake_doc.encode("utf-8")) as check_output:
             parsed = run_pandoc_json(Path("input.md"), fmt_from="markdown", extra_args=["--wrap=none"])
 
-        self.assertEqual(parsed.get("blocks"), [])
+        self.assertEqual(parsed.get("blocks"), [{"t": "Para", "c": [{"t": "Str", "c": "Zürich"}]}])
         self.assertEqual(parsed.get("meta"), {})
         check_output.assert_called_once()
         args, kwargs = check_output.call_args
         self.assertIn("pandoc", args[0][0])
         self.assertIn("-f", args[0])
         self.assertIn("markdown", args[0])
-        self.assertTrue(kwargs.get("text"))
-        self.assertEqual(kwargs.get("encoding"), "utf-8")
+        # Raw bytes go straight to json.loads, which decodes UTF-8 regardless of locale.
+        self.assertFalse(kwargs.get("text"))
+        self.assertIsNone(kwargs.get("encoding"))
+
+    def test_run_pandoc_json_pipes_input_text_over_stdin(self) -> None:
+        run_pandoc_json = self.converter_mod["run_pandoc_json"]
+        fake_doc = '{"pandoc-api-version":[1,23,1],"meta":{},"blocks":[]}'
+
+        with mock.patch("subprocess.check_output", return_value=fake_doc.encode("utf-8")) as check_output:
+            run_pandoc_json(Path("unused.md"), fmt_from="markdown", input_text="Piped *text* in Zürich.\n")
+
+        args, kwargs = check_output.call_args
+        self.assertNotIn("unused.md", args[0])
+        self.assertEqual(kwargs.get("input"), "Piped *text* in Zürich.\n".encode("utf-8"))
+
+    def test_render_pandoc_json_pipes_ast_over_stdin(self) -> None:
+        render = self.converter_mod["render_pandoc_json_to_markdown"]
+        doc = {"pandoc-api-version": [1, 23, 1], "meta": {}, "blocks": [{"t": "Para", "c": [{"t": "Str", "c": "Zürich"}]}]}
+        out_md = Path(tempfile.mkdtemp(prefix="render-stdin-")) / "out.md"
+
+        with mock.patch("subprocess.run") as run:
+            render(doc, out_md)
+
+        args, kwargs = run.call_args
+        self.assertEqual(args[0][:3], ["pandoc", "-f", "json"])
+        self.assertEqual(args[0][-2:], ["-o", str(out_md)])
+        self.assertEqual(json.loads(kwargs.get("input").decode("utf-8")), doc)
+
+    def test_milestone_normalization_skips_pandoc_without_comment_markup(self) -> None:
+        normalize_tokens = self.converter_mod["normalize_milestone_tokens_ast"]
+        work_dir = Path(tempfile.mkdtemp(prefix="ast-milestone-skip-"))
+        in_md = work_dir / "input.md"
+        out_md = work_dir / "output.md"
+        in_md.write_text("Plain paragraph with ==highlight== and no comments.\n", encoding="utf-8")
+
+        with mock.patch("subprocess.check_output") as check_output, mock.patch("subprocess.run") as run:
+            replaced, card_by_id = normalize_tokens(in_md, out_md)
+
+        check_output.assert_not_called()
+        run.assert_not_called()
+        self.assertEqual(replaced, 0)
+        self.assertEqual(card_by_id, {})
+        self.assertEqual(out_md.read_text(encoding="utf-8"), in_md.read_text(encoding="utf-8"))
 
     def test_milestone_tokens_expand_with_flexible_spacing(self) -> None:
         normalize_tokens = self.converter_mod["normalize_milestone_tokens_ast"]
@@ -208,6 +270,13 @@ class TestMarkdownAttrTransforms(unittest.TestCase):
         normalized = source
         validate_markers(source, normalized, card_by_id={}, source_label="ok.md")
 
+    def test_repair_markers_sees_end_inside_unclosed_start(self) -> None:
+        repair = self.converter_mod["repair_unbalanced_comment_markers"]
+        source = 'a {.comment-start id="1" {.comment-end id="2"} b {.comment-start id="2"} c'
+        repaired, added = repair(source)
+        self.assertEqual(added, 0)
+        self.assertEqual(repaired, source)
+
     def test_marker_validation_rejects_one_sided_wrapper(self) -> None:
         validate_markers = self.converter_mod["validate_comment_marker_integrity"]
         source = (
@@ -459,3 +528,141 @@ class TestMarkdownAttrTransforms(unittest.TestCase):
         self.assertIn("cycle", message)
         self.assertIn("c1", message)
         self.assertIn("c2", message)
+
+    def test_reply_anchor_restore_counts_each_reply_per_story(self) -> None:
+        ensure_thread_reply_anchors = self.converter_mod["ensure_thread_reply_anchors"]
+        docx_dir = Path(tempfile.mkdtemp(prefix="reply-anchors-"))
+        (docx_dir / "word").mkdir()
+        w = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+        (docx_dir / "word" / "document.xml").write_text(
+            f'<w:document xmlns:w="{w}"><w:body><w:p>'
+            '<w:commentRangeStart w:id="1"/><w:r><w:t>Anchor</w:t></w:r><w:commentRangeEnd w:id="1"/>'
+            '<w:r><w:commentReference w:id="1"/></w:r>'
+            "</w:p></w:body></w:document>",
+            encoding="utf-8",
+        )
+
+        # Two replies restored in one story count twice, although the story is written once.
+        changed = ensure_thread_reply_anchors(docx_dir, ["1", "2", "3"], {"2": "1", "3": "1"})
+
+        self.assertEqual(changed, 2)
+        document_xml = (docx_dir / "word" / "document.xml").read_text(encoding="utf-8")
+        for reply_id in ("2", "3"):
+            self.assertIn(f'commentReference w:id="{reply_id}"', document_xml)
+
+    def test_same_format_output_is_copied_without_pandoc(self) -> None:
+        copy_if_same_format = self.converter_mod["copy_if_same_format"]
+        work_dir = Path(tempfile.mkdtemp(prefix="same-format-"))
+        in_md = work_dir / "input.md"
+        in_md.write_text("Already markdown.\n", encoding="utf-8")
+
+        with mock.patch("subprocess.run") as run, mock.patch("subprocess.check_output") as check_output:
+            self.assertTrue(copy_if_same_format(in_md, work_dir / "copy.markdown"))
+            self.assertFalse(copy_if_same_format(in_md, work_dir / "out.docx"))
+
+        run.assert_not_called()
+        check_output.assert_not_called()
+        self.assertEqual((work_dir / "copy.markdown").read_text(encoding="utf-8"), "Already markdown.\n")
+        self.assertFalse((work_dir / "out.docx").exists())
+
+    def test_same_format_copy_bypasses_conversion_cache(self) -> None:
+        run_conversion = self.converter_mod["run_conversion"]
+        work_dir = Path(tempfile.mkdtemp(prefix="same-format-cache-"))
+        in_docx = work_dir / "input.docx"
+        shutil.copyfile(FIXTURE_DOCX, in_docx)
+        cache_dir = work_dir / "cache"
+
+        with mock.patch.dict(os.environ, {"DMC_CACHE_DIR": str(cache_dir)}), mock.patch(
+            "dmc.converter.check_prerequisites", return_value=(3, 1, 0)
+        ):
+            run_conversion("auto", in_docx, work_dir / "copy.docx", [], use_cache=True)
+
+        self.assertEqual((work_dir / "copy.docx").read_bytes(), in_docx.read_bytes())
+        self.assertFalse(cache_dir.exists())
+
+    def test_explicit_mode_converts_and_empty_docx_fails(self) -> None:
+        run_conversion = self.converter_mod["run_conversion"]
+        convert_docx_to_md = self.converter_mod["convert_docx_to_md"]
+        work_dir = Path(tempfile.mkdtemp(prefix="explicit-mode-"))
+        in_md = work_dir / "input.md"
+        in_md.write_text("Convert me.\n", encoding="utf-8")
+
+        with mock.patch("dmc.converter.convert_md_to_docx") as convert:
+            run_conversion("md2docx", in_md, work_dir / "out.md", [])
+        convert.assert_called_once()
+
+        empty_docx = work_dir / "empty.docx"
+        empty_docx.write_bytes(b"")
+        with self.assertRaisesRegex(ValueError, "0 bytes"):
+            convert_docx_to_md(empty_docx, work_dir / "empty.md", [])
+        self.assertFalse((work_dir / "empty.md").exists())
+
+    def test_pack_docx_stores_precompressed_media(self) -> None:
+        pack_docx = self.converter_mod["pack_docx"]
+        work_dir = Path(tempfile.mkdtemp(prefix="pack-stored-"))
+        src_dir = work_dir / "src"
+        (src_dir / "word" / "media").mkdir(parents=True)
+        (src_dir / "word" / "document.xml").write_text("<w:document/>", encoding="utf-8")
+        (src_dir / "word" / "media" / "image1.PNG").write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64)
+        out_docx = work_dir / "out.docx"
+
+        pack_docx(src_dir, out_docx)
+
+        with zipfile.ZipFile(out_docx) as zf:
+            self.assertEqual(zf.getinfo("word/document.xml").compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(zf.getinfo("word/media/image1.PNG").compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(zf.read("word/document.xml"), b"<w:document/>")
+
+    def test_pack_docx_copies_unextracted_parts_from_base(self) -> None:
+        extract_docx = self.converter_mod["extract_docx"]
+        pack_docx = self.converter_mod["pack_docx"]
+        work_dir = Path(tempfile.mkdtemp(prefix="pack-passthrough-"))
+        unpacked = work_dir / "unpacked"
+        out_docx = work_dir / "out.docx"
+
+        passthrough = extract_docx(FIXTURE_DOCX, unpacked, member_filter=self.converter_mod["is_docx_xml_part"])
+        self.assertTrue(passthrough)
+        for name in passthrough:
+            self.assertFalse((unpacked / name).exists(), f"{name} should stay packed")
+
+        pack_docx(unpacked, out_docx, base_docx=FIXTURE_DOCX, passthrough_names=passthrough)
+
+        with zipfile.ZipFile(FIXTURE_DOCX) as base, zipfile.ZipFile(out_docx) as zf:
+            self.assertEqual(zf.namelist(), base.namelist())
+            for name in base.namelist():
+                self.assertEqual(zf.read(name), base.read(name), name)
+
+    def test_line_col_for_offset_matches_with_newline_index(self) -> None:
+        line_col_for_offset = self.converter_mod["line_col_for_offset"]
+        newline_offsets = self.converter_mod["newline_offsets"]
+        text = "first\n\nthird line\r\nfourth"
+        newline_index = newline_offsets(text)
+
+        self.assertEqual(newline_index, [5, 6, 18])
+        for offset in range(-1, len(text) + 2):
+            with self.subTest(offset=offset):
+                self.assertEqual(
+                    line_col_for_offset(text, offset, newline_index),
+                    line_col_for_offset(text, offset),
+                )
+        self.assertEqual(line_col_for_offset(text, text.index("fourth"), newline_index), (4, 1))
+
+    def test_text_to_pandoc_inlines_returns_fresh_nodes(self) -> None:
+        text_to_pandoc_inlines = self.converter_mod["text_to_pandoc_inlines"]
+        first = text_to_pandoc_inlines(" a b\nc ")
+        self.assertEqual(
+            first,
+            [
+                {"t": "Space"},
+                {"t": "Str", "c": "a"},
+                {"t": "Space"},
+                {"t": "Str", "c": "b"},
+                {"t": "SoftBreak"},
+                {"t": "Str", "c": "c"},
+                {"t": "Space"},
+            ],
+        )
+        first[1]["c"] = "mutated"
+        second = text_to_pandoc_inlines(" a b\nc ")
+        self.assertEqual(second[1], {"t": "Str", "c": "a"})
+        self.assertIsNot(first[0], second[0])